@@ -0,0 +1,143 @@
+import re
+import multiprocessing as mp
+from array import array
+from collections import OrderedDict
+
+# One precompiled pass over lowercased text. Runs of word characters are exactly
+# what is left after clean.py strips punctuation, and the only such words NLTK's
+# Treebank tokenizer still splits are the MacIntyre contractions, so
+# "cannot" -> "can" "not", "gonna" -> "gon" "na", and so on.
+TOKEN_RE = re.compile(
+    r"\b(?:can(?=not\b)|gim(?=me\b)|gon(?=na\b)|got(?=ta\b)|lem(?=me\b)|wan(?=na\b))"
+    r"|\w+"
+)
+
+MIN_TOKEN_LEN = 2
+
+# NLTK's English stopword list, bundled so analysis needs no corpus download
+# and importing this module does no I/O.
+STOP_WORDS = frozenset((
+    "a", "about", "above", "after", "again", "against", "ain", "all", "am", "an",
+    "and", "any", "are", "aren", "aren't", "as", "at", "be", "because", "been",
+    "before", "being", "below", "between", "both", "but", "by", "can", "couldn", "couldn't",
+    "d", "did", "didn", "didn't", "do", "does", "doesn", "doesn't", "doing", "don",
+    "don't", "down", "during", "each", "few", "for", "from", "further", "had", "hadn",
+    "hadn't", "has", "hasn", "hasn't", "have", "haven", "haven't", "having", "he", "he'd",
+    "he'll", "her", "here", "hers", "herself", "he's", "him", "himself", "his", "how",
+    "i", "i'd", "if", "i'll", "i'm", "in", "into", "is", "isn", "isn't",
+    "it", "it'd", "it'll", "it's", "its", "itself", "i've", "just", "ll", "m",
+    "ma", "me", "mightn", "mightn't", "more", "most", "mustn", "mustn't", "my", "myself",
+    "needn", "needn't", "no", "nor", "not", "now", "o", "of", "off", "on",
+    "once", "only", "or", "other", "our", "ours", "ourselves", "out", "over", "own",
+    "re", "s", "same", "shan", "shan't", "she", "she'd", "she'll", "she's", "should",
+    "shouldn", "shouldn't", "should've", "so", "some", "such", "t", "than", "that", "that'll",
+    "the", "their", "theirs", "them", "themselves", "then", "there", "these", "they", "they'd",
+    "they'll", "they're", "they've", "this", "those", "through", "to", "too", "under", "until",
+    "up", "ve", "very", "was", "wasn", "wasn't", "we", "we'd", "we'll", "we're",
+    "were", "weren", "weren't", "we've", "what", "when", "where", "which", "while", "who",
+    "whom", "why", "will", "with", "won", "won't", "wouldn", "wouldn't", "y", "you",
+    "you'd", "you'll", "your", "you're", "yours", "yourself", "yourselves", "you've",
+))
+
+def tokenize(text):
+    """
+    Lowercases and splits text into word tokens (no stopword filtering).
+    """
+    return TOKEN_RE.findall(text.lower())
+
+def analyze(text, stop_words=STOP_WORDS):
+    """
+    Tokenizes text and drops stopwords and tokens shorter than MIN_TOKEN_LEN.
+    Produces the same tokens as the original NLTK pipeline in clean.py.
+    """
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) >= MIN_TOKEN_LEN and t not in stop_words]
+
+class TermDictionary:
+    """
+    Interns terms as dense integer ids (in first-seen order).
+    """
+    def __init__(self):
+        self.ids = {}
+        self.terms = []
+
+    def __len__(self):
+        return len(self.terms)
+
+    def intern(self, term):
+        tid = self.ids.get(term)
+        if tid is None:
+            tid = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return tid
+
+    def decode(self, term_ids):
+        terms = self.terms
+        return [terms[i] for i in term_ids]
+
+def encode_local(text, stop_words=STOP_WORDS):
+    """
+    Analyzes text into (unique_terms, local_ids): each distinct term once, plus an
+    array('I') of indices into that list. Much cheaper to ship between processes
+    than a list of token strings.
+    """
+    local = {}
+    ids = array("I", [local.setdefault(t, len(local)) for t in analyze(text, stop_words)])
+    return list(local), ids
+
+def analyze_batch(texts, workers=1, term_dict=None, chunksize=8):
+    """
+    Analyzes an iterable of texts, yielding one result per text, in order.
+    Without a term_dict each result is a list of token strings; with one, it is an
+    array('I') of term ids interned in term_dict.
+    With workers > 1 the analysis is fanned out over a process pool.
+    """
+    func = analyze if term_dict is None else encode_local
+    if workers > 1:
+        pool = mp.Pool(workers)
+        results = pool.imap(func, texts, chunksize)
+    else:
+        pool = None
+        results = map(func, texts)
+
+    try:
+        for result in results:
+            if term_dict is None:
+                yield result
+            else:
+                unique_terms, local_ids = result
+                global_ids = [term_dict.intern(t) for t in unique_terms]
+                yield array("I", [global_ids[i] for i in local_ids])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+class AnalyzerCache:
+    """
+    Bounded LRU cache of analyzed query strings. Results are tuples so callers
+    cannot modify a cached entry.
+    """
+    def __init__(self, maxsize=4096, stop_words=STOP_WORDS):
+        self.maxsize = maxsize
+        self.stop_words = stop_words
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def analyze(self, text):
+        tokens = self.entries.get(text)
+        if tokens is not None:
+            self.hits += 1
+            self.entries.move_to_end(text)
+            return tokens
+        self.misses += 1
+        tokens = tuple(analyze(text, self.stop_words))
+        self.entries[text] = tokens
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return tokens
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
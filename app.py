@@ -1,17 +1,26 @@
 import sys
 import argparse
-from cli import main as run_cli
-from ui_app import app as flask_app
+from impact import RANKINGS
 
 def main():
     parser = argparse.ArgumentParser(description="LHC Judgment Search System")
     parser.add_argument("--mode", choices=["cli", "ui"], default="cli", help="Run mode: cli or ui")
     parser.add_argument("--port", type=int, default=5000, help="Port for UI mode")
+    parser.add_argument("--in-memory", action="store_true", help="Load all postings into RAM at startup instead of reading them from disk on demand")
+    parser.add_argument("--ranking", choices=RANKINGS, default="tfidf", help="Scorer: exact TF-IDF or BM25, or their 8-bit impact versions (-q8)")
+    parser.add_argument("--tiered", action="store_true", help="Rank the matches in the champion lists first (faster, approximate)")
     args = parser.parse_args()
 
+    # Import only the front end we run, so CLI startup doesn't pay for Flask
     if args.mode == "cli":
-        run_cli()
+        from cli import main as run_cli
+        run_cli(args.in_memory, args.ranking, args.tiered)
     else:
+        import ui_app
+        from ui_app import app as flask_app
+        ui_app.INDEX_OPTIONS["in_memory"] = args.in_memory
+        ui_app.INDEX_OPTIONS["ranking"] = args.ranking
+        ui_app.INDEX_OPTIONS["tiered"] = args.tiered
         flask_app.run(debug=True, port=args.port)
 
 if __name__ == "__main__":
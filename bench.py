@@ -0,0 +1,246 @@
+import os
+import glob
+import time
+import argparse
+
+EXTRACTED_DIR = r"data/extracted"
+
+def load_texts(limit=None):
+    texts = []
+    for txt_file in sorted(glob.glob(os.path.join(EXTRACTED_DIR, "*.txt")))[:limit]:
+        with open(txt_file, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    return texts
+
+def report(name, n_tokens, elapsed):
+    print(f"{name:>8}: {n_tokens:,} tokens in {elapsed:.2f}s ({n_tokens / elapsed:,.0f} tokens/s)")
+
+def bench_analyzer(args):
+    from clean import clean_text, clean_text_nltk
+
+    texts = load_texts(args.limit)
+    print(f"Analyzing {len(texts)} documents")
+    for name, fn in (("nltk", clean_text_nltk), ("regex", clean_text)):
+        start = time.perf_counter()
+        n_tokens = sum(len(fn(text)) for text in texts)
+        report(name, n_tokens, time.perf_counter() - start)
+
+def bench_memory(args):
+    import tracemalloc
+    from postings import IndexReader, MemoryIndex
+    from generations import resolve_index_dir
+
+    # The pre-binary in-memory layout: term -> {doc_number: [positions]}
+    index_dir = resolve_index_dir(args.index_dir)
+    tracemalloc.start()
+    reader = IndexReader(index_dir)
+    index = {}
+    for term in reader.terms:
+        doc_nums, _ = reader.postings(term)
+        index[term] = {d: reader.positions(term, d) for d in doc_nums}
+        reader.cache.clear()
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    reader.close()
+    del index
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    memory = MemoryIndex(index_dir)
+    elapsed = time.perf_counter() - start
+    array_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    n_postings = len(memory.docs)
+    pos_bytes = len(memory.reader.pos_mm)
+    memory.close()
+    print(f"{len(memory.terms):,} terms, {n_postings:,} postings")
+    print(f"  dict of lists: {dict_bytes / 2**20:,.1f} MB")
+    print(f"  MemoryIndex:   {array_bytes / 2**20:,.1f} MB ({memory.nbytes() / 2**20:,.1f} MB of postings arrays), loaded in {elapsed:.2f}s")
+    print(f"                 positions stay memory-mapped ({pos_bytes / 2**20:,.1f} MB index.pos)")
+
+def bench_impact(args):
+    import random
+    from tfidf import TFIDFRanker
+    from impact import ImpactRanker
+
+    ranker = TFIDFRanker(args.index_dir)
+    index = ranker.index
+    # Random OR queries of 1-4 terms that occur in at least two documents
+    rng = random.Random(args.seed)
+    terms = [t for t in index.terms if index.doc_freq(t) >= 2]
+    queries = [rng.sample(terms, rng.randint(1, 4)) for _ in range(args.queries)]
+    candidates = []
+    for query in queries:
+        docs = set()
+        for t in query:
+            docs.update(index.postings(t)[0])
+        candidates.append(docs)
+    print(f"{len(queries)} queries, {sum(map(len, candidates)) / len(queries):,.0f} candidates on average")
+
+    def run(scorer, use_cosine):
+        start = time.perf_counter()
+        ranked = [[d for d, _ in scorer.score(q, docs, use_cosine)[:10]] for q, docs in zip(queries, candidates)]
+        return ranked, (time.perf_counter() - start) / len(queries) * 1000
+
+    comparisons = (("tfidf", False, ranker), ("tfidf", True, ranker),
+                   ("bm25", False, ImpactRanker(ranker, "bm25", quantized=False)))
+    for scheme, use_cosine, exact in comparisons:
+        quantized = ImpactRanker(ranker, scheme)
+        exact_top, exact_ms = run(exact, use_cosine)
+        q8_top, q8_ms = run(quantized, use_cosine)
+        overlap = sum(len(set(a) & set(b)) / len(a) for a, b in zip(exact_top, q8_top) if a) / len(queries)
+        same = sum(a == b for a, b in zip(exact_top, q8_top)) / len(queries)
+        name = scheme + (" cosine" if use_cosine else "")
+        print(f"{name:>12}: exact {exact_ms:.2f} ms/query, 8-bit {q8_ms:.2f} ms/query, "
+              f"overlap@10 {overlap:.3f}, identical top 10 {same:.1%}")
+
+def bench_boolean(args):
+    import random
+    import numpy as np
+    from postings import open_index
+    from intersect import intersect_sorted
+    from generations import resolve_index_dir
+
+    index_dir = resolve_index_dir(args.index_dir)
+    reader, _ = open_index(index_dir)
+    memory, _ = open_index(index_dir, in_memory=True)
+    # Skewed AND queries: a rare term with a common one
+    rng = random.Random(args.seed)
+    rare = [t for t in reader.terms if 1 <= reader.doc_freq(t) <= args.rare_df]
+    common = [t for t in reader.terms if reader.doc_freq(t) >= args.common_df]
+    if not rare or not common:
+        print("No term pairs with these document frequencies")
+        return
+    pairs = [(rng.choice(rare), rng.choice(common)) for _ in range(args.queries)]
+    print(f"{len(pairs)} queries: df <= {args.rare_df} AND df >= {args.common_df} ({len(rare)} rare, {len(common)} common terms)")
+
+    def sets(index, a, b):
+        # The set-based engine: both posting lists decoded and hashed
+        return set(index.postings(a)[0]) & set(index.postings(b)[0])
+
+    def arrays(index, a, b):
+        return intersect_sorted(index.doc_array(a), index.doc_array(b))
+
+    def skips(index, a, b):
+        # The rare side decoded in full, the common one looked up block by block
+        return index.intersect(b, index.doc_array(a))
+
+    for name, index, fn in (("sets", reader, sets), ("arrays", reader, arrays), ("skips", reader, skips),
+                            ("sets", memory, sets), ("arrays", memory, arrays)):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            found = sum(len(fn(index, a, b)) for a, b in pairs)
+        elapsed = (time.perf_counter() - start) / (args.repeat * len(pairs)) * 1e6
+        label = f"{name} ({'MemoryIndex' if index is memory else 'IndexReader'})"
+        print(f"{label:>26}: {elapsed:7.1f} us/query ({found} matches)")
+    reader.close()
+    memory.close()
+
+def write_synthetic(extracted_dir, n_docs, vocab_size=50000, mean_len=150, seed=0):
+    """
+    Writes n_docs judgment-sized text files of pseudo-words with Zipf-distributed frequencies.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    vocab = ["".join(rng.choice(letters, size=rng.integers(4, 11))) for _ in range(vocab_size)]
+    weights = 1.0 / np.arange(1, vocab_size + 1) ** 1.1
+    weights /= weights.sum()
+    os.makedirs(extracted_dir, exist_ok=True)
+    for i in range(n_docs):
+        words = rng.choice(vocab_size, size=rng.integers(mean_len // 2, mean_len * 3 // 2 + 1), p=weights)
+        with open(os.path.join(extracted_dir, f"synthetic-{i:07d}.txt"), "w", encoding="utf-8") as f:
+            f.write(" ".join(vocab[w] for w in words))
+
+def _build(mode, extracted_dir, index_dir, memory_mb, queue):
+    import build
+
+    build.EXTRACTED_DIR = extracted_dir
+    build.INDEX_DIR = index_dir
+    start = time.perf_counter()
+    if mode == "external":
+        build.build_index_external(memory_mb=memory_mb)
+    elif mode == "spimi":
+        build.build_index_spimi(memory_mb=memory_mb)
+    else:
+        build.build_index()
+    elapsed = time.perf_counter() - start
+    try:
+        import resource
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        peak_mb = float("nan")
+    queue.put((elapsed, peak_mb))
+
+def bench_build(args):
+    import shutil
+    import tempfile
+    import multiprocessing as mp
+
+    work_dir = tempfile.mkdtemp(prefix="bench-build-")
+    try:
+        extracted_dir = EXTRACTED_DIR
+        if args.synthetic:
+            extracted_dir = os.path.join(work_dir, "extracted")
+            print(f"Writing {args.synthetic:,} synthetic documents...")
+            write_synthetic(extracted_dir, args.synthetic)
+
+        # Each build runs in its own process, so peak RSS is measured per builder
+        results = {}
+        for mode in args.modes.split(","):
+            index_dir = os.path.join(work_dir, "index-" + mode)
+            queue = mp.Queue()
+            proc = mp.Process(target=_build, args=(mode, extracted_dir, index_dir, args.memory_mb, queue))
+            proc.start()
+            proc.join()
+            results[mode] = queue.get() if proc.exitcode == 0 else None
+
+        for mode, result in results.items():
+            if result is None:
+                print(f"{mode:>8}: failed")
+            else:
+                elapsed, peak_mb = result
+                print(f"{mode:>8}: {elapsed:,.1f}s, peak RSS {peak_mb:,.0f} MB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the search engine")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("analyzer", help="Tokens per second of the NLTK and regex analyzers")
+    p.add_argument("--limit", type=int, default=None, help="Only use the first N documents")
+    p.set_defaults(func=bench_analyzer)
+
+    p = sub.add_parser("build", help="Time and peak memory of the index builders")
+    p.add_argument("--synthetic", type=int, default=0, help="Build N synthetic documents instead of data/extracted")
+    p.add_argument("--modes", default="memory,external", help="Comma separated builders: memory, spimi, external")
+    p.add_argument("--memory-mb", type=int, default=256, help="Memory budget for spimi and external")
+    p.set_defaults(func=bench_build)
+
+    p = sub.add_parser("impact", help="Speed and top-10 agreement of 8-bit impact postings against the exact scorers")
+    p.add_argument("--index-dir", default=r"data/index")
+    p.add_argument("--queries", type=int, default=500, help="Number of random queries")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_impact)
+
+    p = sub.add_parser("boolean", help="Skewed AND queries: set, sorted-array and skip-pointer intersection")
+    p.add_argument("--index-dir", default=r"data/index")
+    p.add_argument("--queries", type=int, default=500, help="Number of random rare AND common queries")
+    p.add_argument("--rare-df", type=int, default=5)
+    p.add_argument("--common-df", type=int, default=500)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_boolean)
+
+    p = sub.add_parser("memory", help="RAM held by the postings as nested dicts and as a MemoryIndex")
+    p.add_argument("--index-dir", default=r"data/index")
+    p.set_defaults(func=bench_memory)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Boolean query parser. Input is the token list built by QueryProcessor.process_query:
+#   ("OP", "AND" | "OR" | "NOT"), ("LPAREN", "("), ("RPAREN", ")") and atoms
+#   ("TERM", term), ("PHRASE", tokens), ("WILDCARD", pattern)
+# Output is an AST of atoms and
+#   ("AND", [children]), ("OR", [children]), ("NOT", child)
+# Precedence is NOT > AND > OR; adjacent operands are an implicit AND, so
+# "murder NOT bail" is murder AND (NOT bail). Parsing is lenient, like the old
+# left-to-right evaluation: dangling operators are dropped, a missing ")" is
+# implied at the end and a stray ")" is ignored. Returns None for an empty query.
+ATOMS = ("TERM", "PHRASE", "WILDCARD")
+
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def starts_operand(self):
+        kind, value = self.peek()
+        return kind in ATOMS or kind == "LPAREN" or (kind, value) == ("OP", "NOT")
+
+    def parse(self):
+        node = None
+        while self.i < len(self.tokens):
+            expr = self.parse_or()
+            if expr is not None:
+                node = expr if node is None else make("AND", [node, expr])
+            elif self.i < len(self.tokens):
+                self.i += 1 # stray ")" or operator without operands
+        return node
+
+    def parse_or(self):
+        children = []
+        while True:
+            node = self.parse_and()
+            if node is not None:
+                children.append(node)
+            if self.peek() != ("OP", "OR"):
+                break
+            self.i += 1
+        return make("OR", children)
+
+    def parse_and(self):
+        children = []
+        while True:
+            if self.peek() == ("OP", "AND"):
+                self.i += 1
+                continue
+            if not self.starts_operand():
+                break
+            node = self.parse_not()
+            if node is not None:
+                children.append(node)
+        return make("AND", children)
+
+    def parse_not(self):
+        if self.peek() == ("OP", "NOT"):
+            self.i += 1
+            if not self.starts_operand():
+                return None
+            node = self.parse_not()
+            if node is None:
+                return None
+            # NOT NOT x is x
+            return node[1] if node[0] == "NOT" else ("NOT", node)
+        kind, value = self.peek()
+        self.i += 1
+        if kind != "LPAREN":
+            return (kind, value)
+        node = self.parse_or()
+        if self.peek()[0] == "RPAREN":
+            self.i += 1
+        return node
+
+def make(op, children):
+    """
+    AND / OR node over children, flattening nested nodes of the same operator.
+    """
+    flat = []
+    for child in children:
+        flat.extend(child[1] if child[0] == op else [child])
+    if not flat:
+        return None
+    return flat[0] if len(flat) == 1 else (op, flat)
+
+def parse_query(tokens):
+    return Parser(tokens).parse()
@@ -1,74 +1,307 @@
 import os
-import glob
 import json
-import gzip
+import shutil
+import argparse
+import tempfile
+from array import array
+import numpy as np
 from tqdm import tqdm
-from clean import clean_text
+from analyzer import TermDictionary, analyze_batch
+from pages import pages_path_for, read_page_offsets, split_pages
+from textstore import PackReader, pack_texts
+from spimi import merge_runs, run_workers
+from extsort import RunWriter, budget_records, merge_sorted_runs, reduce_runs, sort_run
+from segments import ARTIFACTS, OPTIONAL_ARTIFACTS, clear_segments, update_index
+from generations import collect_garbage, generation_dir, new_generation, publish_generation
+from impact import build_impacts
+from champions import CHAMPION_SIZE, build_champions
+from tfidf import build_weights
+from postings import IndexWriter
+from docstore import CorpusWriter
 
 EXTRACTED_DIR = r"data/extracted"
 INDEX_DIR = r"data/index"
 
-def build_index():
+def iter_segments(texts, docs):
+    """
+    Yields the text to analyze for each (doc_id, page_offsets) in docs:
+    one segment per page when page offsets are known, else the whole text.
+    """
+    for doc_id, offsets in docs:
+        yield from split_pages(texts.get(doc_id), offsets)
+
+def publish(generation, impacts=False, champions=CHAMPION_SIZE):
+    """
+    Makes a finished build live, then drops what it replaces: incrementally built
+    segments, artifacts of older builds written straight into the index dir, and
+    generations no server should still be reading. The champion lists of size
+    champions (and with impacts the quantized impact postings) are written first,
+    after the weight matrix the ranker memory-maps.
+    The top-level vocab.txt is kept, refreshed from the new generation.
+    """
+    print("Writing weight matrix...")
+    build_weights(generation_dir(INDEX_DIR, generation))
+    print("Writing champion lists...")
+    build_champions(generation_dir(INDEX_DIR, generation), champions)
+    if impacts:
+        print("Writing impact postings...")
+        build_impacts(generation_dir(INDEX_DIR, generation))
+    publish_generation(INDEX_DIR, generation)
+    clear_segments(INDEX_DIR)
+    shutil.copy(os.path.join(generation_dir(INDEX_DIR, generation), "vocab.txt"), os.path.join(INDEX_DIR, "vocab.txt"))
+    for artifact in ARTIFACTS + OPTIONAL_ARTIFACTS + ("positional_index.json.gz",):
+        path = os.path.join(INDEX_DIR, artifact)
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass # still open in a server on a platform that locks open files
+    collect_garbage(INDEX_DIR)
+    print(f"Published generation {generation}")
+
+def build_index(workers=1, impacts=False, champions=CHAMPION_SIZE):
     if not os.path.exists(INDEX_DIR):
         os.makedirs(INDEX_DIR)
+    # Written into a new generation; running servers keep reading the current one
+    generation, out_dir = new_generation(INDEX_DIR)
 
-    txt_files = glob.glob(os.path.join(EXTRACTED_DIR, "*.txt"))
-    
-    corpus_path = os.path.join(INDEX_DIR, "corpus.jsonl")
-    preprocess_path = os.path.join(INDEX_DIR, "preprocess.json")
-    index_path = os.path.join(INDEX_DIR, "positional_index.json.gz")
-    vocab_path = os.path.join(INDEX_DIR, "vocab.txt")
+    preprocess_path = os.path.join(out_dir, "preprocess.json")
+    vocab_path = os.path.join(out_dir, "vocab.txt")
+    pages_path = os.path.join(out_dir, "pages.json")
+    texts_path = os.path.join(out_dir, "texts.pack")
 
+    term_dict = TermDictionary()
     preprocess_data = {}
     positional_index = {}
-    vocab = set()
+    page_starts = {}
+
+    print("Packing extracted text...")
+    txt_paths = pack_texts(EXTRACTED_DIR, texts_path)
 
     print("Building corpus and processing text...")
-    with open(corpus_path, "w", encoding="utf-8") as f_corpus:
-        for txt_file in tqdm(txt_files):
-            filename = os.path.basename(txt_file)
-            doc_id = os.path.splitext(filename)[0]
-            
-            with open(txt_file, "r", encoding="utf-8") as f:
-                text = f.read()
-            
-            # Save to corpus
+    with CorpusWriter(out_dir) as corpus, PackReader(texts_path) as texts:
+        docs = [(doc_id, read_page_offsets(pages_path_for(txt_paths[doc_id]))) for doc_id in texts.ids]
+        results = analyze_batch(iter_segments(texts, docs), workers=workers, term_dict=term_dict)
+
+        for doc_num, (doc_id, offsets) in enumerate(tqdm(docs)):
+            # Save to corpus (full text lives in texts.pack)
             doc_obj = {
                 "id": doc_id,
-                "path": txt_file,
-                "text": text # Storing full text for retrieval display
+                "path": txt_paths[doc_id],
             }
-            f_corpus.write(json.dumps(doc_obj) + "\n")
+            corpus.add(doc_obj)
 
-            # Preprocess
-            tokens = clean_text(text)
+            # Preprocess (term ids; pages are analyzed separately to record where each starts)
+            if offsets:
+                tokens = array("I")
+                starts = []
+                for _ in offsets:
+                    starts.append(len(tokens))
+                    tokens.extend(next(results))
+                page_starts[doc_id] = starts
+            else:
+                tokens = next(results)
             preprocess_data[doc_id] = tokens
             
             # Update Index
             for pos, term in enumerate(tokens):
-                vocab.add(term)
                 if term not in positional_index:
                     positional_index[term] = {}
-                if doc_id not in positional_index[term]:
-                    positional_index[term][doc_id] = []
-                positional_index[term][doc_id].append(pos)
+                if doc_num not in positional_index[term]:
+                    positional_index[term][doc_num] = []
+                positional_index[term][doc_num].append(pos)
 
     print("Saving artifacts...")
+    terms = term_dict.terms
     
     # Save preprocess.json
     with open(preprocess_path, "w", encoding="utf-8") as f:
-        json.dump(preprocess_data, f)
+        f.write("{")
+        for i, (doc_id, tokens) in enumerate(preprocess_data.items()):
+            if i:
+                f.write(", ")
+            f.write(json.dumps(doc_id) + ": " + json.dumps(term_dict.decode(tokens)))
+        f.write("}")
         
-    # Save positional index (compressed)
-    with gzip.open(index_path, "wt", encoding="utf-8") as f:
-        json.dump(positional_index, f)
+    # Save positional index (binary, in term order)
+    with IndexWriter(out_dir, [doc_id for doc_id, _ in docs]) as writer:
+        for tid in sorted(positional_index, key=terms.__getitem__):
+            writer.add(terms[tid], positional_index[tid].items())
+
+    # Save page start token positions (for opening PDFs at the first hit)
+    with open(pages_path, "w", encoding="utf-8") as f:
+        json.dump(page_starts, f)
 
     # Save vocab
     with open(vocab_path, "w", encoding="utf-8") as f:
-        for term in sorted(list(vocab)):
+        for term in sorted(terms):
             f.write(term + "\n")
 
+    publish(generation, impacts, champions)
+    print("Indexing complete.")
+
+def build_index_spimi(workers=1, memory_mb=512, impacts=False, champions=CHAMPION_SIZE):
+    """
+    SPIMI-style build: workers index slices of the corpus and flush sorted runs
+    to disk whenever their postings reach memory_mb / workers; the runs are then
+    combined with a streaming k-way merge. Peak memory is set by memory_mb
+    (plus the largest single posting list), not by corpus size.
+    """
+    if not os.path.exists(INDEX_DIR):
+        os.makedirs(INDEX_DIR)
+    # Written into a new generation; running servers keep reading the current one
+    generation, out_dir = new_generation(INDEX_DIR)
+
+    preprocess_path = os.path.join(out_dir, "preprocess.json")
+    vocab_path = os.path.join(out_dir, "vocab.txt")
+    pages_path = os.path.join(out_dir, "pages.json")
+    texts_path = os.path.join(out_dir, "texts.pack")
+
+    print("Packing extracted text...")
+    txt_paths = pack_texts(EXTRACTED_DIR, texts_path)
+
+    with PackReader(texts_path) as texts:
+        doc_ids = list(texts.ids)
+    docs = [(i, doc_id, read_page_offsets(pages_path_for(txt_paths[doc_id]))) for i, doc_id in enumerate(doc_ids)]
+
+    with CorpusWriter(out_dir) as corpus:
+        for doc_id in doc_ids:
+            corpus.add({"id": doc_id, "path": txt_paths[doc_id]})
+
+    run_dir = tempfile.mkdtemp(prefix="spimi-", dir=out_dir)
+    try:
+        print(f"Indexing {len(docs)} documents with {workers} workers ({memory_mb} MB budget)...")
+        results = run_workers(texts_path, docs, run_dir, workers, memory_mb)
+        run_paths = [path for runs, _, _ in results for path in runs]
+
+        page_starts = {}
+        for _, starts, _ in results:
+            page_starts.update(starts)
+        with open(pages_path, "w", encoding="utf-8") as f:
+            json.dump(page_starts, f)
+
+        print("Saving artifacts...")
+        # Stitch the workers' preprocess parts into preprocess.json
+        with open(preprocess_path, "w", encoding="utf-8") as f:
+            f.write("{")
+            first = True
+            for _, _, part_path in results:
+                with open(part_path, "r", encoding="utf-8") as f_part:
+                    for line in f_part:
+                        if not first:
+                            f.write(", ")
+                        f.write(line.rstrip("\n"))
+                        first = False
+            f.write("}")
+
+        print(f"Merging {len(run_paths)} runs...")
+        with IndexWriter(out_dir, doc_ids) as writer, open(vocab_path, "w", encoding="utf-8") as f_vocab:
+            for term, postings in merge_runs(run_paths):
+                writer.add(term, postings)
+                f_vocab.write(term + "\n")
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    publish(generation, impacts, champions)
+    print("Indexing complete.")
+
+def build_index_external(workers=1, memory_mb=256, impacts=False, champions=CHAMPION_SIZE):
+    """
+    External-sort build for corpora larger than RAM. Each token is written as a
+    fixed-size (term, doc, position) record to binary run files; the runs are
+    sorted by term once the vocabulary is known and merged into the final postings
+    in one streaming pass. Memory is bounded by memory_mb plus per-document and
+    per-term tables (doc ids, page starts, statistics, vocabulary), whatever the
+    number of tokens.
+    """
+    if not os.path.exists(INDEX_DIR):
+        os.makedirs(INDEX_DIR)
+    # Written into a new generation; running servers keep reading the current one
+    generation, out_dir = new_generation(INDEX_DIR)
+
+    preprocess_path = os.path.join(out_dir, "preprocess.json")
+    vocab_path = os.path.join(out_dir, "vocab.txt")
+    pages_path = os.path.join(out_dir, "pages.json")
+    texts_path = os.path.join(out_dir, "texts.pack")
+
+    print("Packing extracted text...")
+    txt_paths = pack_texts(EXTRACTED_DIR, texts_path)
+
+    run_records, block_records = budget_records(memory_mb)
+    run_dir = tempfile.mkdtemp(prefix="extsort-", dir=out_dir)
+    try:
+        term_dict = TermDictionary()
+        page_starts = {}
+        runs = RunWriter(run_dir, run_records)
+
+        print(f"Writing runs ({memory_mb} MB budget)...")
+        with CorpusWriter(out_dir) as corpus, PackReader(texts_path) as texts, \
+                open(preprocess_path, "w", encoding="utf-8") as f_pre:
+            docs = [(doc_id, read_page_offsets(pages_path_for(txt_paths[doc_id]))) for doc_id in texts.ids]
+            doc_ids = [doc_id for doc_id, _ in docs]
+            results = analyze_batch(iter_segments(texts, docs), workers=workers, term_dict=term_dict)
+
+            f_pre.write("{")
+            for doc_num, (doc_id, offsets) in enumerate(tqdm(docs)):
+                corpus.add({"id": doc_id, "path": txt_paths[doc_id]})
+                if offsets:
+                    tokens = array("I")
+                    starts = []
+                    for _ in offsets:
+                        starts.append(len(tokens))
+                        tokens.extend(next(results))
+                    page_starts[doc_id] = starts
+                else:
+                    tokens = next(results)
+                runs.add_doc(doc_num, tokens)
+                if doc_num:
+                    f_pre.write(", ")
+                f_pre.write(json.dumps(doc_id) + ": " + json.dumps(term_dict.decode(tokens)))
+            f_pre.write("}")
+        runs.flush()
+
+        with open(pages_path, "w", encoding="utf-8") as f:
+            json.dump(page_starts, f)
+
+        # Term ids are in first-seen order; the index needs sorted term order
+        terms = sorted(term_dict.terms)
+        ranks = np.empty(len(terms), dtype=np.uint32)
+        ranks[[term_dict.ids[t] for t in terms]] = np.arange(len(terms), dtype=np.uint32)
+
+        print(f"Sorting {len(runs.run_paths)} runs...")
+        for path in runs.run_paths:
+            sort_run(path, ranks)
+        run_paths = reduce_runs(runs.run_paths, run_dir, block_records)
+
+        print(f"Merging {len(run_paths)} runs...")
+        with IndexWriter(out_dir, doc_ids) as writer:
+            for rank, records in merge_sorted_runs(run_paths, block_records):
+                writer.add_occurrences(terms[rank], records[:, 1], records[:, 2])
+        with open(vocab_path, "w", encoding="utf-8") as f:
+            for term in terms:
+                f.write(term + "\n")
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    publish(generation, impacts, champions)
     print("Indexing complete.")
 
 if __name__ == "__main__":
-    build_index()
+    parser = argparse.ArgumentParser(description="Build the search index from extracted text")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to analyze documents")
+    parser.add_argument("--spimi", action="store_true", help="Bounded-memory build: flush sorted runs to disk and merge them")
+    parser.add_argument("--external", action="store_true", help="External-sort build: binary (term, doc, position) runs, sorted and merged on disk")
+    parser.add_argument("--memory-mb", type=int, default=None, help="Memory budget for postings (--spimi: across all workers, default 512; --external: default 256)")
+    parser.add_argument("--impacts", action="store_true", help="Also write 8-bit impact postings for the tfidf-q8 and bm25-q8 rankings")
+    parser.add_argument("--champions", type=int, default=CHAMPION_SIZE, help=f"Postings per term in the champion tier (default {CHAMPION_SIZE})")
+    parser.add_argument("--incremental", action="store_true", help="Only index new, changed and removed documents, as a new segment")
+    parser.add_argument("--merge", choices=["background", "now", "off"], default="background", help="When to compact segments (--incremental only)")
+    args = parser.parse_args()
+    if args.incremental:
+        update_index(EXTRACTED_DIR, INDEX_DIR, workers=args.workers, merge=args.merge)
+    elif args.external:
+        build_index_external(workers=args.workers, memory_mb=args.memory_mb or 256, impacts=args.impacts, champions=args.champions)
+    elif args.spimi:
+        build_index_spimi(workers=args.workers, memory_mb=args.memory_mb or 512, impacts=args.impacts, champions=args.champions)
+    else:
+        build_index(workers=args.workers, impacts=args.impacts, champions=args.champions)
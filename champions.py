@@ -0,0 +1,105 @@
+import os
+import json
+import numpy as np
+from tfidf import load_weights, weight_matrix
+from postings import open_index
+
+# Champion lists: the r highest-weighted postings of each term, a first tier that
+# ranked queries are scored on before falling back to the full postings.
+#   champions_<kind>.npy  doc numbers (<u4), r per term with df > r, in dictionary
+#                         order and by doc within a term
+#   champions.json        {"r": r}
+# Terms with df <= r need no list: their full postings are the champion tier.
+# Two orders are kept, for the two ways the ranker scores:
+#   tfidf   by w_td = (1 + log10 tf) * idf (dot product; also used for bm25)
+#   cosine  by w_td / |d|, the document's component in the normalized vector space
+CHAMPIONS_FILE = "champions.json"
+CHAMPION_KINDS = ("tfidf", "cosine")
+CHAMPION_SIZE = 64
+TIER_MIN = 10 # a query uses its tier only if it holds at least this many matches
+
+def champions_path(index_dir, kind):
+    return os.path.join(index_dir, f"champions_{kind}.npy")
+
+def champion_lists(weights, doc_norms, r, kind):
+    """
+    Champion doc numbers of every term with more than r postings, from the term x doc
+    weight matrix (see tfidf.weight_matrix). Ties go to the lower doc number.
+    """
+    dfs = np.diff(weights.indptr)
+    owner = np.repeat(np.arange(len(dfs)), dfs)
+    docs = weights.indices
+    key = weights.data
+    if kind == "cosine":
+        norms = np.asarray(doc_norms)[docs]
+        key = np.divide(key, norms, out=np.zeros(len(key)), where=norms > 0)
+    order = np.lexsort((docs, -key, owner))
+    rank = np.arange(len(order)) - weights.indptr[owner[order]]
+    keep = order[(rank < r) & (dfs[owner[order]] > r)]
+    keep = keep[np.lexsort((docs[keep], owner[keep]))]
+    return docs[keep].astype(np.uint32)
+
+def save_champions(index_dir, champions, r):
+    for kind, docs in champions.items():
+        np.save(champions_path(index_dir, kind), docs)
+    with open(os.path.join(index_dir, CHAMPIONS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"r": r}, f)
+
+def load_champions(index_dir):
+    """
+    Memory-maps ({kind: docs}, r), or returns None if they were never written.
+    """
+    meta_path = os.path.join(index_dir, CHAMPIONS_FILE)
+    if not os.path.exists(meta_path) or not all(os.path.exists(champions_path(index_dir, k)) for k in CHAMPION_KINDS):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        r = json.load(f)["r"]
+    return {kind: np.load(champions_path(index_dir, kind), mmap_mode="r") for kind in CHAMPION_KINDS}, r
+
+def build_champions(index_dir, r=CHAMPION_SIZE):
+    """
+    Writes the champion lists for the binary index in index_dir.
+    """
+    index, (_, doc_norms, idf, _) = open_index(index_dir)
+    try:
+        loaded = load_weights(index_dir, (len(index.terms), len(index.doc_ids)))
+        weights = weight_matrix(index, idf) if loaded is None else loaded[0]
+        save_champions(index_dir, {kind: champion_lists(weights, doc_norms, r, kind) for kind in CHAMPION_KINDS}, r)
+    finally:
+        index.close()
+
+class ChampionTiers:
+    """
+    Champion tier of a loaded TFIDFRanker's index. Lists missing from an older build
+    (or an incrementally built index) are computed in memory.
+    """
+    def __init__(self, ranker):
+        self.index = ranker.index
+        loaded = load_champions(ranker.data_dir) if ranker.segments is None else None
+        if loaded is None:
+            print("Computing champion lists...")
+            r = CHAMPION_SIZE
+            loaded = {kind: champion_lists(ranker.weights, ranker.doc_norms, r, kind) for kind in CHAMPION_KINDS}, r
+        self.champions, self.r = loaded
+        dfs = np.asarray(self.index.dfs, dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(np.where(dfs > self.r, self.r, 0))))
+
+    def docs(self, term, kind="tfidf"):
+        """
+        Doc numbers in the champion tier of term (all of its postings if df <= r).
+        """
+        i = self.index.slot(term)
+        if i is None:
+            return []
+        if self.starts[i + 1] == self.starts[i]:
+            return self.index.postings(term)[0]
+        return self.champions[kind][self.starts[i]:self.starts[i + 1]].tolist()
+
+    def candidates(self, terms, candidate_docs, kind="tfidf"):
+        """
+        The candidates found in the champion tier of any of the terms.
+        """
+        tier = set()
+        for term in set(terms):
+            tier.update(self.docs(term, kind))
+        return tier & candidate_docs
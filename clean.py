@@ -1,29 +1,45 @@
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from analyzer import analyze, STOP_WORDS
 
-# Ensure nltk resources are available
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+stop_words = STOP_WORDS
 
-try:
-    nltk.data.find('tokenizers/punkt_tab')
-except LookupError:
-    nltk.download('punkt_tab')
+def clean_text(text):
+    return analyze(text, stop_words)
 
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+_nltk = None
 
-stop_words = set(stopwords.words('english'))
+def _load_nltk():
+    """
+    Imports NLTK and makes sure its resources are available, on first use only.
+    Returns (word_tokenize, stop_words).
+    """
+    global _nltk
+    if _nltk is None:
+        import nltk
+        from nltk.corpus import stopwords
+        from nltk.tokenize import word_tokenize
 
-def clean_text(text):
+        # Ensure nltk resources are available
+        for resource, name in (('tokenizers/punkt', 'punkt'),
+                               ('tokenizers/punkt_tab', 'punkt_tab'),
+                               ('corpora/stopwords', 'stopwords')):
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                nltk.download(name)
+
+        _nltk = (word_tokenize, set(stopwords.words('english')))
+    return _nltk
+
+def clean_text_nltk(text):
+    """
+    The original NLTK-based pipeline. Kept as the reference for the analyzer
+    parity test and benchmark; clean_text produces the same tokens much faster.
+    """
     if not text:
         return []
+
+    word_tokenize, nltk_stop_words = _load_nltk()
     
     # Lowercase
     text = text.lower()
@@ -40,7 +56,7 @@ def clean_text(text):
     # Filter
     cleaned_tokens = []
     for token in tokens:
-        if token in stop_words:
+        if token in nltk_stop_words:
             continue
         if len(token) < 2: # Min token length
             continue
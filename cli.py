@@ -1,10 +1,10 @@
 import sys
 from query import QueryProcessor
 
-def main():
+def main(in_memory=False, ranking="tfidf", tiered=False):
     print("Initializing Search Engine...")
     try:
-        qp = QueryProcessor()
+        qp = QueryProcessor(in_memory=in_memory, ranking=ranking, tiered=tiered)
     except Exception as e:
         print(f"Error initializing: {e}")
         print("Did you run build.py?")
@@ -26,7 +26,7 @@ def main():
             if not query_str.strip():
                 continue
                 
-            results, _ = qp.process_query(query_str)
+            results, _ = qp.process_query(query_str, k=5)
             
             print(f"Found {len(results)} results.")
             for i, res in enumerate(results[:5]): # Show top 5
@@ -0,0 +1,136 @@
+import os
+import json
+import mmap
+import struct
+from collections import OrderedDict
+from textstore import PackReader
+
+# corpus.jsonl holds one JSON record per document, in doc number order.
+# corpus.idx is its fixed-width offset index: count + 1 little-endian uint64,
+# record i being the bytes between offsets i and i + 1.
+CORPUS_FILE = "corpus.jsonl"
+OFFSETS_FILE = "corpus.idx"
+OFFSET = struct.Struct("<Q")
+
+class CorpusWriter:
+    """
+    Writes corpus.jsonl and its offset index together.
+    """
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.f = open(os.path.join(index_dir, CORPUS_FILE), "wb")
+        self.offsets = [0]
+
+    def add(self, doc):
+        line = (json.dumps(doc) + "\n").encode("utf-8")
+        self.f.write(line)
+        self.offsets.append(self.offsets[-1] + len(line))
+
+    def close(self):
+        self.f.close()
+        write_offsets(os.path.join(self.index_dir, OFFSETS_FILE), self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # A failed build leaves no offset index that looks complete
+            self.f.close()
+            return
+        self.close()
+
+def write_offsets(path, offsets):
+    with open(path + ".tmp", "wb") as f:
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+    os.replace(path + ".tmp", path)
+
+def index_corpus(index_dir):
+    """
+    The offset index of a corpus.jsonl written without corpus.idx, built in memory
+    (in the corpus.idx format) so that reading never writes into the index dir.
+    """
+    offsets = bytearray(OFFSET.pack(0))
+    end = 0
+    with open(os.path.join(index_dir, CORPUS_FILE), "rb") as f:
+        for line in f:
+            end += len(line)
+            offsets += OFFSET.pack(end)
+    return bytes(offsets)
+
+def _map(path):
+    f = open(path, "rb")
+    # mmap cannot map an empty file
+    if os.fstat(f.fileno()).st_size == 0:
+        return f, b""
+    return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class DocStore:
+    """
+    Documents by doc number, read on demand: the record (id, path) through the
+    offset index, the text from texts.pack (or the record's "text" field in older
+    indexes). Recently used records are kept in a small LRU cache.
+    """
+    def __init__(self, index_dir, cache_size=1024):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.f_corpus, self.corpus_mm = _map(os.path.join(index_dir, CORPUS_FILE))
+        if os.path.exists(os.path.join(index_dir, OFFSETS_FILE)):
+            self.f_offsets, self.offsets_mm = _map(os.path.join(index_dir, OFFSETS_FILE))
+        else:
+            self.f_offsets, self.offsets_mm = None, index_corpus(index_dir)
+        self.count = len(self.offsets_mm) // OFFSET.size - 1
+
+        self.texts = None
+        texts_path = os.path.join(index_dir, "texts.pack")
+        if os.path.exists(texts_path):
+            self.texts = PackReader(texts_path)
+
+    def __len__(self):
+        return self.count
+
+    def get(self, doc_num):
+        """
+        Returns the record of a document, or None if doc_num is out of range.
+        """
+        doc = self.cache.get(doc_num)
+        if doc is not None:
+            self.cache.move_to_end(doc_num)
+            return doc
+        if not 0 <= doc_num < self.count:
+            return None
+
+        start, = OFFSET.unpack_from(self.offsets_mm, doc_num * OFFSET.size)
+        end, = OFFSET.unpack_from(self.offsets_mm, (doc_num + 1) * OFFSET.size)
+        doc = json.loads(self.corpus_mm[start:end])
+        self.cache[doc_num] = doc
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return doc
+
+    def get_text(self, doc_num):
+        doc = self.get(doc_num)
+        if doc is None:
+            return None
+        if self.texts is not None:
+            return self.texts.get(doc["id"])
+        return doc.get("text")
+
+    def get_prefix(self, doc_num, n_chars):
+        doc = self.get(doc_num)
+        if doc is None:
+            return None
+        if self.texts is not None:
+            return self.texts.get_prefix(doc["id"], n_chars)
+        return (doc.get("text") or "")[:n_chars]
+
+    def close(self):
+        for mm in (self.corpus_mm, self.offsets_mm):
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+        self.f_corpus.close()
+        if self.f_offsets is not None:
+            self.f_offsets.close()
+        if self.texts is not None:
+            self.texts.close()
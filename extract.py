@@ -1,37 +1,444 @@
 import os
 import glob
+import json
+import time
+import re
+import hashlib
+import argparse
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from collections import deque
 import fitz  # pymupdf
 import pdfplumber
 from tqdm import tqdm
+from pages import pages_path_for, write_page_offsets
 
 PDF_DIR = r"data/pdfs"
 EXTRACTED_DIR = r"data/extracted"
 # Fallback/Original directory
 ORIGINAL_PDF_DIR = r"lahore highcourt judgements 1000 pdf folder"
+# PDFs that could not be extracted on the last run
+FAILURES_PATH = r"data/extract_failures.json"
+# Size, mtime and content hash of every PDF extracted so far
+MANIFEST_PATH = r"data/extract_manifest.json"
+# Bump whenever extraction output changes so existing text gets regenerated
+EXTRACTOR_VERSION = 3
+
+# Seconds pdfplumber may spend on one PDF's weak pages before its PyMuPDF text is kept
+FALLBACK_TIMEOUT = 300.0
+
+# Pages below these limits are re-extracted with pdfplumber
+MIN_CHARS_PER_SQ_INCH = 0.1
+MAX_BAD_CHAR_RATIO = 0.05
+# Control characters, private-use glyphs and U+FFFD usually mean a broken font mapping
+_BAD_CHARS_RE = re.compile(r"[\x00-\x08\x0e-\x1b\x7f-\x9f\ue000-\uf8ff\ufffd]")
+
+def doc_id_for(pdf_path):
+    return os.path.splitext(os.path.basename(pdf_path))[0]
+
+def txt_path_for(pdf_path):
+    return os.path.join(EXTRACTED_DIR, doc_id_for(pdf_path) + ".txt")
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def manifest_entry(pdf_path, digest=None):
+    st = os.stat(pdf_path)
+    return {
+        "pdf": pdf_path,
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "sha256": digest or file_sha256(pdf_path),
+        "extractor": EXTRACTOR_VERSION,
+    }
+
+def plan_extraction(pdf_files, manifest, force=False):
+    """
+    Compares the PDFs on disk with the manifest.
+    Returns (todo, removed): PDFs that are new, changed or missing their extracted
+    text or page offsets, and doc ids whose PDF is gone.
+    Unchanged entries are refreshed in place; size and mtime are checked first so
+    the content hash is only computed for files that look modified.
+    """
+    todo = []
+    present = set()
+    for pdf_path in pdf_files:
+        doc_id = doc_id_for(pdf_path)
+        present.add(doc_id)
+        entry = manifest.get(doc_id)
+        txt_path = txt_path_for(pdf_path)
+        # Text without its page offset sidecar predates page tracking: redo it
+        has_text = os.path.exists(txt_path) and os.path.exists(pages_path_for(txt_path))
+
+        if force or not has_text:
+            todo.append(pdf_path)
+            continue
+
+        if entry is None:
+            # Text extracted (with page offsets) before the manifest existed: adopt it
+            manifest[doc_id] = manifest_entry(pdf_path)
+            continue
+
+        if entry.get("extractor") != EXTRACTOR_VERSION:
+            todo.append(pdf_path)
+            continue
+
+        st = os.stat(pdf_path)
+        if entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            continue
+
+        digest = file_sha256(pdf_path)
+        if digest == entry["sha256"]:
+            # Touched but not modified
+            manifest[doc_id] = manifest_entry(pdf_path, digest)
+        else:
+            todo.append(pdf_path)
+
+    removed = [doc_id for doc_id in manifest if doc_id not in present]
+    return todo, removed
+
+def prune_removed(removed, manifest):
+    for doc_id in removed:
+        txt_path = os.path.join(EXTRACTED_DIR, doc_id + ".txt")
+        for path in (txt_path, pages_path_for(txt_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        del manifest[doc_id]
+
+def page_quality_ok(text, area_sq_in):
+    """
+    Cheap checks for a page that came back empty or garbled:
+    too few characters for the page size, or too many non-printable ones.
+    """
+    visible = len("".join(text.split()))
+    if area_sq_in > 0 and visible / area_sq_in < MIN_CHARS_PER_SQ_INCH:
+        return False
+    if visible and len(_BAD_CHARS_RE.findall(text)) / visible > MAX_BAD_CHAR_RATIO:
+        return False
+    return True
+
+def _good_chars(text):
+    return len("".join(text.split())) - len(_BAD_CHARS_RE.findall(text))
+
+def extract_pages_fast(pdf_path):
+    """
+    Extracts every page with PyMuPDF.
+    Returns (pages, weak_pages): the page texts, each ending in a newline,
+    and the indices of pages that failed the quality checks.
+    """
+    pages = []
+    weak_pages = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            text = page.get_text()
+            rect = page.rect
+            if not page_quality_ok(text, rect.width * rect.height / (72 * 72)):
+                weak_pages.append(page.number)
+            pages.append(text + "\n")
+    return pages, weak_pages
+
+def extract_pages_pdfplumber(pdf_path, page_numbers=None):
+    """
+    Extracts the given pages (all pages if None) with pdfplumber.
+    Returns {page_number: text}. Empty pages map to "".
+    """
+    result = {}
+    with pdfplumber.open(pdf_path) as pdf:
+        if page_numbers is None:
+            page_numbers = range(len(pdf.pages))
+        for n in page_numbers:
+            page_text = pdf.pages[n].extract_text()
+            result[n] = page_text + "\n" if page_text else ""
+    return result
+
+def merge_fallback(pages, fallback):
+    """
+    Replaces weak PyMuPDF pages with pdfplumber's text where that is better.
+    With no PyMuPDF pages at all, the fallback result is used as is.
+    """
+    if pages is None:
+        return [fallback[n] for n in sorted(fallback)]
+    for n, text in fallback.items():
+        if _good_chars(text) > _good_chars(pages[n]):
+            pages[n] = text
+    return pages
+
+def extract_pages_from_pdf(pdf_path, fallback=None):
+    """
+    Returns the text of every page (each ending in a newline), or None on failure.
+    Empty pages are kept as empty strings so page numbers stay aligned with the PDF.
+    Only pages failing the quality checks are re-extracted with pdfplumber, in the
+    fallback TaskPool (a one-off pool with FALLBACK_TIMEOUT if None), so a PDF that
+    hangs pdfplumber keeps its PyMuPDF text.
+    """
+    # Try pymupdf first (faster)
+    pages, weak_pages = _fast_task(pdf_path)
+    if pages is not None and not weak_pages:
+        return pages
+    # Fallback to pdfplumber, for the weak pages or the whole document
+    pool = fallback or TaskPool(_fallback_task, 1, FALLBACK_TIMEOUT)
+    try:
+        _, result, error = pool.run((pdf_path, weak_pages))
+    finally:
+        if fallback is None:
+            pool.close()
+    if result is None:
+        print(f"Error with pdfplumber for {pdf_path}: {error}")
+        return pages
+    return merge_fallback(pages, result)
 
 def extract_text_from_pdf(pdf_path):
-    text = ""
+    pages = extract_pages_from_pdf(pdf_path)
+    if pages is None:
+        return None
+    return "".join(pages)
+
+def write_pages(pdf_path, pages):
+    """
+    Streams pages to the .txt file and writes the page offset sidecar next to it.
+    """
+    txt_path = txt_path_for(pdf_path)
+    tmp_path = txt_path + ".tmp"
+    offsets = []
+    pos = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for page_text in pages:
+            offsets.append(pos)
+            f.write(page_text)
+            pos += len(page_text)
+    os.replace(tmp_path, txt_path)
+    write_page_offsets(pages_path_for(txt_path), offsets)
+
+def _has_text(pages):
+    return bool(pages) and any(pages)
+
+def _fast_task(pdf_path):
     try:
-        # Try pymupdf first (faster)
-        doc = fitz.open(pdf_path)
-        for page in doc:
-            text += page.get_text() + "\n"
-        doc.close()
+        return extract_pages_fast(pdf_path)
     except Exception as e:
         print(f"Error with pymupdf for {pdf_path}: {e}")
-        # Fallback to pdfplumber
+        return None, None
+
+def _fallback_task(task):
+    pdf_path, page_numbers = task
+    return extract_pages_pdfplumber(pdf_path, page_numbers)
+
+def _pool_worker(conn, func):
+    # Runs in a child process: receive a task, send back (task, result, error)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        try:
+            conn.send((task, func(task), None))
+        except Exception as e:
+            conn.send((task, None, str(e) or type(e).__name__))
+    conn.close()
+
+class _WorkerSlot:
+    def __init__(self, ctx, func):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_pool_worker, args=(child_conn, func), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started = None
+
+    def assign(self, task):
+        self.task = task
+        self.started = time.monotonic()
+        self.conn.send(task)
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-        except Exception as e2:
-            print(f"Error with pdfplumber for {pdf_path}: {e2}")
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+class TaskPool:
+    """
+    A bounded pool of worker processes, each running `func` on one task at a time.
+    Every worker has its own pipe, so one that overruns `timeout` can be killed
+    and replaced without disturbing the others.
+    """
+    def __init__(self, func, workers, timeout=None):
+        self.ctx = mp.get_context()
+        self.func = func
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.pending = deque()
+        self.slots = []
+
+    def submit(self, task):
+        self.pending.append(task)
+        self._feed()
+
+    def _feed(self):
+        for slot in self.slots:
+            if slot.task is None and self.pending:
+                slot.assign(self.pending.popleft())
+        while self.pending and len(self.slots) < self.workers:
+            slot = _WorkerSlot(self.ctx, self.func)
+            self.slots.append(slot)
+            slot.assign(self.pending.popleft())
+
+    def _busy_slots(self):
+        return [s for s in self.slots if s.task is not None]
+
+    @property
+    def busy(self):
+        return bool(self._busy_slots())
+
+    def connections(self):
+        return [s.conn for s in self._busy_slots()]
+
+    def next_deadline(self):
+        if not self.timeout:
             return None
-    return text
+        busy = self._busy_slots()
+        return min(s.started + self.timeout for s in busy) if busy else None
+
+    def _replace(self, slot):
+        slot.kill()
+        self.slots[self.slots.index(slot)] = _WorkerSlot(self.ctx, self.func)
+
+    def collect(self, ready):
+        """
+        Returns (task, result, error) for every task that finished, crashed or timed out.
+        """
+        done = []
+        for slot in self._busy_slots():
+            if slot.conn in ready:
+                try:
+                    done.append(slot.conn.recv())
+                    slot.task = None
+                except EOFError:
+                    # Worker died mid-task (e.g. segfault inside the PDF library)
+                    done.append((slot.task, None, "worker exited unexpectedly"))
+                    self._replace(slot)
+            elif self.timeout and time.monotonic() - slot.started >= self.timeout:
+                done.append((slot.task, None, f"timed out after {self.timeout}s"))
+                self._replace(slot)
+        self._feed()
+        return done
+
+    def run(self, task):
+        """
+        Runs one task on an idle pool and waits for it. Returns (task, result, error).
+        """
+        self.submit(task)
+        while True:
+            deadline = self.next_deadline()
+            ready = wait(self.connections(), timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+            done = self.collect(ready)
+            if done:
+                return done[0]
+
+    def close(self):
+        for slot in self.slots:
+            slot.stop()
+
+def extract_serial(pdf_paths, fallback_timeout=FALLBACK_TIMEOUT):
+    """
+    Extracts PDFs one at a time with PyMuPDF in this process; weak pages go to a
+    single pdfplumber worker process that is killed after `fallback_timeout`.
+    Yields (pdf_path, pages, error) tuples.
+    """
+    fallback = TaskPool(_fallback_task, 1, fallback_timeout)
+    try:
+        for pdf_path in pdf_paths:
+            pages = extract_pages_from_pdf(pdf_path, fallback)
+            yield pdf_path, pages, None if _has_text(pages) else "no text extracted"
+    finally:
+        fallback.close()
+
+def extract_parallel(pdf_paths, workers, timeout=None, fallback_workers=1, fallback_timeout=FALLBACK_TIMEOUT):
+    """
+    Extracts PDFs in a pool of PyMuPDF worker processes, each opening its own documents.
+    Weak pages (and documents PyMuPDF cannot open) go to a separate, smaller pdfplumber
+    pool so the slow path never holds up the fast one.
+    Yields (pdf_path, pages, error) tuples as soon as each file finishes.
+    A file that overruns `timeout` in the fast pool is reported as failed; a fallback
+    that overruns `fallback_timeout` keeps the PyMuPDF text.
+    """
+    fast = TaskPool(_fast_task, workers, timeout)
+    slow = TaskPool(_fallback_task, fallback_workers, fallback_timeout)
+    # PyMuPDF pages waiting for their weak pages to come back from the fallback pool
+    partial = {}
+
+    for pdf_path in pdf_paths:
+        fast.submit(pdf_path)
+
+    try:
+        while fast.busy or slow.busy:
+            deadlines = [d for d in (fast.next_deadline(), slow.next_deadline()) if d is not None]
+            wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            ready = wait(fast.connections() + slow.connections(), timeout=wait_for)
+
+            for pdf_path, result, error in fast.collect(ready):
+                if error:
+                    yield pdf_path, None, error
+                    continue
+                pages, weak_pages = result
+                if pages is None or weak_pages:
+                    partial[pdf_path] = pages
+                    slow.submit((pdf_path, weak_pages))
+                else:
+                    yield pdf_path, pages, None if _has_text(pages) else "no text extracted"
+
+            for (pdf_path, _), result, error in slow.collect(ready):
+                pages = partial.pop(pdf_path)
+                if result is not None:
+                    pages = merge_fallback(pages, result)
+                if _has_text(pages):
+                    yield pdf_path, pages, None
+                else:
+                    yield pdf_path, None, error or "no text extracted"
+    finally:
+        fast.close()
+        slow.close()
+
+def write_failures(failures, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(failures, f, indent=2)
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract text from judgment PDFs")
+    parser.add_argument("--workers", type=int, default=1, help="Number of extraction processes (1 = serial)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-file timeout in seconds (parallel mode only)")
+    parser.add_argument("--fallback-workers", type=int, default=1, help="Processes re-extracting weak pages with pdfplumber (parallel mode only)")
+    parser.add_argument("--fallback-timeout", type=float, default=FALLBACK_TIMEOUT, help="Per-file timeout for the pdfplumber fallback")
+    parser.add_argument("--force", action="store_true", help="Re-extract every PDF, ignoring the manifest")
+    args = parser.parse_args()
+
     if not os.path.exists(EXTRACTED_DIR):
         os.makedirs(EXTRACTED_DIR)
 
@@ -60,20 +467,40 @@ def main():
         print(f"No PDFs found in {PDF_DIR} or {ORIGINAL_PDF_DIR}")
         return
 
-    print(f"Found {len(pdf_files)} PDFs to process.")
+    print(f"Found {len(pdf_files)} PDFs.")
 
-    for pdf_path in tqdm(pdf_files):
-        filename = os.path.basename(pdf_path)
-        txt_filename = os.path.splitext(filename)[0] + ".txt"
-        txt_path = os.path.join(EXTRACTED_DIR, txt_filename)
+    manifest = load_manifest(MANIFEST_PATH)
+    todo, removed = plan_extraction(pdf_files, manifest, force=args.force)
+    if removed:
+        print(f"Pruning text for {len(removed)} deleted PDFs.")
+        prune_removed(removed, manifest)
+    print(f"{len(todo)} PDFs new or changed.")
 
-        if os.path.exists(txt_path):
-            continue
+    if args.workers > 1:
+        results = extract_parallel(todo, args.workers, timeout=args.timeout,
+                                   fallback_workers=args.fallback_workers,
+                                   fallback_timeout=args.fallback_timeout)
+    else:
+        results = extract_serial(todo, fallback_timeout=args.fallback_timeout)
+
+    failures = []
+    try:
+        for pdf_path, pages, error in tqdm(results, total=len(todo)):
+            doc_id = doc_id_for(pdf_path)
+            if _has_text(pages):
+                write_pages(pdf_path, pages)
+                manifest[doc_id] = manifest_entry(pdf_path)
+            else:
+                # Keep any older text, but mark it stale so the next run retries
+                if doc_id in manifest:
+                    manifest[doc_id]["extractor"] = None
+                failures.append({"pdf": pdf_path, "error": error})
+    finally:
+        save_manifest(manifest, MANIFEST_PATH)
 
-        text = extract_text_from_pdf(pdf_path)
-        if text:
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(text)
+    write_failures(failures, FAILURES_PATH)
+    if failures:
+        print(f"{len(failures)} PDFs could not be extracted, see {FAILURES_PATH}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,166 @@
+import os
+import heapq
+import numpy as np
+
+# External-sort index construction. Every token becomes a fixed-size binary record
+# (term, doc number, position) of three little-endian uint32. Records are buffered
+# up to a fixed count and written to run files in emission order, i.e. by doc.
+# Once the vocabulary is known each run is sorted by term rank (the term's place
+# in sorted order), and the runs are merged in a single streaming pass.
+RECORD = np.dtype("<u4")
+RECORD_FIELDS = 3
+RECORD_BYTES = RECORD.itemsize * RECORD_FIELDS
+MERGE_FAN_IN = 64 # runs merged at once; more runs first get merged in groups
+
+class RunWriter:
+    """
+    Buffers (term id, doc, position) records and writes them out as fixed-size runs
+    of at most run_records records.
+    """
+    def __init__(self, run_dir, run_records):
+        self.run_dir = run_dir
+        self.buf = np.empty((run_records, RECORD_FIELDS), dtype=RECORD)
+        self.used = 0
+        self.run_paths = []
+
+    def add_doc(self, doc_num, term_ids):
+        term_ids = np.asarray(term_ids, dtype=RECORD)
+        start = 0
+        while start < len(term_ids):
+            n = min(len(term_ids) - start, len(self.buf) - self.used)
+            rows = self.buf[self.used:self.used + n]
+            rows[:, 0] = term_ids[start:start + n]
+            rows[:, 1] = doc_num
+            rows[:, 2] = np.arange(start, start + n)
+            self.used += n
+            start += n
+            if self.used == len(self.buf):
+                self.flush()
+
+    def flush(self):
+        if not self.used:
+            return
+        path = os.path.join(self.run_dir, f"run-{len(self.run_paths):06d}.bin")
+        with open(path, "wb") as f:
+            f.write(self.buf[:self.used].tobytes())
+        self.run_paths.append(path)
+        self.used = 0
+
+def sort_run(path, ranks):
+    """
+    Rewrites a run with term ids replaced by ranks, sorted by rank. The sort is
+    stable, so each term's records stay in (doc, position) order.
+    """
+    records = np.fromfile(path, dtype=RECORD).reshape(-1, RECORD_FIELDS)
+    records[:, 0] = ranks[records[:, 0]]
+    records = records[np.argsort(records[:, 0], kind="stable")]
+    with open(path, "wb") as f:
+        f.write(records.tobytes())
+
+class RunReader:
+    """
+    Sequential reader of a sorted run, block_records records at a time.
+    """
+    def __init__(self, path, block_records):
+        self.f = open(path, "rb")
+        self.block_records = block_records
+        self.buf = np.empty((0, RECORD_FIELDS), dtype=RECORD)
+        self.i = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.f.read(self.block_records * RECORD_BYTES)
+        self.buf = np.frombuffer(data, dtype=RECORD).reshape(-1, RECORD_FIELDS)
+        self.ranks = self.buf[:, 0].astype(np.int64) # contiguous and int-typed, for searchsorted
+        self.i = 0
+        if len(self.buf) < self.block_records:
+            self.eof = True
+
+    def head(self):
+        """
+        Rank of the next record, or None at the end of the run.
+        """
+        if self.i == len(self.buf):
+            if self.eof:
+                return None
+            self._fill()
+            if not len(self.buf):
+                return None
+        return int(self.ranks[self.i])
+
+    def take(self, rank):
+        """
+        Yields the records of rank at the head of the run, a block at most at a time.
+        """
+        while self.head() == rank:
+            end = int(np.searchsorted(self.ranks, rank, side="right"))
+            yield self.buf[self.i:end]
+            self.i = end
+
+    def close(self):
+        self.f.close()
+
+def merge_sorted_runs(run_paths, block_records):
+    """
+    Streaming merge of sorted runs. Yields (rank, records) in rank order, a rank's
+    records coming in pieces of about block_records. Runs hold consecutive document
+    ranges, so taking a rank's records run by run, in run order, keeps them in
+    (doc, position) order.
+    """
+    readers = [RunReader(path, block_records) for path in run_paths]
+    try:
+        heap = [(r.head(), i) for i, r in enumerate(readers) if r.head() is not None]
+        heapq.heapify(heap)
+        while heap:
+            rank = heap[0][0]
+            run_nos = []
+            while heap and heap[0][0] == rank:
+                run_nos.append(heapq.heappop(heap)[1])
+            pieces = []
+            size = 0
+            for i in sorted(run_nos):
+                for records in readers[i].take(rank):
+                    pieces.append(records)
+                    size += len(records)
+                    if size >= block_records:
+                        yield rank, np.concatenate(pieces)
+                        pieces = []
+                        size = 0
+                head = readers[i].head()
+                if head is not None:
+                    heapq.heappush(heap, (head, i))
+            if pieces:
+                yield rank, pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+    finally:
+        for r in readers:
+            r.close()
+
+def reduce_runs(run_paths, run_dir, block_records, fan_in=MERGE_FAN_IN):
+    """
+    Merges consecutive groups of runs until at most fan_in are left, so the final
+    merge keeps a bounded number of blocks in memory. Returns the remaining runs.
+    """
+    level = 0
+    while len(run_paths) > fan_in:
+        merged = []
+        for g in range(0, len(run_paths), fan_in):
+            group = run_paths[g:g + fan_in]
+            path = os.path.join(run_dir, f"merge-{level:02d}-{len(merged):06d}.bin")
+            with open(path, "wb") as f:
+                for _, records in merge_sorted_runs(group, block_records):
+                    f.write(records.tobytes())
+            for p in group:
+                os.remove(p)
+            merged.append(path)
+        run_paths = merged
+        level += 1
+    return run_paths
+
+def budget_records(memory_mb, fan_in=MERGE_FAN_IN):
+    """
+    (run_records, block_records) for a memory budget. Sorting a run needs the
+    records, their sort order and a sorted copy (about 32 bytes per record);
+    the merge holds one block per run.
+    """
+    budget = memory_mb * 2**20
+    return max(budget // 32, 1024), max(budget // (fan_in * RECORD_BYTES), 1024)
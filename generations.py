@@ -0,0 +1,100 @@
+import os
+import shutil
+import argparse
+
+# Full builds are published as generations (inside the index dir):
+#   generations/<name>/  one complete build, never modified once published
+#   CURRENT              name of the live generation, replaced atomically on publish
+# Readers resolve CURRENT once when they load, so a rebuild never changes files
+# under a running server; it picks up the new generation on its next reload.
+CURRENT = "CURRENT"
+GENERATIONS_DIR = "generations"
+KEEP_PREVIOUS = 1 # older generations kept for servers that have not reloaded yet
+
+def generation_dir(index_dir, name):
+    return os.path.join(index_dir, GENERATIONS_DIR, name)
+
+def current_generation(index_dir):
+    """
+    Name of the published generation, or None for an index built in place.
+    """
+    path = os.path.join(index_dir, CURRENT)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+def resolve_index_dir(index_dir):
+    """
+    Directory holding the live artifacts: the current generation, or index_dir itself.
+    """
+    name = current_generation(index_dir)
+    return generation_dir(index_dir, name) if name else index_dir
+
+def list_generations(index_dir):
+    root = os.path.join(index_dir, GENERATIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if name.startswith("gen-"))
+
+def new_generation(index_dir):
+    """
+    Creates an empty directory for the next generation. Returns (name, path).
+    """
+    names = list_generations(index_dir)
+    number = int(names[-1][4:]) + 1 if names else 0
+    name = f"gen-{number:06d}"
+    path = generation_dir(index_dir, name)
+    os.makedirs(path)
+    return name, path
+
+def publish_generation(index_dir, name):
+    """
+    Makes name the live generation with an atomic swap of CURRENT.
+    """
+    path = os.path.join(index_dir, CURRENT)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def collect_garbage(index_dir, keep_previous=KEEP_PREVIOUS):
+    """
+    Removes generations older than the live one, except the keep_previous newest.
+    Newer, unpublished generations may be builds in progress and are left alone.
+    Returns the names removed.
+    """
+    current = current_generation(index_dir)
+    names = list_generations(index_dir)
+    if current not in names:
+        return []
+    older = names[:names.index(current)]
+    removed = []
+    for name in older[:max(len(older) - keep_previous, 0)]:
+        # Fails on platforms that lock open files; the next collection retries
+        shutil.rmtree(generation_dir(index_dir, name), ignore_errors=True)
+        if not os.path.exists(generation_dir(index_dir, name)):
+            removed.append(name)
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and clean up index generations")
+    parser.add_argument("command", choices=["status", "gc"])
+    parser.add_argument("--index-dir", default=r"data/index")
+    parser.add_argument("--keep", type=int, default=KEEP_PREVIOUS, help="Older generations to keep (gc only)")
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        removed = collect_garbage(args.index_dir, args.keep)
+        print(f"Removed {len(removed)} generations: {', '.join(removed) or '-'}")
+    else:
+        current = current_generation(args.index_dir)
+        for name in list_generations(args.index_dir):
+            print(f"{name}{'  (current)' if name == current else ''}")
+        if current is None:
+            print("No published generation; the index is read from the index dir itself.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import os
+import json
+import math
+from collections import defaultdict
+import numpy as np
+from tfidf import log10_tfs
+from postings import open_index
+
+# Impact postings: each posting's score contribution precomputed at build time and
+# quantized to 8 bits, so ranking is an integer accumulate over postings.
+#   impact_<scheme>.npy  (doc, code) records (<u4, u1), the postings of each term
+#                        (in dictionary order) sorted by code, highest first
+#   impacts.json         per scheme: the scale (weight of code 1) and its parameters
+# Codes are uniform over [0, largest weight] with one scale per scheme, so codes of
+# different terms add up directly. Any posting with a positive weight keeps code >= 1.
+IMPACTS_FILE = "impacts.json"
+IMPACT = np.dtype([("doc", "<u4"), ("code", "u1")])
+LEVELS = 255
+SCHEMES = ("tfidf", "bm25")
+# Ranking modes for QueryProcessor: the exact float scorers and their 8-bit versions
+RANKINGS = ("tfidf", "tfidf-q8", "bm25", "bm25-q8")
+BM25_K1 = 1.2
+BM25_B = 0.75
+QUERY_SCALE = 16 # query term multipliers are rounded to 1/16
+
+def impact_path(index_dir, scheme):
+    return os.path.join(index_dir, f"impact_{scheme}.npy")
+
+def scheme_params(scheme):
+    return {"k1": BM25_K1, "b": BM25_B} if scheme == "bm25" else {}
+
+def impact_weights(index, doc_lengths, idf, scheme):
+    """
+    Float contribution of each posting for one occurrence of its term in a query:
+      tfidf  w_td * idf = (1 + log10 tf) * idf^2 (the query side's w_tq is
+             (1 + log10 count) * idf, so only the count part is left per query)
+      bm25   ln(1 + (N - df + 0.5) / (df + 0.5)) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avg |d|))
+    Returns (term_starts, docs, weights) with each term's postings in doc order.
+    """
+    term_starts, docs, tfs = index.arrays()
+    dfs = np.diff(term_starts)
+    if scheme == "tfidf":
+        idf = np.asarray(idf, dtype=np.float64)
+        weights = (1 + log10_tfs(tfs)) * np.repeat(idf * idf, dfs)
+    else:
+        N = index.n_docs
+        bm25_idf = np.log1p((N - dfs + 0.5) / (dfs + 0.5))
+        lengths = np.asarray(doc_lengths, dtype=np.float64)
+        avg_len = lengths.sum() / N if N else 0.0
+        norm = 1 - BM25_B + BM25_B * lengths[docs] / avg_len if avg_len else np.ones(len(docs))
+        tfs = tfs.astype(np.float64)
+        weights = np.repeat(bm25_idf, dfs) * tfs * (BM25_K1 + 1) / (tfs + BM25_K1 * norm)
+    return term_starts, docs, weights
+
+def quantize(term_starts, docs, weights):
+    """
+    8-bit codes for weights, impact-ordered within each term. Returns (records, scale).
+    """
+    top = float(weights.max()) if len(weights) else 0.0
+    scale = top / LEVELS if top > 0 else 1.0
+    codes = np.rint(weights / scale)
+    codes[(weights > 0) & (codes < 1)] = 1
+    owner = np.repeat(np.arange(len(term_starts) - 1), np.diff(term_starts))
+    order = np.lexsort((docs, -codes, owner))
+    records = np.empty(len(docs), dtype=IMPACT)
+    records["doc"] = docs[order]
+    records["code"] = codes[order]
+    return records, scale
+
+def compute_impacts(index, doc_lengths, idf, schemes=SCHEMES):
+    """
+    {scheme: (records, scale)} for an open index and its statistics.
+    """
+    return {scheme: quantize(*impact_weights(index, doc_lengths, idf, scheme)) for scheme in schemes}
+
+def save_impacts(index_dir, impacts):
+    """
+    Writes the schemes in impacts, keeping any other scheme already saved.
+    """
+    meta_path = os.path.join(index_dir, IMPACTS_FILE)
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    for scheme, (records, scale) in impacts.items():
+        np.save(impact_path(index_dir, scheme), records)
+        meta[scheme] = dict(scale=scale, **scheme_params(scheme))
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+def load_impacts(index_dir, scheme):
+    """
+    Memory-maps (records, scale) of a scheme, or returns None if they were never
+    written or were built with other parameters.
+    """
+    meta_path = os.path.join(index_dir, IMPACTS_FILE)
+    if not os.path.exists(meta_path) or not os.path.exists(impact_path(index_dir, scheme)):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f).get(scheme)
+    if meta is None or any(meta.get(k) != v for k, v in scheme_params(scheme).items()):
+        return None
+    return np.load(impact_path(index_dir, scheme), mmap_mode="r"), meta["scale"]
+
+def build_impacts(index_dir):
+    """
+    Writes the impact postings of every scheme for the binary index in index_dir.
+    """
+    index, (doc_lengths, _, idf, _) = open_index(index_dir)
+    try:
+        save_impacts(index_dir, compute_impacts(index, doc_lengths, idf))
+    finally:
+        index.close()
+
+class ImpactRanker:
+    """
+    Ranks with impact postings, through the same score() as TFIDFRanker. Shares the
+    ranker's loaded index and statistics. With quantized=False the float weights
+    are accumulated instead: the exact scorer the 8-bit codes approximate. Impact
+    postings the build did not write are computed in memory.
+    """
+    def __init__(self, ranker, scheme, quantized=True):
+        self.ranker = ranker
+        self.index = ranker.index
+        self.scheme = scheme
+        self.quantized = quantized
+        self.term_starts = np.concatenate(([0], np.cumsum(np.asarray(self.index.dfs, dtype=np.int64))))
+        self.scale = 1.0
+        self.load_data()
+
+    def load_data(self):
+        idf = np.fromiter(self.ranker.idf.values(), dtype=np.float64, count=len(self.ranker.idf))
+        if not self.quantized:
+            _, self.docs, self.values = impact_weights(self.index, self.ranker.doc_lengths, idf, self.scheme)
+            return
+        loaded = None
+        if self.ranker.segments is None:
+            loaded = load_impacts(self.ranker.data_dir, self.scheme)
+        if loaded is None:
+            # Not written by the build (see build.py --impacts): kept in memory only
+            print(f"Computing {self.scheme} impact postings...")
+            loaded = compute_impacts(self.index, self.ranker.doc_lengths, idf, (self.scheme,))[self.scheme]
+        records, self.scale = loaded
+        self.docs, self.values = records["doc"], records["code"]
+
+    def query_multipliers(self, query_terms):
+        """
+        (slot, multiplier) per distinct query term. Each occurrence adds the term's
+        impact times the query side weight: 1 for bm25, (1 + log10 count) for tfidf.
+        """
+        counts = defaultdict(int)
+        for t in query_terms:
+            counts[t] += 1
+        multipliers = []
+        for t, count in counts.items():
+            i = self.index.slot(t)
+            if i is None:
+                continue
+            m = count * (1 + math.log10(count)) if self.scheme == "tfidf" else count
+            multipliers.append((i, round(m * QUERY_SCALE) if self.quantized else m))
+        return multipliers
+
+    def score(self, query_terms, candidate_docs, use_cosine=False, k=None):
+        # Same contract as TFIDFRanker.score; use_cosine only applies to tfidf
+        # (bm25 normalizes document length itself)
+        acc = np.zeros(len(self.index.doc_ids), dtype=np.int64 if self.quantized else np.float64)
+        for i, m in self.query_multipliers(query_terms):
+            start, end = self.term_starts[i], self.term_starts[i + 1]
+            # Postings of a term have distinct docs, so a fancy-indexed add is enough
+            acc[self.docs[start:end]] += self.values[start:end].astype(acc.dtype) * m
+
+        docs = np.fromiter(candidate_docs, dtype=np.int64, count=len(candidate_docs))
+        scores = acc[docs].astype(np.float64)
+        if self.quantized:
+            scores *= self.scale / QUERY_SCALE
+        if use_cosine and self.scheme == "tfidf":
+            _, _, query_vec_len = self.ranker.query_weights(query_terms)
+            denom = self.ranker.doc_norms[docs] * query_vec_len
+            scores = np.divide(scores, denom, out=np.zeros(len(docs)), where=denom > 0)
+
+        # Sort by score (stable, so ties keep candidate order)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return list(zip(docs[order].tolist(), scores[order].tolist()))
@@ -0,0 +1,41 @@
+import numpy as np
+
+# Set operations on sorted, duplicate-free int64 arrays of doc numbers, the form
+# the boolean engine keeps its intermediate results in. Membership of each doc of
+# the smaller array is found by binary search in the larger one (np.searchsorted):
+# O(m log n), so intersecting 3 docs with 900 touches about 30 entries instead of
+# hashing all 900. This is a plain binary search per key over the whole of the
+# larger array, not a galloping (exponential) search.
+EMPTY = np.zeros(0, dtype=np.int64)
+
+def member_mask(keys, docs):
+    """
+    Boolean mask over sorted keys: True where the key is in sorted docs.
+    """
+    pos = np.searchsorted(docs, keys)
+    found = pos < len(docs)
+    found[found] = docs[pos[found]] == keys[found]
+    return found
+
+def intersect_sorted(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return EMPTY
+    return a[member_mask(a, b)]
+
+def difference_sorted(a, b):
+    """
+    Docs of a that are not in b.
+    """
+    if not len(a) or not len(b):
+        return a
+    return a[~member_mask(a, b)]
+
+def union_sorted(arrays):
+    arrays = [a for a in arrays if len(a)]
+    if not arrays:
+        return EMPTY
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.unique(np.concatenate(arrays))
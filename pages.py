@@ -0,0 +1,50 @@
+import os
+import sys
+from array import array
+from bisect import bisect_right
+
+# Sidecar written next to each extracted .txt: the character offset at which
+# every PDF page starts, stored as little-endian uint32 values.
+PAGES_EXT = ".pages"
+
+def pages_path_for(txt_path):
+    return os.path.splitext(txt_path)[0] + PAGES_EXT
+
+def write_page_offsets(path, offsets):
+    arr = array("I", offsets)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    with open(path, "wb") as f:
+        arr.tofile(f)
+
+def read_page_offsets(path):
+    """
+    Returns the list of page start offsets, or None if there is no sidecar.
+    """
+    if not os.path.exists(path):
+        return None
+    arr = array("I")
+    with open(path, "rb") as f:
+        arr.frombytes(f.read())
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tolist()
+
+def page_for_offset(offsets, offset):
+    """
+    Maps an offset to a 1-based page number using sorted page start offsets.
+    Works for character offsets and token offsets alike.
+    """
+    if not offsets:
+        return 1
+    return max(1, bisect_right(offsets, offset))
+
+def split_pages(text, offsets):
+    """
+    Yields the text of each page given its start offsets (the whole text if there are none).
+    """
+    if not offsets:
+        yield text
+        return
+    for start, end in zip(offsets, offsets[1:] + [len(text)]):
+        yield text[start:end]
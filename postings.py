@@ -0,0 +1,602 @@
+import os
+import sys
+import json
+import gzip
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import accumulate
+import numpy as np
+from stats import StatsAccumulator, compute_stats, load_stats, save_stats
+from intersect import intersect_sorted
+
+# Binary positional index, three files in the index dir:
+#   index.dict  MAGIC, then per term (sorted): postings offset and positions offset
+#               (count + 1 uint64 each), document frequency (uint32), followed by
+#               the newline separated terms and doc ids, and a footer
+#   index.post  per term: doc number gaps, then term frequencies (varints)
+#   index.pos   per term, per doc: position gaps within the doc (varints)
+# Doc numbers are dense (0..n_docs-1) in doc id table order.
+# Optionally, skip pointers into the doc gaps of long posting lists:
+#   skips.npz   starts (per term, its first entry; count + 1), docs and offsets:
+#               for every SKIP_INTERVAL-th posting of a term with df > SKIP_MIN its
+#               doc number and the byte offset of its gap in the term's postings,
+#               then one closing entry (last doc number, end of the doc gaps)
+# so a few candidates can be looked up by decoding only the blocks holding them.
+# Below SKIP_MIN postings decoding the whole list is as fast as finding the blocks.
+DICT_FILE = "index.dict"
+POSTINGS_FILE = "index.post"
+POSITIONS_FILE = "index.pos"
+SKIPS_FILE = "skips.npz"
+SKIP_INTERVAL = 64
+SKIP_MIN = 1024
+MAGIC = b"LHCIDX01"
+FOOTER = struct.Struct("<QQQQ8s")  # n_terms, n_docs, terms offset, doc ids offset, MAGIC
+
+def encode_varints(values, out):
+    """
+    Appends values to the bytearray out, 7 bits per byte, high bit set on all but the last byte.
+    """
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+
+def decode_varints(buf):
+    values = []
+    v = 0
+    shift = 0
+    for b in buf:
+        if b < 0x80:
+            values.append(v | (b << shift))
+            v = 0
+            shift = 0
+        else:
+            v |= (b & 0x7F) << shift
+            shift += 7
+    return values
+
+def encode_varint_stream(values):
+    """
+    Vectorized encode_varints for an array of non-negative integers; returns the bytes.
+    """
+    if len(values) < 32:
+        # Cheaper without NumPy's per-call overhead
+        out = bytearray()
+        encode_varints(values.tolist() if isinstance(values, np.ndarray) else values, out)
+        return bytes(out)
+    v = np.asarray(values, dtype=np.uint64)
+    n_bytes = varint_lengths(v)
+    starts = np.cumsum(n_bytes) - n_bytes
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    for k in range(int(n_bytes.max())):
+        sel = n_bytes > k
+        chunk = (v[sel] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        chunk |= np.where(n_bytes[sel] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[starts[sel] + k] = chunk
+    return out.tobytes()
+
+def varint_lengths(values):
+    """
+    Encoded size in bytes of each value of an array of non-negative integers.
+    """
+    v = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 10):
+        longer = v >= np.uint64(1 << (7 * k))
+        if not longer.any():
+            break
+        n_bytes += longer
+    return n_bytes
+
+def skip_entries(doc_nums, doc_gaps):
+    """
+    Skip entries (docs, byte offsets) of one long posting list, see SKIPS_FILE.
+    """
+    doc_nums = np.asarray(doc_nums, dtype=np.int64)
+    ends = np.cumsum(varint_lengths(doc_gaps))
+    blocks = np.arange(0, len(doc_nums), SKIP_INTERVAL)
+    docs = np.append(doc_nums[blocks], doc_nums[-1])
+    offsets = np.append(np.concatenate(([0], ends))[blocks], ends[-1])
+    return docs, offsets
+
+def save_skips(index_dir, starts, docs, offsets):
+    np.savez(os.path.join(index_dir, SKIPS_FILE), starts=np.asarray(starts, dtype=np.int64),
+             docs=np.asarray(docs, dtype=np.uint32), offsets=np.asarray(offsets, dtype=np.uint32))
+
+def compute_skips(reader):
+    """
+    Skip pointers for an index written before they existed; returns what save_skips
+    and IndexReader.use_skips take.
+    """
+    starts = [0]
+    docs = []
+    offsets = []
+    for i, df in enumerate(reader.dfs):
+        if df > SKIP_MIN:
+            gaps = decode_varint_stream(reader.post_mm[reader.post_offsets[i]:reader.post_offsets[i + 1]])[:df]
+            d, o = skip_entries(np.cumsum(gaps), gaps)
+            docs.append(d)
+            offsets.append(o)
+            starts.append(starts[-1] + len(d))
+        else:
+            starts.append(starts[-1])
+    return starts, np.concatenate(docs) if docs else [], np.concatenate(offsets) if offsets else []
+
+def _to_little(arr):
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+class IndexWriter:
+    """
+    Streams a positional index to disk. Terms must be added in sorted order,
+    each with its postings [(doc_number, positions)] in doc number order.
+    Collection statistics are accumulated along the way and saved on close.
+    """
+    def __init__(self, index_dir, doc_ids):
+        self.index_dir = index_dir
+        self.doc_ids = doc_ids
+        self.f_post = open(os.path.join(index_dir, POSTINGS_FILE + ".tmp"), "wb")
+        self.f_pos = open(os.path.join(index_dir, POSITIONS_FILE + ".tmp"), "wb")
+        self.terms = []
+        self.post_offsets = array("Q", [0])
+        self.pos_offsets = array("Q", [0])
+        self.dfs = array("I")
+        self.stats = StatsAccumulator(len(doc_ids), len(doc_ids))
+        self.skip_starts = array("Q", [0])
+        self.skip_docs = []
+        self.skip_offsets = []
+        self.open_term = None # term being written by add_occurrences
+
+    def add(self, term, postings):
+        doc_nums = []
+        doc_gaps = []
+        tfs = []
+        pos_buf = bytearray()
+        prev = 0
+        for doc, positions in postings:
+            doc_nums.append(doc)
+            doc_gaps.append(doc - prev)
+            prev = doc
+            tfs.append(len(positions))
+            encode_varints([b - a for a, b in zip([0] + positions, positions)], pos_buf)
+        post_buf = bytearray()
+        encode_varints(doc_gaps, post_buf)
+        encode_varints(tfs, post_buf)
+
+        self.f_post.write(post_buf)
+        self.f_pos.write(pos_buf)
+        self.terms.append(term)
+        self.post_offsets.append(self.post_offsets[-1] + len(post_buf))
+        self.pos_offsets.append(self.pos_offsets[-1] + len(pos_buf))
+        self.dfs.append(len(doc_gaps))
+        self._add_skips(doc_nums, doc_gaps)
+        self.stats.add(doc_nums, tfs)
+
+    def add_occurrences(self, term, docs, positions):
+        """
+        Vectorized add for postings given as parallel arrays with one entry per
+        occurrence, sorted by (doc number, position). Consecutive calls with the same
+        term extend it, so a long posting list can be written in bounded pieces;
+        the term is finished by the next term or by close().
+        """
+        if term != self.open_term:
+            self._end_term()
+            self.open_term = term
+            self.open_docs = []
+            self.open_tfs = []
+            self.open_pos_bytes = 0
+            self.carry = None
+        docs = np.asarray(docs, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.carry is not None:
+            docs = np.concatenate((self.carry[0], docs))
+            positions = np.concatenate((self.carry[1], positions))
+        # Hold back the last doc: the next piece may continue it
+        cut = int(np.searchsorted(docs, docs[-1])) if len(docs) else 0
+        self.carry = (docs[cut:], positions[cut:])
+        self._write_occurrences(docs[:cut], positions[:cut])
+
+    def _write_occurrences(self, docs, positions):
+        if not len(docs):
+            return
+        new_doc = np.empty(len(docs), dtype=bool)
+        new_doc[0] = True
+        np.not_equal(docs[1:], docs[:-1], out=new_doc[1:])
+        starts = np.flatnonzero(new_doc)
+        gaps = positions.copy()
+        gaps[1:] -= positions[:-1]
+        gaps[starts] = positions[starts]
+        pos_buf = encode_varint_stream(gaps)
+        self.f_pos.write(pos_buf)
+        self.open_pos_bytes += len(pos_buf)
+        self.open_docs.append(docs[starts])
+        self.open_tfs.append(np.diff(np.append(starts, len(docs))))
+
+    def _end_term(self):
+        if self.open_term is None:
+            return
+        self._write_occurrences(*self.carry)
+        if not self.open_docs:
+            self.open_term = None
+            return
+        doc_nums = np.concatenate(self.open_docs)
+        tfs = np.concatenate(self.open_tfs)
+        doc_gaps = doc_nums.copy()
+        doc_gaps[1:] -= doc_nums[:-1]
+        post_buf = encode_varint_stream(doc_gaps) + encode_varint_stream(tfs)
+
+        self.f_post.write(post_buf)
+        self.terms.append(self.open_term)
+        self.post_offsets.append(self.post_offsets[-1] + len(post_buf))
+        self.pos_offsets.append(self.pos_offsets[-1] + self.open_pos_bytes)
+        self.dfs.append(len(doc_nums))
+        self._add_skips(doc_nums, doc_gaps)
+        self.stats.add(doc_nums.tolist(), tfs.tolist())
+        self.open_term = None
+
+    def _add_skips(self, doc_nums, doc_gaps):
+        if len(doc_nums) > SKIP_MIN:
+            docs, offsets = skip_entries(doc_nums, doc_gaps)
+            self.skip_docs.append(docs)
+            self.skip_offsets.append(offsets)
+            self.skip_starts.append(self.skip_starts[-1] + len(docs))
+        else:
+            self.skip_starts.append(self.skip_starts[-1])
+
+    def close(self):
+        self._end_term()
+        self.f_post.close()
+        self.f_pos.close()
+        dict_path = os.path.join(self.index_dir, DICT_FILE)
+        with open(dict_path + ".tmp", "wb") as f:
+            f.write(MAGIC)
+            f.write(_to_little(array("Q", self.post_offsets)).tobytes())
+            f.write(_to_little(array("Q", self.pos_offsets)).tobytes())
+            f.write(_to_little(array("I", self.dfs)).tobytes())
+            terms_offset = f.tell()
+            f.write("\n".join(self.terms).encode("utf-8"))
+            docs_offset = f.tell()
+            f.write("\n".join(self.doc_ids).encode("utf-8"))
+            f.write(FOOTER.pack(len(self.terms), len(self.doc_ids), terms_offset, docs_offset, MAGIC))
+        for name in (POSTINGS_FILE, POSITIONS_FILE, DICT_FILE):
+            path = os.path.join(self.index_dir, name)
+            os.replace(path + ".tmp", path)
+        save_stats(self.index_dir, self.stats.arrays())
+        save_skips(self.index_dir, self.skip_starts,
+                   np.concatenate(self.skip_docs) if self.skip_docs else [],
+                   np.concatenate(self.skip_offsets) if self.skip_offsets else [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f_post.close()
+            self.f_pos.close()
+
+class BaseIndex:
+    """
+    The postings-reader API that QueryProcessor and TFIDFRanker use:
+      terms, dfs                sorted terms and their document frequencies
+      doc_ids, doc_nums, n_docs doc number -> doc id, doc id -> number, live doc count
+      postings(term)            (doc_numbers, term_frequencies), in doc number order
+      doc_array(term)           doc numbers alone, as a sorted int64 array
+      intersect(term, docs)     the docs of a sorted int64 array that hold the term
+      positions(term, doc_num)  positions of a term in one doc, or None
+      arrays()                  all postings as (term_starts, doc_numbers, tfs) arrays
+    Subclasses set terms and dfs; dictionary lookups are shared.
+    """
+    def slot(self, term):
+        """
+        Position of term in the sorted dictionary, or None.
+        """
+        i = bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            return i
+        return None
+
+    def doc_freq(self, term):
+        i = self.slot(term)
+        return 0 if i is None else self.dfs[i]
+
+    def doc_array(self, term):
+        return np.array(self.postings(term)[0], dtype=np.int64)
+
+    def intersect(self, term, doc_nums):
+        return intersect_sorted(doc_nums, self.doc_array(term))
+
+    def __contains__(self, term):
+        return self.slot(term) is not None
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+class IndexReader(BaseIndex):
+    """
+    Memory-mapped positional index. Only the term dictionary is read at open.
+    Doc numbers and term frequencies (index.post) are decoded per term on use;
+    positions (index.pos) only when a document's positions are asked for, and a
+    term's decoded positions are then kept in a small LRU cache.
+    """
+    def __init__(self, index_dir, cache_size=256):
+        self.index_dir = index_dir
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+        self.f_dict = open(os.path.join(index_dir, DICT_FILE), "rb")
+        self.dict_mm = mmap.mmap(self.f_dict.fileno(), 0, access=mmap.ACCESS_READ)
+        n_terms, n_docs, terms_offset, docs_offset, magic = FOOTER.unpack(self.dict_mm[-FOOTER.size:])
+        if magic != MAGIC or self.dict_mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{index_dir} does not hold a binary index")
+
+        start = len(MAGIC)
+        table = 8 * (n_terms + 1)
+        self.post_offsets = self._array("Q", start, start + table)
+        self.pos_offsets = self._array("Q", start + table, start + 2 * table)
+        self.dfs = self._array("I", start + 2 * table, terms_offset)
+        self.terms = self.dict_mm[terms_offset:docs_offset].decode("utf-8").split("\n") if n_terms else []
+        self.doc_ids = self.dict_mm[docs_offset:len(self.dict_mm) - FOOTER.size].decode("utf-8").split("\n") if n_docs else []
+        self.doc_nums = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        self.n_docs = n_docs
+
+        self.f_post, self.post_mm = self._map(POSTINGS_FILE)
+        self.f_pos, self.pos_mm = self._map(POSITIONS_FILE)
+        self.skips = None # (starts, docs, offsets) from SKIPS_FILE, if it was written
+        self.load_skips()
+
+    def load_skips(self):
+        path = os.path.join(self.index_dir, SKIPS_FILE)
+        if os.path.exists(path):
+            with np.load(path) as f:
+                self.use_skips(f["starts"], f["docs"], f["offsets"])
+
+    def use_skips(self, starts, docs, offsets):
+        self.skips = (np.asarray(starts, dtype=np.int64), np.asarray(docs, dtype=np.int64),
+                      np.asarray(offsets, dtype=np.int64))
+
+    def _array(self, typecode, start, end):
+        arr = array(typecode)
+        arr.frombytes(self.dict_mm[start:end])
+        return _to_little(arr)
+
+    def _map(self, name):
+        f = open(os.path.join(self.index_dir, name), "rb")
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return f, b""
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def postings(self, term):
+        """
+        Returns (doc_numbers, term_frequencies) for a term; both empty if it is unknown.
+        """
+        i = self.slot(term)
+        if i is None:
+            return [], []
+        df = self.dfs[i]
+        values = decode_varints(self.post_mm[self.post_offsets[i]:self.post_offsets[i + 1]])
+        return list(accumulate(values[:df])), values[df:]
+
+    def doc_array(self, term):
+        i = self.slot(term)
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        start, end = self.post_offsets[i], self.post_offsets[i + 1]
+        if self.skips is not None:
+            starts, _, offsets = self.skips
+            if starts[i + 1] > starts[i]:
+                # The closing skip entry marks where the doc gaps end
+                end = start + int(offsets[starts[i + 1] - 1])
+        return np.cumsum(decode_varint_stream(self.post_mm[start:end])[:self.dfs[i]])
+
+    def intersect(self, term, doc_nums):
+        """
+        The docs of sorted doc_nums that hold term. For a long posting list and few
+        candidates, the skip pointers locate the blocks that could hold them and
+        only those blocks are decoded.
+        """
+        i = self.slot(term)
+        if i is None or not len(doc_nums):
+            return np.zeros(0, dtype=np.int64)
+        if self.skips is None or self.dfs[i] <= SKIP_MIN or len(doc_nums) * SKIP_INTERVAL > self.dfs[i]:
+            return intersect_sorted(doc_nums, self.doc_array(term))
+        starts, skip_docs, skip_offsets = self.skips
+        s, e = starts[i], starts[i + 1]
+        if s == e:
+            return intersect_sorted(doc_nums, self.doc_array(term))
+        firsts = skip_docs[s:e]
+        offsets = skip_offsets[s:e]
+        # Block of each candidate: the last block starting at or before it
+        blocks = np.searchsorted(firsts[:-1], doc_nums, side="right") - 1
+        inside = (blocks >= 0) & (doc_nums <= firsts[-1])
+        needed = np.unique(blocks[inside])
+        if not len(needed):
+            return np.zeros(0, dtype=np.int64)
+        base = self.post_offsets[i]
+        buf = b"".join(self.post_mm[base + offsets[b]:base + offsets[b + 1]] for b in needed.tolist())
+        gaps = decode_varint_stream(buf)
+        counts = np.minimum(self.dfs[i] - needed * SKIP_INTERVAL, SKIP_INTERVAL)
+        block_starts = np.concatenate(([0], np.cumsum(counts)))
+        # Each block restarts from its skip entry's doc number
+        gaps[block_starts[:-1]] = firsts[needed]
+        owner = np.repeat(np.arange(len(needed)), counts)
+        docs = _segment_cumsum(gaps, block_starts, owner)
+        return intersect_sorted(doc_nums[inside], docs)
+
+    def arrays(self):
+        """
+        All postings at once: (term_starts, doc_numbers, term_frequencies) as NumPy
+        arrays, term i owning entries term_starts[i]:term_starts[i + 1].
+        """
+        dfs = np.frombuffer(self.dfs, dtype=np.uint32).astype(np.int64)
+        n_postings = int(dfs.sum())
+        term_starts = np.concatenate(([0], np.cumsum(dfs)))
+        # Postings stream: per term, df doc gaps then df term frequencies
+        values = decode_varint_stream(self.post_mm[:])
+        owner = np.repeat(np.arange(len(dfs)), dfs)
+        first = 2 * term_starts[owner] + (np.arange(n_postings) - term_starts[owner])
+        docs = _segment_cumsum(values[first], term_starts, owner).astype(np.uint32)
+        tfs = values[first + dfs[owner]].astype(np.uint32)
+        return term_starts, docs, tfs
+
+    def _term_positions(self, term, i):
+        """
+        (doc_numbers, position starts, position gaps) for the term in slot i, through
+        the LRU cache. index.pos is only read here, i.e. for phrase checks and page
+        lookups; ranking and boolean queries need nothing beyond postings().
+        """
+        entry = self.cache.get(term)
+        if entry is not None:
+            self.cache.move_to_end(term)
+            return entry
+
+        doc_nums, tfs = self.postings(term)
+        gaps = decode_varint_stream(self.pos_mm[self.pos_offsets[i]:self.pos_offsets[i + 1]])
+        entry = (doc_nums, [0, *accumulate(tfs)], gaps)
+        self.cache[term] = entry
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entry
+
+    def positions(self, term, doc_num):
+        i = self.slot(term)
+        if i is None:
+            return None
+        doc_nums, starts, gaps = self._term_positions(term, i)
+        k = bisect_left(doc_nums, doc_num)
+        if k == len(doc_nums) or doc_nums[k] != doc_num:
+            return None
+        return list(accumulate(gaps[starts[k]:starts[k + 1]].tolist()))
+
+    def close(self):
+        for mm in (self.dict_mm, self.post_mm, self.pos_mm):
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+        for f in (self.f_dict, self.f_post, self.f_pos):
+            f.close()
+
+def decode_varint_stream(buf):
+    """
+    Vectorized decode_varints for a whole stream, as an int64 NumPy array.
+    """
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if not len(b):
+        return np.zeros(0, dtype=np.int64)
+    last = b < 0x80
+    if last.all():
+        return b.astype(np.int64)
+    ends = np.flatnonzero(last)
+    group = np.cumsum(last) - last  # value each byte belongs to
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shift = (np.arange(len(b)) - starts[group]) * 7
+    # Values fit in 35 bits, well inside float64's exact integer range
+    weights = (b & 0x7F) * np.exp2(shift)
+    return np.bincount(group, weights=weights, minlength=len(ends)).astype(np.int64)
+
+def _segment_cumsum(gaps, starts, owner):
+    """
+    Running sums of gaps that restart at every slice starts[k]:starts[k + 1]
+    (owner[j] being the slice of gaps[j]).
+    """
+    total = np.cumsum(gaps)
+    return total - np.concatenate(([0], total))[starts[owner]]
+
+class MemoryIndex(BaseIndex):
+    """
+    Doc numbers and term frequencies of every posting decoded into contiguous NumPy
+    uint32 buffers, for servers that keep the index in RAM; term i owns postings
+    term_starts[i]:term_starts[i + 1]. Ranking and boolean queries only need these.
+    Positions stay in the memory-mapped index.pos and are read through an
+    IndexReader when a phrase check or page lookup asks for them.
+    """
+    def __init__(self, index_dir):
+        self.reader = IndexReader(index_dir)
+        self.terms = self.reader.terms
+        self.doc_ids = self.reader.doc_ids
+        self.doc_nums = self.reader.doc_nums
+        self.n_docs = self.reader.n_docs
+        self.dfs = self.reader.dfs
+        self.term_starts, self.docs, self.tfs = self.reader.arrays()
+
+    def arrays(self):
+        return self.term_starts, self.docs, self.tfs
+
+    def postings(self, term):
+        i = self.slot(term)
+        if i is None:
+            return [], []
+        a, b = self.term_starts[i], self.term_starts[i + 1]
+        return self.docs[a:b].tolist(), self.tfs[a:b].tolist()
+
+    def doc_array(self, term):
+        i = self.slot(term)
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.docs[self.term_starts[i]:self.term_starts[i + 1]].astype(np.int64)
+
+    def positions(self, term, doc_num):
+        return self.reader.positions(term, doc_num)
+
+    def nbytes(self):
+        return sum(arr.nbytes for arr in (self.term_starts, self.docs, self.tfs))
+
+    def close(self):
+        self.reader.close()
+
+def has_binary_index(index_dir):
+    return os.path.exists(os.path.join(index_dir, DICT_FILE))
+
+def convert_json_index(index_dir):
+    """
+    Writes the binary index for an index dir that only has positional_index.json.gz.
+    Doc numbers follow corpus.jsonl, with any other indexed docs after them.
+    """
+    print("Converting positional_index.json.gz to the binary format...")
+    with gzip.open(os.path.join(index_dir, "positional_index.json.gz"), "rt", encoding="utf-8") as f:
+        positional_index = json.load(f)
+
+    doc_nums = {}
+    corpus_path = os.path.join(index_dir, "corpus.jsonl")
+    if os.path.exists(corpus_path):
+        with open(corpus_path, "r", encoding="utf-8") as f:
+            for line in f:
+                doc_nums.setdefault(json.loads(line)["id"], len(doc_nums))
+    for doc_postings in positional_index.values():
+        for doc_id in doc_postings:
+            doc_nums.setdefault(doc_id, len(doc_nums))
+
+    with IndexWriter(index_dir, list(doc_nums)) as writer:
+        for term in sorted(positional_index):
+            postings = sorted((doc_nums[doc_id], positions) for doc_id, positions in positional_index[term].items())
+            writer.add(term, postings)
+
+def open_index(index_dir, in_memory=False):
+    """
+    Opens the binary index in index_dir, converting a legacy JSON index first if needed.
+    Returns (reader, stats). Stats and skip pointers missing from an older build are
+    computed in memory. The legacy conversion is the only write: it happens once, in
+    an index dir from before generations (builds publish binary generations).
+    With in_memory the postings are loaded into a MemoryIndex instead of read lazily.
+    """
+    if not has_binary_index(index_dir):
+        convert_json_index(index_dir)
+    reader = MemoryIndex(index_dir) if in_memory else IndexReader(index_dir)
+    stats = load_stats(index_dir)
+    if stats is None:
+        print("Computing collection statistics...")
+        stats = compute_stats(reader)
+    disk = reader.reader if in_memory else reader
+    if disk.skips is None:
+        print("Computing skip pointers...")
+        disk.use_skips(*compute_skips(disk))
+    return reader, stats
@@ -1,25 +1,133 @@
 import json
-import gzip
 import re
 import os
 import fnmatch
 import difflib
-from clean import clean_text
+import heapq
+import numpy as np
+from collections.abc import Sequence
+from analyzer import AnalyzerCache
 from tfidf import TFIDFRanker
+from impact import RANKINGS, ImpactRanker
+from champions import TIER_MIN, ChampionTiers
+from boolean import parse_query
+from intersect import EMPTY, difference_sorted, union_sorted
+from pages import page_for_offset
+from docstore import DocStore
+
+# Query tokens: parentheses, quoted phrases, and words (which end at a parenthesis)
+QUERY_TOKENS = re.compile(r'\(|\)|"[^"]+"|[^\s()]+')
+
+class SearchResults(Sequence):
+    """
+    Ranked (doc number, score) pairs. Result dicts (id, score, path, snippet) are only
+    built for the entries that are read, e.g. the page of results being shown.
+    When the query asked for the top k only, len() is still the number of matching
+    documents (total) while just the first k can be read.
+    """
+    def __init__(self, qp, ranked, total=None):
+        self.qp = qp
+        self.ranked = ranked
+        self.total = len(ranked) if total is None else total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.qp.make_result(doc_num, score) for doc_num, score in self.ranked[i]]
+        doc_num, score = self.ranked[i]
+        return self.qp.make_result(doc_num, score)
 
 class QueryProcessor:
-    def __init__(self, index_dir="data/index"):
+    def __init__(self, index_dir="data/index", in_memory=False, ranking="tfidf", tiered=False):
         self.index_dir = index_dir
-        self.ranker = TFIDFRanker(index_dir)
+        self.ranker = TFIDFRanker(index_dir, in_memory)
+        # Scorer for ranked queries: the exact TF-IDF ranker or impact postings (see RANKINGS)
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking {ranking!r}, expected one of {', '.join(RANKINGS)}")
+        self.ranking = ranking
+        scheme, _, bits = ranking.partition("-")
+        self.scorer = self.ranker if ranking == "tfidf" else ImpactRanker(self.ranker, scheme, quantized=bool(bits))
+        # Champion lists ranked ahead of the other matches (see rank); approximate, so opt-in
+        self.champions = ChampionTiers(self.ranker) if tiered else None
         self.index = self.ranker.index
-        self.vocab = list(self.index.keys())
+        self.vocab = list(self.index.terms)
+        # Analyzed query terms, shared by spelling correction, suggestions and query parsing
+        self.term_cache = AnalyzerCache()
+        self.wildcard_cache = {} # wildcard pattern -> matching vocabulary terms
+        self.live_docs = None # sorted live doc numbers, for NOT (see all_docs)
         
-        # Load corpus for snippets (optional, maybe just paths)
-        self.corpus = {}
-        with open(os.path.join(index_dir, "corpus.jsonl"), "r", encoding="utf-8") as f:
-            for line in f:
-                doc = json.loads(line)
-                self.corpus[doc['id']] = doc
+        segments = self.ranker.segments
+        if segments is not None:
+            # Incrementally built index: documents and pages come from the live segments
+            self.docs = segments.docs
+            self.page_starts = segments.page_starts
+            return
+
+        # Document records (id, path) and text, read on demand by doc number
+        data_dir = self.ranker.data_dir
+        self.docs = DocStore(data_dir)
+
+        # Token position at which each PDF page starts (only for docs extracted with page sidecars)
+        self.page_starts = {}
+        pages_path = os.path.join(data_dir, "pages.json")
+        if os.path.exists(pages_path):
+            with open(pages_path, "r", encoding="utf-8") as f:
+                self.page_starts = json.load(f)
+
+    def get_doc(self, doc_id):
+        """
+        Returns the record (id, path) of a document, or None if it is unknown.
+        """
+        doc_num = self.index.doc_nums.get(doc_id)
+        if doc_num is None:
+            return None
+        return self.docs.get(doc_num)
+
+    def get_text(self, doc_id):
+        """
+        Returns the full text of a document, or None if it is unknown.
+        """
+        doc_num = self.index.doc_nums.get(doc_id)
+        if doc_num is None:
+            return None
+        return self.docs.get_text(doc_num)
+
+    def get_snippet(self, doc_id, length=200):
+        return self.snippet(self.index.doc_nums.get(doc_id), length)
+
+    def snippet(self, doc_num, length=200):
+        text = self.docs.get_prefix(doc_num, length) if doc_num is not None else None
+        return (text or "")[:length] + "..." # simple snippet
+
+    def make_result(self, doc_num, score):
+        doc_info = self.docs.get(doc_num) or {}
+        return {
+            "id": self.index.doc_ids[doc_num],
+            "score": score,
+            "path": doc_info.get("path", ""),
+            "snippet": self.snippet(doc_num)
+        }
+
+    def first_hit_page(self, doc_id, terms):
+        """
+        Returns the 1-based PDF page holding the earliest occurrence of any of the terms,
+        or None if it cannot be determined.
+        """
+        starts = self.page_starts.get(doc_id)
+        doc_num = self.index.doc_nums.get(doc_id)
+        if not starts or doc_num is None:
+            return None
+        first = None
+        for term in terms:
+            for t in term.split():
+                positions = self.index.positions(t, doc_num)
+                if positions and (first is None or positions[0] < first):
+                    first = positions[0]
+        if first is None:
+            return None
+        return page_for_offset(starts, first)
 
     def correct_term(self, term):
         """
@@ -34,7 +142,7 @@ class QueryProcessor:
             return term
             
         # Clean term to match vocab format (lowercase, no punctuation)
-        ct = clean_text(term)
+        ct = self.term_cache.analyze(term)
         if not ct:
             return term # Stopword or empty, return as is
         
@@ -59,7 +167,7 @@ class QueryProcessor:
         if '*' in term or term.upper() in ('AND', 'OR', 'NOT'):
             return []
             
-        ct = clean_text(term)
+        ct = self.term_cache.analyze(term)
         if not ct:
             return []
             
@@ -76,7 +184,7 @@ class QueryProcessor:
         if not query_str:
             return {}
             
-        tokens = re.findall(r'\(|\)|"[^"]+"|\S+', query_str)
+        tokens = QUERY_TOKENS.findall(query_str)
         suggestions = {}
         
         for t in tokens:
@@ -98,7 +206,7 @@ class QueryProcessor:
             return query_str
 
         # Tokenize preserving quotes and parens
-        tokens = re.findall(r'\(|\)|"[^"]+"|\S+', query_str)
+        tokens = QUERY_TOKENS.findall(query_str)
         corrected_tokens = []
         
         for t in tokens:
@@ -115,56 +223,83 @@ class QueryProcessor:
     def expand_wildcard(self, term):
         if '*' not in term:
             return [term]
-        # Regex matching for wildcard
-        pattern = fnmatch.translate(term)
-        regex = re.compile(pattern)
-        matches = [w for w in self.vocab if regex.match(w)]
+        matches = self.wildcard_cache.get(term)
+        if matches is None:
+            # Regex matching for wildcard
+            pattern = fnmatch.translate(term)
+            regex = re.compile(pattern)
+            matches = [w for w in self.vocab if regex.match(w)]
+            self.wildcard_cache[term] = matches
         return matches
 
     def get_postings(self, term):
+        """
+        Doc ids matching a term (see get_doc_nums).
+        """
+        doc_ids = self.index.doc_ids
+        return {doc_ids[d] for d in self.get_doc_nums(term)}
+
+    def get_phrase_postings(self, phrase_tokens):
+        """
+        Doc ids matching a phrase (see get_phrase_doc_nums).
+        """
+        doc_ids = self.index.doc_ids
+        return {doc_ids[d] for d in self.get_phrase_doc_nums(phrase_tokens)}
+
+    def get_doc_nums(self, term):
+        """
+        Doc numbers matching a term or wildcard, as a set (see doc_array).
+        """
+        return set(self.doc_array(term).tolist())
+
+    def get_phrase_doc_nums(self, phrase_tokens):
+        return set(self.phrase_doc_array(phrase_tokens).tolist())
+
+    def doc_array(self, term, within=None):
+        """
+        Sorted array of the doc numbers matching a term, restricted to the sorted
+        array within if given (see BaseIndex.intersect).
+        """
         # Handle wildcards (assuming caller handled enable_wildcards check or passed raw term)
         if '*' in term:
-            expanded = self.expand_wildcard(term)
-            result = set()
-            for t in expanded:
-                if t in self.index:
-                    result.update(self.index[t].keys())
-            return result
-        
-        if term in self.index:
-            return set(self.index[term].keys())
-        return set()
+            return union_sorted([self.doc_array(t, within) for t in self.expand_wildcard(term)])
+        if within is None:
+            return self.index.doc_array(term)
+        return self.index.intersect(term, within)
 
-    def get_phrase_postings(self, phrase_tokens):
+    def phrase_doc_array(self, phrase_tokens, within=None):
         if not phrase_tokens:
-            return set()
+            return EMPTY
         
-        # Intersection of docs
-        docs = self.get_postings(phrase_tokens[0])
-        for token in phrase_tokens[1:]:
-            docs &= self.get_postings(token)
+        # Intersection of docs, rarest token first
+        docs = within
+        for token in sorted(set(phrase_tokens), key=self.index.doc_freq):
+            docs = self.doc_array(token, docs)
+            if not len(docs):
+                return EMPTY
             
         # Check positions
-        final_docs = set()
-        for doc_id in docs:
+        final_docs = []
+        for doc_num in docs.tolist():
             # Check if tokens are adjacent
             # We need the positions for each token in this doc
             # positions is list of list of positions
             positions = []
             valid_doc = True
             for token in phrase_tokens:
-                if token not in self.index or doc_id not in self.index[token]:
+                token_positions = self.index.positions(token, doc_num)
+                if token_positions is None:
                     valid_doc = False; break
-                positions.append(self.index[token][doc_id])
+                positions.append(token_positions)
             
             if not valid_doc: continue
 
             # Find if there is a sequence p1, p2, p3 such that p2=p1+1, p3=p2+1...
             # We can use a recursive check or iterative
             if self.has_sequence(positions):
-                final_docs.add(doc_id)
+                final_docs.append(doc_num)
         
-        return final_docs
+        return np.array(final_docs, dtype=np.int64)
 
     def has_sequence(self, positions_list):
         # positions_list: [[1, 10], [2, 12], [3]] for phrase "A B C"
@@ -182,22 +317,31 @@ class QueryProcessor:
                 return False
         return True
 
-    def process_query(self, query_str, enable_ranking=True, use_cosine=False, enable_wildcards=True):
+    def parse_tokens(self, query_str, enable_wildcards=True):
+        """
+        Tokenizes and analyzes a query. Returns (parsed, ranking_terms, display_terms):
+        the abstract tokens parse_query() builds the tree from, the analyzed terms to
+        rank by, and the terms to highlight (phrases joined by spaces).
+        """
         # Tokenize preserving quotes
-        tokens = re.findall(r'\(|\)|"[^"]+"|\S+', query_str)
+        tokens = QUERY_TOKENS.findall(query_str)
         
         ranking_terms = []
         display_terms = []
         
-        # Step 1: Parse into abstract tokens (TERM, PHRASE, OP)
+        # Step 1: Parse into abstract tokens (TERM, PHRASE, WILDCARD, OP, parentheses)
         parsed = []
         for t in tokens:
             if t.upper() in ["AND", "OR", "NOT"]:
                 parsed.append(("OP", t.upper()))
+            elif t == "(":
+                parsed.append(("LPAREN", t))
+            elif t == ")":
+                parsed.append(("RPAREN", t))
             elif t.startswith('"') and t.endswith('"'):
                 content = t[1:-1]
                 # Clean phrase content
-                pt = clean_text(content)
+                pt = self.term_cache.analyze(content)
                 parsed.append(("PHRASE", pt))
                 ranking_terms.extend(pt)
                 display_terms.append(" ".join(pt))
@@ -209,73 +353,136 @@ class QueryProcessor:
                      ranking_terms.extend(expanded)
                      display_terms.extend(expanded)
                 else:
-                    ct = clean_text(t)
+                    ct = self.term_cache.analyze(t)
                     if ct:
                         # If multiple tokens (e.g. "judge-made" -> "judge", "made"), add all
                         for term in ct:
                             parsed.append(("TERM", term))
                             ranking_terms.append(term)
                             display_terms.append(term)
-        
-        # Step 2: Evaluate Boolean
-        if not parsed:
-            return [], []
+        return parsed, ranking_terms, display_terms
 
-        current_docs = self.evaluate_atom(parsed[0])
-        idx = 1
-        
-        while idx < len(parsed):
-            item_type, item_val = parsed[idx]
-            
-            if item_type == "OP":
-                op = item_val
-                idx += 1
-                if idx >= len(parsed): break
-                next_atom = parsed[idx]
-                next_docs = self.evaluate_atom(next_atom)
-                
-                if op == "AND":
-                    current_docs &= next_docs
-                elif op == "OR":
-                    current_docs |= next_docs
-                elif op == "NOT":
-                    current_docs -= next_docs
-            else:
-                # Implicit AND
-                next_docs = self.evaluate_atom((item_type, item_val))
-                current_docs &= next_docs
-            
-            idx += 1
+    def query_terms(self, query_str, enable_wildcards=True):
+        """
+        The display terms of a query (as returned by process_query), without
+        evaluating it: for highlighting a document opened from the results.
+        """
+        return self.parse_tokens(query_str, enable_wildcards)[2]
+
+    def process_query(self, query_str, enable_ranking=True, use_cosine=False, enable_wildcards=True, k=None):
+        # k: rank only the best k matches (e.g. up to the end of the page being shown)
+        parsed, ranking_terms, display_terms = self.parse_tokens(query_str, enable_wildcards)
+
+        # Step 2: Build the query tree (see boolean.py) and evaluate it with the planner
+        tree = parse_query(parsed)
+        if tree is None:
+            # Nothing to search for (e.g. only operators or stopwords)
+            return SearchResults(self, [], 0), display_terms
+        # The only set built for the query: the candidates handed to ranking
+        current_docs = set(self.evaluate(tree).tolist())
             
-        # Step 3: Rank
+        # Step 3: Rank (on doc numbers; names are resolved when results are read)
         if enable_ranking:
-            ranked_results = self.ranker.score(ranking_terms, current_docs, use_cosine=use_cosine)
+            ranked_results = self.rank(ranking_terms, current_docs, use_cosine, k)
         else:
             # No ranking, just return docs with 0 score (or 1.0)
-            ranked_results = [(doc_id, 1.0) for doc_id in sorted(list(current_docs))]
-        
-        # Return enriched results
-        output = []
-        for doc_id, score in ranked_results:
-            doc_info = self.corpus.get(doc_id, {})
-            output.append({
-                "id": doc_id,
-                "score": score,
-                "path": doc_info.get("path", ""),
-                "snippet": doc_info.get("text", "")[:200] + "..." # simple snippet
-            })
+            doc_ids = self.index.doc_ids
+            if k is None:
+                doc_nums = sorted(current_docs, key=doc_ids.__getitem__)
+            else:
+                doc_nums = heapq.nsmallest(k, current_docs, key=doc_ids.__getitem__)
+            ranked_results = [(doc_num, 1.0) for doc_num in doc_nums]
             
-        return output, display_terms
+        return SearchResults(self, ranked_results, len(current_docs)), display_terms
+
+    def rank(self, ranking_terms, candidate_docs, use_cosine=False, k=None):
+        """
+        Ranks candidate_docs, the first k of them if k is given. With champion tiers,
+        a query whose champion lists hold at least TIER_MIN candidates ranks those
+        first and the other candidates after them. The choice does not depend on k,
+        so every page of a query is a slice of the same order.
+        """
+        if self.champions is None:
+            return self.scorer.score(ranking_terms, candidate_docs, use_cosine=use_cosine, k=k)
+        # bm25 ignores use_cosine, so its tier is the plain weight order
+        kind = "cosine" if use_cosine and self.ranking.startswith("tfidf") else "tfidf"
+        tier = self.champions.candidates(ranking_terms, candidate_docs, kind)
+        if len(tier) < TIER_MIN or len(tier) == len(candidate_docs):
+            return self.scorer.score(ranking_terms, candidate_docs, use_cosine=use_cosine, k=k)
+        ranked = self.scorer.score(ranking_terms, tier, use_cosine=use_cosine, k=k)
+        if k is None or len(ranked) < k:
+            rest = candidate_docs - tier
+            ranked += self.scorer.score(ranking_terms, rest, use_cosine=use_cosine, k=None if k is None else k - len(ranked))
+        return ranked
+
+    def estimate(self, node):
+        """
+        Upper bound on the number of documents a query tree node matches, from
+        document frequencies alone (no postings are read).
+        """
+        kind, value = node
+        if kind == "TERM":
+            return self.index.doc_freq(value)
+        if kind == "WILDCARD":
+            return min(sum(self.index.doc_freq(t) for t in self.expand_wildcard(value)), self.index.n_docs)
+        if kind == "PHRASE":
+            return min((self.index.doc_freq(t) for t in value), default=0)
+        if kind == "AND":
+            positives = [self.estimate(child) for child in value if child[0] != "NOT"]
+            return min(positives) if positives else self.index.n_docs
+        if kind == "OR":
+            return min(sum(self.estimate(child) for child in value), self.index.n_docs)
+        return self.index.n_docs # NOT
+
+    def all_docs(self):
+        """
+        Sorted array of every live doc number.
+        """
+        if self.live_docs is None:
+            self.live_docs = np.array(sorted(self.index.doc_nums.values()), dtype=np.int64)
+        return self.live_docs
+
+    def evaluate(self, node, within=None):
+        """
+        Sorted array of the doc numbers matching a query tree node, restricted to
+        the sorted array within if given. AND evaluates its operands rarest first,
+        each only within the docs left so far, and applies its NOT operands last,
+        as differences against that smallest intermediate result. Only the rarest
+        operand's postings are decoded in full; NOT on its own is taken against
+        all (or the within) documents.
+        """
+        kind, value = node
+        if kind == "NOT":
+            base = self.all_docs() if within is None else within
+            return difference_sorted(base, self.evaluate(value, base))
+        if kind == "OR":
+            return union_sorted([self.evaluate(child, within) for child in value])
+        if kind == "AND":
+            positives = sorted((child for child in value if child[0] != "NOT"), key=self.estimate)
+            negatives = sorted((child[1] for child in value if child[0] == "NOT"), key=self.estimate, reverse=True)
+            current = within
+            if not positives:
+                current = self.all_docs() if within is None else within
+            for child in positives:
+                current = self.evaluate(child, current)
+                if not len(current):
+                    return current
+            for child in negatives:
+                current = difference_sorted(current, self.evaluate(child, current))
+                if not len(current):
+                    break
+            return current
+        return self.evaluate_atom(node, within)
 
-    def evaluate_atom(self, atom):
+    def evaluate_atom(self, atom, within=None):
         atype, aval = atom
         if atype == "TERM":
-            return self.get_postings(aval)
+            return self.doc_array(aval, within)
         elif atype == "WILDCARD":
-            return self.get_postings(aval)
+            return self.doc_array(aval, within)
         elif atype == "PHRASE":
-            return self.get_phrase_postings(aval)
-        return set()
+            return self.phrase_doc_array(aval, within)
+        return EMPTY
 
 if __name__ == "__main__":
     # Test
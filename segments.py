@@ -0,0 +1,731 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import numpy as np
+from bisect import bisect_right
+from analyzer import analyze_batch
+from pages import pages_path_for, read_page_offsets, split_pages
+from textstore import PackReader, PackWriter
+from postings import DICT_FILE, POSTINGS_FILE, POSITIONS_FILE, SKIPS_FILE, BaseIndex, IndexReader, IndexWriter, MemoryIndex
+from docstore import CORPUS_FILE, OFFSETS_FILE, CorpusWriter, DocStore
+from generations import resolve_index_dir
+from stats import STATS_FILES, compute_stats, load_stats, save_stats
+
+# Incremental index layout (inside the index dir):
+#   segments.json      manifest: live segments with their tombstones, and the
+#                      segment and source signature of every indexed document
+#   segments/<name>/   one immutable segment, with the same artifacts as a full build
+#   live/<name>/       collection statistics of the live documents, written with each
+#                      manifest that changes them and named in it ("stats"): the live
+#                      terms (vocab.txt) and their dfs (live_dfs.npy), the stats.py
+#                      arrays and the ranker's weight matrix (see tfidf.save_weights)
+# A document is live in exactly one segment; re-indexing it tombstones the old copy.
+MANIFEST = "segments.json"
+SEGMENTS_DIR = "segments"
+LIVE_DIR = "live"
+LIVE_DFS_FILE = "live_dfs.npy"
+LOCK = "segments.lock"
+MERGE_LOCK = "merge.lock"
+ARTIFACTS = (CORPUS_FILE, "preprocess.json", DICT_FILE, POSTINGS_FILE, POSITIONS_FILE, "pages.json", "texts.pack")
+OPTIONAL_ARTIFACTS = (OFFSETS_FILE, SKIPS_FILE) + STATS_FILES
+
+LOCK_TIMEOUT = 600       # seconds a writer waits for a lock held by a running process
+STALE_LOCK_AGE = 10      # seconds after which a lock file without a PID is abandoned
+OPEN_ATTEMPTS = 10       # times a reader re-opens the segments after a merge removed one
+MERGE_FACTOR = 10        # merge once this many segments share a size tier
+MAX_DELETED_RATIO = 0.5  # rewrite a segment on its own once this share of its docs is deleted
+
+def pid_alive(pid):
+    """
+    Whether a process with this PID is running on this machine.
+    """
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5 # access denied: another user's process
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259 # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def file_age(path):
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0
+
+class DirLock:
+    """
+    Lock file created with O_EXCL, so it works on every platform. It holds the PID of
+    its owner, and a lock whose process is no longer running (a crashed ingest or
+    merge) is removed. Waits up to timeout seconds (forever if None) for a running
+    owner and then raises TimeoutError. Only writers (ingest and merge) take locks;
+    readers never need write access to the index dir.
+    """
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def acquire(self):
+        start = time.time()
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self.break_stale():
+                    continue
+                if self.timeout is not None and time.time() - start >= self.timeout:
+                    raise TimeoutError(f"{self.path} is held by process {self.owner()}")
+                time.sleep(0.1)
+                continue
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            os.close(fd)
+            return
+
+    def owner(self):
+        """
+        PID written in the lock file, or None if it is gone or not written yet.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def break_stale(self):
+        """
+        Removes the lock if its owner is no longer running, and returns whether it did.
+        Waiters take a second O_EXCL file to do so, so only one of them removes a
+        stale lock and none removes a lock that was taken again in the meantime.
+        """
+        pid = self.owner()
+        if pid is None:
+            # Created but no PID written: its owner died in between
+            if file_age(self.path) < STALE_LOCK_AGE:
+                return False
+        elif pid_alive(pid):
+            return False
+        breaker = self.path + ".break"
+        try:
+            os.close(os.open(breaker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            if file_age(breaker) >= STALE_LOCK_AGE:
+                os.remove(breaker)
+            return False
+        try:
+            if self.owner() != pid:
+                return False
+            print(f"Removing stale lock {self.path} (process {pid} is not running)")
+            os.remove(self.path)
+            return True
+        finally:
+            os.remove(breaker)
+
+    def release(self):
+        os.remove(self.path)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+def is_segmented(index_dir):
+    return os.path.exists(os.path.join(index_dir, MANIFEST))
+
+def segment_dir(index_dir, name):
+    return os.path.join(index_dir, SEGMENTS_DIR, name)
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(index_dir, manifest):
+    path = os.path.join(index_dir, MANIFEST)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def clear_segments(index_dir):
+    """
+    Drops the segmented index, e.g. before a full rebuild replaces it.
+    """
+    path = os.path.join(index_dir, MANIFEST)
+    if os.path.exists(path):
+        os.remove(path)
+    shutil.rmtree(os.path.join(index_dir, SEGMENTS_DIR), ignore_errors=True)
+    shutil.rmtree(os.path.join(index_dir, LIVE_DIR), ignore_errors=True)
+
+def source_signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def next_segment_name(manifest):
+    name = f"seg-{manifest['next_segment']:06d}"
+    manifest["next_segment"] += 1
+    return name
+
+def write_segment(seg_dir, docs):
+    """
+    Writes docs [(doc_id, path, text, tokens, page_starts)] into seg_dir with the same
+    artifacts as a full build. Returns the number of documents written.
+    """
+    os.makedirs(seg_dir)
+    doc_ids = []
+    preprocess_data = {}
+    positional_index = {}
+    page_starts = {}
+
+    with CorpusWriter(seg_dir) as corpus, PackWriter(os.path.join(seg_dir, "texts.pack")) as texts:
+        for doc_id, path, text, tokens, starts in docs:
+            corpus.add({"id": doc_id, "path": path})
+            texts.add(doc_id, text)
+            doc_num = len(doc_ids)
+            doc_ids.append(doc_id)
+            preprocess_data[doc_id] = tokens
+            if starts:
+                page_starts[doc_id] = starts
+            for pos, term in enumerate(tokens):
+                if term not in positional_index:
+                    positional_index[term] = {}
+                if doc_num not in positional_index[term]:
+                    positional_index[term][doc_num] = []
+                positional_index[term][doc_num].append(pos)
+
+    with open(os.path.join(seg_dir, "preprocess.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(preprocess_data))
+    with IndexWriter(seg_dir, doc_ids) as writer:
+        for term in sorted(positional_index):
+            writer.add(term, positional_index[term].items())
+    with open(os.path.join(seg_dir, "pages.json"), "w", encoding="utf-8") as f:
+        json.dump(page_starts, f)
+    with open(os.path.join(seg_dir, "vocab.txt"), "w", encoding="utf-8") as f:
+        for term in sorted(positional_index):
+            f.write(term + "\n")
+    return len(doc_ids)
+
+def read_segment(seg_dir, skip=()):
+    """
+    Yields (doc_id, path, text, tokens, page_starts) for each document of a segment not in skip.
+    """
+    with open(os.path.join(seg_dir, "preprocess.json"), "r", encoding="utf-8") as f:
+        preprocess_data = json.load(f)
+    with open(os.path.join(seg_dir, "pages.json"), "r", encoding="utf-8") as f:
+        page_starts = json.load(f)
+    with open(os.path.join(seg_dir, CORPUS_FILE), "r", encoding="utf-8") as f_corpus, \
+            PackReader(os.path.join(seg_dir, "texts.pack")) as texts:
+        for line in f_corpus:
+            doc = json.loads(line)
+            doc_id = doc["id"]
+            if doc_id in skip:
+                continue
+            yield doc_id, doc.get("path", ""), texts.get(doc_id), preprocess_data[doc_id], page_starts.get(doc_id)
+
+def analyze_docs(txt_files, workers=1):
+    """
+    Yields (doc_id, path, text, tokens, page_starts) for each .txt file. Pages are
+    analyzed separately, as in build.py, so page starts line up with token positions.
+    """
+    docs = []
+    for txt_file in txt_files:
+        doc_id = os.path.splitext(os.path.basename(txt_file))[0]
+        with open(txt_file, "r", encoding="utf-8") as f:
+            text = f.read()
+        docs.append((doc_id, txt_file, text, read_page_offsets(pages_path_for(txt_file))))
+
+    results = analyze_batch((page for _, _, text, offsets in docs for page in split_pages(text, offsets)), workers=workers)
+    for doc_id, path, text, offsets in docs:
+        if offsets:
+            tokens = []
+            starts = []
+            for _ in offsets:
+                starts.append(len(tokens))
+                tokens.extend(next(results))
+        else:
+            tokens = next(results)
+            starts = None
+        yield doc_id, path, text, tokens, starts
+
+def write_vocab(index_dir, manifest):
+    """
+    Rewrites the top-level vocab.txt as the union of the segment vocabularies
+    (terms only found in deleted documents drop out once their segment is merged).
+    """
+    vocab = set()
+    for segment in manifest["segments"]:
+        with open(os.path.join(segment_dir(index_dir, segment["name"]), "vocab.txt"), "r", encoding="utf-8") as f:
+            vocab.update(line.rstrip("\n") for line in f)
+    with open(os.path.join(index_dir, "vocab.txt"), "w", encoding="utf-8") as f:
+        for term in sorted(vocab):
+            f.write(term + "\n")
+
+def live_dir(index_dir, name):
+    return os.path.join(index_dir, LIVE_DIR, name)
+
+def write_live_stats(index_dir, manifest):
+    """
+    Writes the statistics of the live documents of manifest into a new live dir and
+    names it in the manifest, so readers load them instead of decoding every posting.
+    Writers call this under the segment lock, before saving the manifest, and call
+    drop_live_stats once the manifest is saved.
+    """
+    # tfidf imports this module
+    from tfidf import cosine_bounds, save_weights, weight_matrix
+    readers = [(IndexReader(segment_dir(index_dir, segment["name"])), set(segment["deleted"]))
+               for segment in manifest["segments"]]
+    index = SegmentIndex(readers)
+    try:
+        name = f"stats-{manifest.get('next_stats', 0):06d}"
+        manifest["next_stats"] = manifest.get("next_stats", 0) + 1
+        out_dir = live_dir(index_dir, name)
+        os.makedirs(out_dir)
+        with open(os.path.join(out_dir, "vocab.txt"), "w", encoding="utf-8") as f:
+            for term in index.terms:
+                f.write(term + "\n")
+        np.save(os.path.join(out_dir, LIVE_DFS_FILE), np.array(index.dfs, dtype=np.uint32))
+        stats = compute_stats(index)
+        save_stats(out_dir, stats)
+        weights = weight_matrix(index, stats[2])
+        save_weights(out_dir, weights, cosine_bounds(weights, stats[1]))
+    finally:
+        index.close()
+    manifest["stats"] = name
+
+def drop_live_stats(index_dir, manifest):
+    """
+    Removes the live dirs the saved manifest no longer names. A reader still opening
+    one sees a missing file and opens the segments again (see SegmentSet).
+    """
+    for name in os.listdir(os.path.join(index_dir, LIVE_DIR)):
+        if name != manifest.get("stats"):
+            shutil.rmtree(live_dir(index_dir, name), ignore_errors=True)
+
+def load_live_stats(index_dir, manifest):
+    """
+    Returns (terms, dfs, stats, weights) from the live dir named in manifest, with
+    weights as tfidf.load_weights returns them, or None for a manifest written
+    before they were persisted.
+    """
+    from tfidf import load_weights
+    if not manifest.get("stats"):
+        return None
+    stats_dir = live_dir(index_dir, manifest["stats"])
+    with open(os.path.join(stats_dir, "vocab.txt"), "r", encoding="utf-8") as f:
+        terms = [line.rstrip("\n") for line in f]
+    dfs = np.load(os.path.join(stats_dir, LIVE_DFS_FILE)).tolist()
+    stats = load_stats(stats_dir)
+    weights = load_weights(stats_dir, (len(terms), sum(segment["docs"] for segment in manifest["segments"])))
+    if stats is None or weights is None:
+        raise FileNotFoundError(f"Statistics missing from {stats_dir}")
+    return terms, dfs, stats, weights
+
+def adopt_index(index_dir):
+    """
+    Starts a new manifest. An existing full build is brought in as the first segment
+    instead of being re-indexed; documents edited since that build count as changed.
+    A published generation is copied, so servers still reading it are unaffected;
+    artifacts built straight into index_dir are moved.
+    """
+    manifest = {"next_segment": 0, "segments": [], "sources": {}}
+    build_dir = resolve_index_dir(index_dir)
+    if not all(os.path.exists(os.path.join(build_dir, a)) for a in ARTIFACTS):
+        return manifest
+
+    print("Adopting the existing index as the first segment...")
+    built = os.stat(os.path.join(build_dir, DICT_FILE)).st_mtime_ns
+    name = next_segment_name(manifest)
+    seg_dir = segment_dir(index_dir, name)
+    os.makedirs(seg_dir)
+    transfer = os.replace if build_dir == index_dir else shutil.copy2
+    for artifact in ARTIFACTS + OPTIONAL_ARTIFACTS:
+        if os.path.exists(os.path.join(build_dir, artifact)):
+            transfer(os.path.join(build_dir, artifact), os.path.join(seg_dir, artifact))
+    shutil.copy(os.path.join(build_dir, "vocab.txt"), os.path.join(seg_dir, "vocab.txt"))
+
+    docs = 0
+    with open(os.path.join(seg_dir, CORPUS_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            doc = json.loads(line)
+            path = doc.get("path")
+            sig = None
+            if path and os.path.exists(path) and os.stat(path).st_mtime_ns <= built:
+                sig = source_signature(path)
+            manifest["sources"][doc["id"]] = {"segment": name, "sig": sig}
+            docs += 1
+    manifest["segments"].append({"name": name, "docs": docs, "deleted": []})
+    return manifest
+
+def update_index(extracted_dir, index_dir, workers=1, merge="background"):
+    """
+    Indexes new and changed .txt files as one new segment and tombstones the old
+    copies of changed and removed documents, so the cost follows the size of the
+    change rather than the size of the corpus.
+    merge: "background" (start a merge process if one is due), "now" or "off".
+    """
+    os.makedirs(os.path.join(index_dir, SEGMENTS_DIR), exist_ok=True)
+    with DirLock(os.path.join(index_dir, LOCK)):
+        manifest = load_manifest(index_dir) or adopt_index(index_dir)
+        sources = manifest["sources"]
+        segments = {segment["name"]: segment for segment in manifest["segments"]}
+
+        txt_files = {}
+        for txt_file in sorted(glob.glob(os.path.join(extracted_dir, "*.txt"))):
+            txt_files[os.path.splitext(os.path.basename(txt_file))[0]] = txt_file
+        sigs = {doc_id: source_signature(path) for doc_id, path in txt_files.items()}
+        todo = [doc_id for doc_id in txt_files if doc_id not in sources or sources[doc_id]["sig"] != sigs[doc_id]]
+        removed = [doc_id for doc_id in sources if doc_id not in txt_files]
+
+        for doc_id in removed + todo:
+            if doc_id in sources:
+                segments[sources.pop(doc_id)["segment"]]["deleted"].append(doc_id)
+
+        if todo:
+            name = next_segment_name(manifest)
+            print(f"Indexing {len(todo)} new or changed documents into {name}...")
+            docs = write_segment(segment_dir(index_dir, name), analyze_docs([txt_files[d] for d in todo], workers))
+            manifest["segments"].append({"name": name, "docs": docs, "deleted": []})
+            for doc_id in todo:
+                sources[doc_id] = {"segment": name, "sig": sigs[doc_id]}
+
+        write_live_stats(index_dir, manifest)
+        save_manifest(index_dir, manifest)
+        drop_live_stats(index_dir, manifest)
+        write_vocab(index_dir, manifest)
+
+    print(f"Indexed {len(todo)} documents, removed {len(removed)}; {len(manifest['segments'])} segments.")
+    if merge == "now":
+        merge_segments(index_dir)
+    elif merge == "background" and plan_merge(manifest["segments"]):
+        start_background_merge(index_dir)
+
+def size_tier(n_docs):
+    tier = 0
+    while n_docs >= MERGE_FACTOR:
+        n_docs //= MERGE_FACTOR
+        tier += 1
+    return tier
+
+def plan_merge(segments):
+    """
+    Picks the segments to merge next, or [] if none are due: a single segment with
+    too many deletions, else MERGE_FACTOR segments from the smallest size tier
+    (order of magnitude of live documents) that has that many.
+    """
+    for segment in segments:
+        if segment["deleted"] and len(segment["deleted"]) >= MAX_DELETED_RATIO * segment["docs"]:
+            return [segment["name"]]
+    tiers = {}
+    for segment in segments:
+        tiers.setdefault(size_tier(segment["docs"] - len(segment["deleted"])), []).append(segment["name"])
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= MERGE_FACTOR:
+            return tiers[tier][:MERGE_FACTOR]
+    return []
+
+def merge_segments(index_dir):
+    """
+    Applies the merge policy until no merge is due. Merged segments are rebuilt from
+    their stored tokens, without re-analysis. The segment lock is only held to take a
+    snapshot and to publish, so ingest and searches carry on during a merge; documents
+    deleted in the meantime are carried over as tombstones of the new segment.
+    """
+    merge_lock = DirLock(os.path.join(index_dir, MERGE_LOCK), timeout=0)
+    try:
+        merge_lock.acquire()
+    except TimeoutError:
+        print("A merge is already running.")
+        return
+
+    lock_path = os.path.join(index_dir, LOCK)
+    try:
+        while True:
+            with DirLock(lock_path):
+                manifest = load_manifest(index_dir)
+                names = plan_merge(manifest["segments"]) if manifest else []
+                if not names:
+                    return
+                snapshot = {s["name"]: set(s["deleted"]) for s in manifest["segments"] if s["name"] in names}
+                name = next_segment_name(manifest)
+                save_manifest(index_dir, manifest)
+
+            print(f"Merging {', '.join(names)} into {name}...")
+            docs = (doc for n in names for doc in read_segment(segment_dir(index_dir, n), snapshot[n]))
+            count = write_segment(segment_dir(index_dir, name), docs)
+
+            with DirLock(lock_path):
+                manifest = load_manifest(index_dir)
+                segments = []
+                deleted = []
+                for segment in manifest["segments"]:
+                    if segment["name"] in snapshot:
+                        deleted.extend(set(segment["deleted"]) - snapshot[segment["name"]])
+                    else:
+                        segments.append(segment)
+                if count:
+                    segments.append({"name": name, "docs": count, "deleted": sorted(deleted)})
+                manifest["segments"] = segments
+                for source in manifest["sources"].values():
+                    if source["segment"] in snapshot:
+                        source["segment"] = name
+                # Same live documents, but renumbered
+                write_live_stats(index_dir, manifest)
+                save_manifest(index_dir, manifest)
+                drop_live_stats(index_dir, manifest)
+                write_vocab(index_dir, manifest)
+
+                # Removed only once the saved manifest no longer lists them (see SegmentSet)
+                for n in names:
+                    shutil.rmtree(segment_dir(index_dir, n), ignore_errors=True)
+                if not count:
+                    shutil.rmtree(segment_dir(index_dir, name), ignore_errors=True)
+    finally:
+        merge_lock.release()
+
+def start_background_merge(index_dir):
+    """
+    Runs merge_segments in a separate process so the caller does not wait for it.
+    """
+    print("Starting background merge...")
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "merge", "--index-dir", os.path.abspath(index_dir)],
+                     start_new_session=True)
+
+class SegmentDocs:
+    """
+    DocStore-style access by global doc number across segments.
+    """
+    def __init__(self, stores):
+        self.stores = stores
+        self.bases = []
+        base = 0
+        for store in stores:
+            self.bases.append(base)
+            base += len(store)
+
+    def _locate(self, doc_num):
+        i = bisect_right(self.bases, doc_num) - 1
+        if i < 0:
+            return None, None
+        return self.stores[i], doc_num - self.bases[i]
+
+    def get(self, doc_num):
+        store, local = self._locate(doc_num)
+        return store.get(local) if store else None
+
+    def get_text(self, doc_num):
+        store, local = self._locate(doc_num)
+        return store.get_text(local) if store else None
+
+    def get_prefix(self, doc_num, n_chars):
+        store, local = self._locate(doc_num)
+        return store.get_prefix(local, n_chars) if store else None
+
+    def close(self):
+        for store in self.stores:
+            store.close()
+
+class SegmentIndex(BaseIndex):
+    """
+    Postings-reader view of the live documents across segment indexes.
+    Doc numbers are global: each segment's are offset by the docs of the segments before it.
+    Tombstoned documents are filtered out of the postings as they are read. The live
+    terms and dfs are computed from the postings unless given (see write_live_stats).
+    """
+    def __init__(self, readers, terms=None, dfs=None):
+        self.readers = []  # [(segment index, doc number base, deleted doc ids, deleted local doc numbers)]
+        self.bases = []
+        self.doc_ids = []
+        self.doc_nums = {} # live docs only
+        for reader, deleted in readers:
+            deleted_nums = {i for i, doc_id in enumerate(reader.doc_ids) if doc_id in deleted}
+            self.readers.append((reader, len(self.doc_ids), deleted, deleted_nums))
+            self.bases.append(len(self.doc_ids))
+            for doc_id in reader.doc_ids:
+                if doc_id not in deleted:
+                    self.doc_nums[doc_id] = len(self.doc_ids)
+                self.doc_ids.append(doc_id)
+        self.n_docs = len(self.doc_nums)
+
+        if terms is not None:
+            self.terms = terms
+            self.dfs = dfs
+            return
+        doc_freqs = {}
+        for reader, _, _, deleted_nums in self.readers:
+            for i, term in enumerate(reader.terms):
+                df = reader.dfs[i]
+                if deleted_nums:
+                    doc_nums, _ = reader.postings(term)
+                    df -= sum(1 for d in doc_nums if d in deleted_nums)
+                if df:
+                    doc_freqs[term] = doc_freqs.get(term, 0) + df
+        self.terms = sorted(doc_freqs)
+        self.dfs = [doc_freqs[term] for term in self.terms]
+
+    def postings(self, term):
+        doc_nums = []
+        tfs = []
+        for reader, base, _, deleted_nums in self.readers:
+            for d, tf in zip(*reader.postings(term)):
+                if d not in deleted_nums:
+                    doc_nums.append(base + d)
+                    tfs.append(tf)
+        return doc_nums, tfs
+
+    def intersect(self, term, doc_nums):
+        # Each segment looks up its own range of doc numbers (with its skip pointers)
+        found = []
+        bounds = np.searchsorted(doc_nums, self.bases + [len(self.doc_ids)])
+        for (reader, base, _, deleted_nums), lo, hi in zip(self.readers, bounds[:-1], bounds[1:]):
+            if lo == hi:
+                continue
+            local = reader.intersect(term, doc_nums[lo:hi] - base)
+            if deleted_nums and len(local):
+                local = local[~np.isin(local, list(deleted_nums))]
+            found.append(local + base)
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def arrays(self):
+        if not self.readers:
+            return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+        rows = []
+        docs = []
+        tfs = []
+        slots = {term: i for i, term in enumerate(self.terms)}
+        for reader, base, _, deleted_nums in self.readers:
+            term_starts, seg_docs, seg_tfs = reader.arrays()
+            seg_rows = np.repeat(np.array([slots.get(t, -1) for t in reader.terms], dtype=np.int64),
+                                 np.diff(term_starts))
+            keep = seg_rows >= 0
+            if deleted_nums:
+                keep &= ~np.isin(seg_docs, np.array(sorted(deleted_nums), dtype=np.uint32))
+            rows.append(seg_rows[keep])
+            docs.append(seg_docs[keep] + np.uint32(base))
+            tfs.append(seg_tfs[keep])
+        rows = np.concatenate(rows)
+        # Segments are in doc number order, so a stable sort keeps each term's docs ascending
+        order = np.argsort(rows, kind="stable")
+        term_starts = np.searchsorted(rows[order], np.arange(len(self.terms) + 1))
+        return term_starts, np.concatenate(docs)[order], np.concatenate(tfs)[order]
+
+    def positions(self, term, doc_num):
+        i = bisect_right(self.bases, doc_num) - 1
+        if i < 0:
+            return None
+        reader, base, _, deleted_nums = self.readers[i]
+        local = doc_num - base
+        if local in deleted_nums:
+            return None
+        return reader.positions(term, local)
+
+    def close(self):
+        for reader, _, _, _ in self.readers:
+            reader.close()
+
+class SegmentSet:
+    """
+    Read side of a segmented index. Opens every live segment and hides tombstoned
+    documents, so callers see a single index whose N and document frequencies
+    cover the whole collection. The collection statistics and the ranker's weight
+    matrix are loaded from the live dir the manifest names; for a manifest from
+    before they were persisted they are computed from the postings.
+    """
+    def __init__(self, index_dir, in_memory=False):
+        # Read without the segment lock: the manifest is replaced atomically, and a
+        # merge only removes segments after saving a manifest without them. So if
+        # every opened segment is still listed once they are all open, none of their
+        # files was removed before it was opened; otherwise they are opened again.
+        for attempt in range(OPEN_ATTEMPTS):
+            manifest = load_manifest(index_dir)
+            opened = []
+            try:
+                self.open_segments(index_dir, manifest, in_memory, opened)
+                live = load_live_stats(index_dir, manifest)
+                current = load_manifest(index_dir)
+                names = {segment["name"] for segment in current["segments"]}
+                if all(segment["name"] in names for segment in manifest["segments"]) and \
+                        (live is None or current.get("stats") == manifest["stats"]):
+                    break
+            except FileNotFoundError:
+                if attempt == OPEN_ATTEMPTS - 1:
+                    raise
+            for index, store in opened:
+                index.close()
+                store.close()
+            time.sleep(0.1)
+        else:
+            raise RuntimeError(f"Segments of {index_dir} kept changing while they were opened")
+
+        readers = [(index, set(segment["deleted"])) for (index, _), segment in zip(opened, manifest["segments"])]
+        self.docs = SegmentDocs([store for _, store in opened])
+        self.weights = None # (weight matrix, cosine bounds) when persisted with the manifest
+        if live is not None:
+            terms, dfs, self.stats, self.weights = live
+            self.index = SegmentIndex(readers, terms, dfs)
+        else:
+            self.index = SegmentIndex(readers)
+            self.stats = None
+            if len(manifest["segments"]) == 1 and not manifest["segments"][0]["deleted"]:
+                self.stats = load_stats(segment_dir(index_dir, manifest["segments"][0]["name"]))
+            if self.stats is None:
+                self.stats = compute_stats(self.index)
+
+    def open_segments(self, index_dir, manifest, in_memory, opened):
+        """
+        Opens the segments of manifest, appending (index, store) pairs to opened.
+        """
+        self.page_starts = {}
+        for segment in manifest["segments"]:
+            seg_dir = segment_dir(index_dir, segment["name"])
+            deleted = set(segment["deleted"])
+            index = MemoryIndex(seg_dir) if in_memory else IndexReader(seg_dir)
+            try:
+                store = DocStore(seg_dir)
+            except FileNotFoundError:
+                index.close()
+                raise
+            opened.append((index, store))
+
+            with open(os.path.join(seg_dir, "pages.json"), "r", encoding="utf-8") as f:
+                for doc_id, starts in json.load(f).items():
+                    if doc_id not in deleted:
+                        self.page_starts[doc_id] = starts
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain a segmented index")
+    parser.add_argument("command", choices=["merge", "status"])
+    parser.add_argument("--index-dir", default=r"data/index")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        merge_segments(args.index_dir)
+    else:
+        manifest = load_manifest(args.index_dir)
+        if manifest is None:
+            print("Not a segmented index.")
+            return
+        for segment in manifest["segments"]:
+            print(f"{segment['name']}: {segment['docs']} docs, {len(segment['deleted'])} deleted")
+        print(f"Next merge: {plan_merge(manifest['segments']) or 'none due'}")
+
+if __name__ == "__main__":
+    main()
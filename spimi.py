@@ -0,0 +1,108 @@
+import os
+import json
+import heapq
+import multiprocessing as mp
+from operator import itemgetter
+from analyzer import analyze
+from pages import split_pages
+from textstore import PackReader
+
+# Rough CPython sizes used to estimate how much memory a worker's postings take
+TERM_BYTES = 200       # dict slot, term string, postings list
+POSTING_BYTES = 120    # (doc, positions) pair and its positions list
+POSITION_BYTES = 36    # list slot + int object
+
+def write_run(path, postings):
+    """
+    Writes in-memory postings as a run file: one JSON line per term, in term order,
+    each holding [term, [[doc_index, positions], ...]].
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for term in sorted(postings):
+            f.write(json.dumps([term, postings[term]]) + "\n")
+
+def read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def merge_runs(run_paths):
+    """
+    Streaming k-way merge of run files. Yields (term, postings) in term order.
+    heapq.merge is stable, so with runs listed in document order each term's
+    postings come out in document order too.
+    """
+    current, postings = None, []
+    for term, run_postings in heapq.merge(*[read_run(p) for p in run_paths], key=itemgetter(0)):
+        if term != current:
+            if current is not None:
+                yield current, postings
+            current, postings = term, []
+        postings.extend(run_postings)
+    if current is not None:
+        yield current, postings
+
+def spimi_worker(task):
+    """
+    Indexes one contiguous slice of documents, flushing a sorted run to disk
+    whenever the estimated size of its postings reaches the budget.
+    Token lists go straight to a preprocess part file.
+    Returns (run_paths, page_starts, preprocess_part_path).
+    """
+    worker_no, texts_path, docs, run_dir, budget = task
+    run_paths = []
+    page_starts = {}
+    postings = {}
+    used = 0
+
+    def flush():
+        path = os.path.join(run_dir, f"run-{worker_no:03d}-{len(run_paths):05d}.jsonl")
+        write_run(path, postings)
+        run_paths.append(path)
+
+    part_path = os.path.join(run_dir, f"preprocess-{worker_no:03d}.part")
+    with PackReader(texts_path) as texts, open(part_path, "w", encoding="utf-8") as f_part:
+        for doc_index, doc_id, offsets in docs:
+            tokens = []
+            starts = []
+            for page_text in split_pages(texts.get(doc_id), offsets):
+                starts.append(len(tokens))
+                tokens.extend(analyze(page_text))
+            if offsets:
+                page_starts[doc_id] = starts
+            f_part.write(json.dumps(doc_id) + ": " + json.dumps(tokens) + "\n")
+
+            doc_postings = {}
+            for pos, term in enumerate(tokens):
+                doc_postings.setdefault(term, []).append(pos)
+            for term, positions in doc_postings.items():
+                term_postings = postings.get(term)
+                if term_postings is None:
+                    term_postings = postings[term] = []
+                    used += TERM_BYTES
+                term_postings.append([doc_index, positions])
+                used += POSTING_BYTES + POSITION_BYTES * len(positions)
+
+            if used >= budget:
+                flush()
+                postings = {}
+                used = 0
+
+    if postings:
+        flush()
+    return run_paths, page_starts, part_path
+
+def run_workers(texts_path, docs, run_dir, workers, memory_mb):
+    """
+    Splits docs ([(doc_index, doc_id, page_offsets)]) into one contiguous slice per
+    worker and indexes them in parallel, each within memory_mb / workers.
+    Returns the worker results in document order.
+    """
+    workers = max(1, min(workers, len(docs)))
+    budget = memory_mb * 2**20 // workers
+    size = (len(docs) + workers - 1) // workers
+    tasks = [(i, texts_path, docs[i * size:(i + 1) * size], run_dir, budget) for i in range(workers)]
+    if workers == 1:
+        return [spimi_worker(tasks[0])]
+    with mp.Pool(workers) as pool:
+        return pool.map(spimi_worker, tasks)
@@ -0,0 +1,80 @@
+import os
+import math
+import numpy as np
+
+# Collection statistics stored next to the binary index, one .npy array each:
+#   doc_lengths.npy  tokens per doc (uint32, by doc number)
+#   doc_norms.npy    L2 norm of each doc's log-tf * idf vector (float64, by doc number),
+#                    its squared weights summed in dictionary order. (The per-document
+#                    loop this replaces summed them in token order; norms can differ
+#                    from it in the last bit, but documents with the same term vector
+#                    always get the same norm, so their cosine scores tie exactly.)
+#   idf.npy          log10(N / df) per term (float64, in dictionary order)
+#   term_max.npy     largest document weight (1 + log10 tf) * idf per term (float64,
+#                    in dictionary order), the score bound used by top-k pruning
+# N is the number of documents; df lives in index.dict.
+LENGTHS_FILE = "doc_lengths.npy"
+NORMS_FILE = "doc_norms.npy"
+IDF_FILE = "idf.npy"
+MAX_WEIGHTS_FILE = "term_max.npy"
+STATS_FILES = (LENGTHS_FILE, NORMS_FILE, IDF_FILE, MAX_WEIGHTS_FILE)
+
+class StatsAccumulator:
+    """
+    Builds the statistics one term at a time from its postings, in dictionary order.
+    n_slots is the size of the doc number space, N the number of live documents.
+    """
+    def __init__(self, n_slots, N):
+        self.N = N
+        self.lengths = [0] * n_slots
+        self.norms_sq = [0.0] * n_slots
+        self.idf = []
+        self.max_weights = []
+
+    def add(self, doc_nums, tfs):
+        df = len(doc_nums)
+        idf = math.log10(self.N / df) if df > 0 else 0
+        self.idf.append(idf)
+        lengths = self.lengths
+        norms_sq = self.norms_sq
+        for d, tf in zip(doc_nums, tfs):
+            lengths[d] += tf
+            w_td = (1 + math.log10(tf)) * idf
+            norms_sq[d] += w_td ** 2
+        self.max_weights.append((1 + math.log10(max(tfs))) * idf if df > 0 else 0.0)
+
+    def arrays(self):
+        """
+        Returns (doc_lengths, doc_norms, idf, max_weights) as NumPy arrays.
+        """
+        return (np.array(self.lengths, dtype=np.uint32),
+                np.sqrt(np.array(self.norms_sq, dtype=np.float64)),
+                np.array(self.idf, dtype=np.float64),
+                np.array(self.max_weights, dtype=np.float64))
+
+def compute_stats(index):
+    """
+    Statistics for an open index (IndexReader or SegmentIndex), decoded from its postings.
+    """
+    acc = StatsAccumulator(len(index.doc_ids), index.n_docs)
+    for term in index.terms:
+        acc.add(*index.postings(term))
+    return acc.arrays()
+
+def save_stats(index_dir, stats):
+    for name, arr in zip(STATS_FILES, stats):
+        path = os.path.join(index_dir, name)
+        # np.save appends .npy to names that lack it
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, arr)
+        os.replace(tmp_path, path)
+
+def load_stats(index_dir):
+    """
+    Memory-maps (doc_lengths, doc_norms, idf, max_weights), or returns None if they
+    were never written (or predate one of them).
+    """
+    paths = [os.path.join(index_dir, name) for name in STATS_FILES]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return tuple(np.load(path, mmap_mode="r") for path in paths)
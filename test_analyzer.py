@@ -0,0 +1,90 @@
+import unittest
+import glob
+import os
+from analyzer import AnalyzerCache, TermDictionary, analyze, analyze_batch, tokenize
+from clean import clean_text, clean_text_nltk
+
+EXTRACTED_DIR = "data/extracted"
+
+class TestAnalyzer(unittest.TestCase):
+    def test_punctuation_splits_words(self):
+        self.assertEqual(tokenize("W.P.No.251251/2018, Lahore-High Court"),
+                         ["w", "p", "no", "251251", "2018", "lahore", "high", "court"])
+
+    def test_contractions_split_like_treebank(self):
+        self.assertEqual(tokenize("Cannot gonna wanna. gotta lemme gimme"),
+                         ["can", "not", "gon", "na", "wan", "na", "got", "ta", "lem", "me", "gim", "me"])
+        # Only whole words are split
+        self.assertEqual(tokenize("cannoted xgonna"), ["cannoted", "xgonna"])
+
+    def test_filters_stopwords_and_short_tokens(self):
+        self.assertEqual(analyze("The court: a writ of 2023", {"the", "of"}), ["court", "writ", "2023"])
+        self.assertEqual(analyze("", {"the"}), [])
+
+class TestAnalyzeBatch(unittest.TestCase):
+    TEXTS = ["Bail granted to the petitioner.", "", "Petitioner's bail: cannot be refused", "Writ petition BAIL"]
+
+    def test_matches_analyze(self):
+        self.assertEqual(list(analyze_batch(self.TEXTS)), [analyze(t) for t in self.TEXTS])
+        term_dict = TermDictionary()
+        ids = list(analyze_batch(self.TEXTS, term_dict=term_dict))
+        self.assertEqual([term_dict.decode(i) for i in ids], [analyze(t) for t in self.TEXTS])
+
+    def test_term_ids_are_stable(self):
+        term_dict = TermDictionary()
+        first = list(analyze_batch(self.TEXTS, term_dict=term_dict))
+        # Ids follow first appearance, and a term keeps its id in every document
+        self.assertEqual(term_dict.terms[:3], ["bail", "granted", "petitioner"])
+        self.assertEqual(first[0][0], first[2][1])
+        self.assertEqual(first[0][0], first[3][2])
+        # Later batches reuse the ids and only append new terms
+        known = list(term_dict.terms)
+        later = list(analyze_batch(["bail appeal petitioner"], term_dict=term_dict))
+        self.assertEqual(term_dict.terms[:len(known)], known)
+        self.assertEqual(later[0].tolist(), [term_dict.ids["bail"], len(known), term_dict.ids["petitioner"]])
+        # A process pool interns the same ids
+        pooled = TermDictionary()
+        self.assertEqual(list(analyze_batch(self.TEXTS, workers=2, term_dict=pooled, chunksize=1)), first)
+        self.assertEqual(pooled.terms, known)
+
+class TestAnalyzerCache(unittest.TestCase):
+    def test_hits_misses_and_eviction(self):
+        cache = AnalyzerCache(maxsize=2)
+        self.assertEqual(cache.analyze("Bail Granted"), ("bail", "granted"))
+        self.assertEqual(cache.analyze("Bail Granted"), ("bail", "granted"))
+        self.assertEqual(cache.analyze("murder appeal"), ("murder", "appeal"))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2, "size": 2, "maxsize": 2})
+
+        # "Bail Granted" was used last, so "murder appeal" is evicted at capacity
+        cache.analyze("Bail Granted")
+        cache.analyze("writ petition")
+        self.assertEqual(list(cache.entries), ["Bail Granted", "writ petition"])
+        cache.analyze("murder appeal")
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 4, "size": 2, "maxsize": 2})
+        self.assertEqual(list(cache.entries), ["writ petition", "murder appeal"])
+
+        # Empty results are cached too
+        self.assertEqual(cache.analyze("the of"), ())
+        self.assertEqual(cache.analyze("the of"), ())
+        self.assertEqual((cache.hits, cache.misses), (3, 5))
+
+class TestAnalyzerParity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The reference pipeline needs NLTK's punkt and stopwords data
+        try:
+            clean_text_nltk("probe")
+        except LookupError as e:
+            raise unittest.SkipTest(f"NLTK data unavailable: {e}")
+
+    def test_matches_nltk_pipeline_on_corpus(self):
+        txt_files = sorted(glob.glob(os.path.join(EXTRACTED_DIR, "*.txt")))
+        if not txt_files:
+            self.skipTest("no extracted text")
+        for txt_file in txt_files:
+            with open(txt_file, "r", encoding="utf-8") as f:
+                text = f.read()
+            self.assertEqual(clean_text(text), clean_text_nltk(text), txt_file)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from boolean import parse_query
+from postings import IndexWriter
+from docstore import CorpusWriter
+from query import QueryProcessor, SearchResults
+
+def tokens(query):
+    # Terms are single lowercase words here, so no analyzer is needed
+    out = []
+    for t in query.replace("(", " ( ").replace(")", " ) ").split():
+        if t in ("AND", "OR", "NOT"):
+            out.append(("OP", t))
+        elif t in "()":
+            out.append(("LPAREN" if t == "(" else "RPAREN", t))
+        else:
+            out.append(("TERM", t))
+    return out
+
+class TestBooleanParser(unittest.TestCase):
+    def test_precedence(self):
+        a, b, c = ("TERM", "a"), ("TERM", "b"), ("TERM", "c")
+        self.assertEqual(parse_query(tokens("a OR b AND c")), ("OR", [a, ("AND", [b, c])]))
+        self.assertEqual(parse_query(tokens("a AND b OR c")), ("OR", [("AND", [a, b]), c]))
+        self.assertEqual(parse_query(tokens("a NOT b OR c")), ("OR", [("AND", [a, ("NOT", b)]), c]))
+        self.assertEqual(parse_query(tokens("NOT a b")), ("AND", [("NOT", a), b]))
+        self.assertEqual(parse_query(tokens("a b c")), ("AND", [a, b, c]))
+
+    def test_grouping(self):
+        a, b, c = ("TERM", "a"), ("TERM", "b"), ("TERM", "c")
+        self.assertEqual(parse_query(tokens("(a OR b) AND c")), ("AND", [("OR", [a, b]), c]))
+        self.assertEqual(parse_query(tokens("a NOT (b OR c)")), ("AND", [a, ("NOT", ("OR", [b, c]))]))
+        self.assertEqual(parse_query(tokens("((a))")), a)
+
+    def test_lenient(self):
+        a, b = ("TERM", "a"), ("TERM", "b")
+        self.assertEqual(parse_query(tokens("a AND")), a)
+        self.assertEqual(parse_query(tokens("OR a")), a)
+        self.assertEqual(parse_query(tokens("(a OR b")), ("OR", [a, b]))
+        self.assertEqual(parse_query(tokens("a ) b")), ("AND", [a, b]))
+        self.assertEqual(parse_query(tokens("NOT NOT a")), a)
+        self.assertIsNone(parse_query(tokens("( ) NOT")))
+
+class TestQueryPlanner(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_boolean"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        docs = [["bail", "granted"], ["bail", "murder"], ["murder", "appeal"], ["appeal", "granted"], ["court"]]
+        doc_ids = [f"doc{i + 1}" for i in range(len(docs))]
+        with CorpusWriter(self.test_dir) as corpus:
+            for doc_id in doc_ids:
+                corpus.add({"id": doc_id, "text": ""})
+        with IndexWriter(self.test_dir, doc_ids) as writer:
+            for term in sorted({t for tokens in docs for t in tokens}):
+                writer.add(term, [(i, [p for p, t in enumerate(tokens) if t == term])
+                                  for i, tokens in enumerate(docs) if term in tokens])
+        self.qp = QueryProcessor(index_dir=self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def search(self, query):
+        results, _ = self.qp.process_query(query, enable_ranking=False)
+        return [r["id"] for r in results]
+
+    def test_evaluation(self):
+        self.assertEqual(self.search("appeal OR bail AND murder"), ["doc2", "doc3", "doc4"])
+        self.assertEqual(self.search("(appeal OR bail) AND murder"), ["doc2", "doc3"])
+        self.assertEqual(self.search("granted NOT (bail OR murder)"), ["doc4"])
+        self.assertEqual(self.search("NOT granted NOT murder"), ["doc5"])
+        self.assertEqual(self.search("(bail OR appeal) NOT granted"), ["doc2", "doc3"])
+
+    def test_nothing_to_search(self):
+        for query in ("AND", "( ) NOT", "the"):
+            results, display_terms = self.qp.process_query(query)
+            self.assertIsInstance(results, SearchResults)
+            self.assertEqual((len(results), results[0:10], display_terms), (0, [], []))
+
+    def test_estimates(self):
+        tree = ("AND", [("TERM", "granted"), ("NOT", ("TERM", "bail")), ("TERM", "court")])
+        self.assertEqual(self.qp.estimate(tree), 1)
+        self.assertEqual(self.qp.estimate(("OR", [("TERM", "bail"), ("TERM", "murder")])), 4)
+        # Restricted to candidates, only those can come back
+        self.assertEqual(self.qp.evaluate(("TERM", "bail"), within=np.array([1, 2])).tolist(), [1])
+
+    def test_query_terms(self):
+        # The terms process_query returns, without evaluating the query
+        for query in ('"bail granted" OR murd*', "Granted NOT (appeal OR court)", "AND"):
+            _, display_terms = self.qp.process_query(query, enable_ranking=False)
+            self.assertEqual(self.qp.query_terms(query), display_terms)
+        self.assertEqual(self.qp.query_terms('"bail granted" OR murd*'), ["bail granted", "murder"])
+        self.assertEqual(self.qp.query_terms("murd*", enable_wildcards=False), ["murd"])
+
+if __name__ == '__main__':
+    unittest.main()
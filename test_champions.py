@@ -0,0 +1,74 @@
+import unittest
+import os
+import shutil
+from postings import IndexWriter
+from docstore import CorpusWriter
+from champions import CHAMPION_SIZE, build_champions, load_champions
+import query
+from query import QueryProcessor
+
+class TestChampionTiers(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_champions"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        doc_ids = ["doc1", "doc2", "doc3", "doc4", "doc5"]
+        with CorpusWriter(self.test_dir) as corpus:
+            for doc_id in doc_ids:
+                corpus.add({"id": doc_id, "text": ""})
+        with IndexWriter(self.test_dir, doc_ids) as writer:
+            writer.add("appeal", [(4, [0])])
+            writer.add("bail", [(0, [0]), (1, [0, 1, 2]), (2, [0, 1]), (3, [0])])
+            writer.add("court", [(0, [1, 2, 3, 4]), (1, [3]), (2, [2]), (3, [1]), (4, [1])])
+        build_champions(self.test_dir, r=2)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_champion_lists(self):
+        champions, r = load_champions(self.test_dir)
+        self.assertEqual(r, 2)
+        # Top 2 by tf for bail (df 4) and court (df 5), by doc; appeal (df 1) needs no list
+        self.assertEqual(champions["tfidf"].tolist(), [1, 2, 0, 1])
+
+        qp = QueryProcessor(index_dir=self.test_dir, tiered=True)
+        self.assertEqual(sorted(qp.champions.docs("bail")), [1, 2])
+        self.assertEqual(qp.champions.docs("appeal"), [4])
+        self.assertIsNone(QueryProcessor(index_dir=self.test_dir).champions)
+
+    def test_missing_lists_not_written(self):
+        for name in os.listdir(self.test_dir):
+            if name.startswith("champions"):
+                os.remove(os.path.join(self.test_dir, name))
+        files = sorted(os.listdir(self.test_dir))
+        qp = QueryProcessor(index_dir=self.test_dir, tiered=True)
+        self.assertEqual(qp.champions.r, CHAMPION_SIZE)
+        self.assertEqual(qp.champions.docs("bail"), [0, 1, 2, 3])
+        self.assertEqual(sorted(os.listdir(self.test_dir)), files)
+
+    def test_pages_slice_one_order(self):
+        old_min = query.TIER_MIN
+        query.TIER_MIN = 2
+        try:
+            qp = QueryProcessor(index_dir=self.test_dir, tiered=True)
+            exact = QueryProcessor(index_dir=self.test_dir)
+            for terms, docs in ((["bail"], {0, 1, 2, 3}), (["bail", "court"], {0, 1, 2, 3, 4})):
+                ranked = qp.rank(terms, docs)
+                self.assertEqual(sorted(d for d, _ in ranked), sorted(docs))
+                # Champions first: bail's are docs 1 and 2, court's 0 and 1
+                self.assertLessEqual({d for d, _ in ranked[:2]}, {0, 1, 2})
+                for k in range(1, len(docs) + 1):
+                    self.assertEqual(qp.rank(terms, docs, k=k), ranked[:k])
+            # Only one champion among the candidates: below TIER_MIN, so every candidate is scored
+            self.assertEqual(qp.rank(["bail"], {0, 1, 3}, k=1), exact.rank(["bail"], {0, 1, 3}, k=1))
+
+            results, _ = qp.process_query("bail", k=2)
+            self.assertEqual(len(results), 4)
+            self.assertEqual([r["id"] for r in results[:2]], ["doc2", "doc3"])
+        finally:
+            query.TIER_MIN = old_min
+
+if __name__ == '__main__':
+    unittest.main()
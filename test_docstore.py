@@ -0,0 +1,57 @@
+import unittest
+import os
+import json
+import shutil
+from docstore import CorpusWriter, DocStore, OFFSETS_FILE
+from textstore import PackWriter
+
+class TestDocStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_docstore"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_records_and_text(self):
+        with CorpusWriter(self.test_dir) as corpus, PackWriter(os.path.join(self.test_dir, "texts.pack")) as texts:
+            for doc_id, text in (("doc1", "bail granted"), ("doc2", "appeal dismissed – costs")):
+                corpus.add({"id": doc_id, "path": doc_id + ".txt"})
+                texts.add(doc_id, text)
+
+        store = DocStore(self.test_dir, cache_size=1)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get(1), {"id": "doc2", "path": "doc2.txt"})
+        self.assertEqual(store.get(0)["id"], "doc1")
+        self.assertIsNone(store.get(2))
+        self.assertEqual(store.get_text(1), "appeal dismissed – costs")
+        self.assertEqual(store.get_prefix(0, 4), "bail")
+        self.assertEqual(len(store.cache), 1)
+        store.close()
+
+    def test_legacy_corpus(self):
+        # Older indexes keep the text in corpus.jsonl and have no offset index
+        with open(os.path.join(self.test_dir, "corpus.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "doc1", "text": "apple banana"}) + "\n")
+            f.write(json.dumps({"id": "doc2", "text": "orange"}) + "\n")
+
+        store = DocStore(self.test_dir)
+        # The offsets are built in memory; reading never writes into the index dir
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, OFFSETS_FILE)))
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get_text(1), "orange")
+        self.assertEqual(store.get_prefix(0, 5), "apple")
+        store.close()
+
+    def test_failed_write_leaves_no_offsets(self):
+        with self.assertRaises(RuntimeError):
+            with CorpusWriter(self.test_dir) as corpus:
+                corpus.add({"id": "doc1"})
+                raise RuntimeError("build failed")
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, OFFSETS_FILE)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import unittest
+import os
+import time
+import shutil
+from multiprocessing.connection import wait
+import fitz
+import extract
+from extract import (MAX_BAD_CHAR_RATIO, MIN_CHARS_PER_SQ_INCH, TaskPool, extract_parallel, extract_serial,
+                     manifest_entry, page_quality_ok, plan_extraction, prune_removed)
+from pages import pages_path_for, write_page_offsets
+
+def _sleep_task(seconds):
+    # Module level, so worker processes can unpickle it
+    time.sleep(seconds)
+    return seconds
+
+class TestExtractManifest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_extract"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.pdf_dir = os.path.join(self.test_dir, "pdfs")
+        os.makedirs(self.pdf_dir)
+        self.old_extracted_dir = extract.EXTRACTED_DIR
+        extract.EXTRACTED_DIR = os.path.join(self.test_dir, "extracted")
+        os.makedirs(extract.EXTRACTED_DIR)
+
+    def tearDown(self):
+        extract.EXTRACTED_DIR = self.old_extracted_dir
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write_pdf(self, name, content, extracted=True):
+        # plan_extraction only looks at bytes and timestamps, so any content will do
+        path = os.path.join(self.pdf_dir, name + ".pdf")
+        with open(path, "wb") as f:
+            f.write(content)
+        if extracted:
+            txt_path = extract.txt_path_for(path)
+            with open(txt_path, "w", encoding="utf-8") as f:
+                f.write("text\n")
+            write_page_offsets(pages_path_for(txt_path), [0])
+        return path
+
+    def touch(self, path, seconds):
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 1_000_000_000))
+
+    def test_unchanged_skipped(self):
+        path = self.write_pdf("doc1", b"%PDF one")
+        manifest = {"doc1": manifest_entry(path)}
+        self.assertEqual(plan_extraction([path], manifest), ([], []))
+
+        # Touched but not modified: the hash matches, so only the entry is refreshed
+        self.touch(path, 5)
+        self.assertEqual(plan_extraction([path], manifest), ([], []))
+        self.assertEqual(manifest["doc1"]["mtime"], os.stat(path).st_mtime)
+        # Forced runs redo everything
+        self.assertEqual(plan_extraction([path], manifest, force=True), ([path], []))
+
+    def test_changed_or_stale(self):
+        path = self.write_pdf("doc1", b"%PDF one")
+        new_path = self.write_pdf("doc2", b"%PDF two", extracted=False)
+        manifest = {"doc1": manifest_entry(path)}
+
+        # Same size, new content
+        self.write_pdf("doc1", b"%PDF 1ne")
+        self.touch(path, 5)
+        self.assertEqual(plan_extraction([path, new_path], manifest), ([path, new_path], []))
+
+        manifest = {"doc1": manifest_entry(path)}
+        old_version = extract.EXTRACTOR_VERSION
+        extract.EXTRACTOR_VERSION = old_version + 1
+        try:
+            self.assertEqual(plan_extraction([path], manifest), ([path], []))
+        finally:
+            extract.EXTRACTOR_VERSION = old_version
+
+    def test_pre_manifest_text(self):
+        adopted = self.write_pdf("doc1", b"%PDF one")
+        # Extracted before page offsets were tracked: no .pages sidecar
+        stale = self.write_pdf("doc2", b"%PDF two")
+        os.remove(pages_path_for(extract.txt_path_for(stale)))
+        manifest = {}
+        self.assertEqual(plan_extraction([adopted, stale], manifest), ([stale], []))
+        self.assertEqual(list(manifest), ["doc1"])
+        self.assertEqual(manifest["doc1"]["extractor"], extract.EXTRACTOR_VERSION)
+
+    def test_deleted_sources_dropped(self):
+        kept = self.write_pdf("doc1", b"%PDF one")
+        gone = self.write_pdf("doc2", b"%PDF two")
+        manifest = {"doc1": manifest_entry(kept), "doc2": manifest_entry(gone)}
+        os.remove(gone)
+
+        todo, removed = plan_extraction([kept], manifest)
+        self.assertEqual((todo, removed), ([], ["doc2"]))
+        prune_removed(removed, manifest)
+        self.assertEqual(list(manifest), ["doc1"])
+        txt_path = extract.txt_path_for(gone)
+        self.assertFalse(os.path.exists(txt_path))
+        self.assertFalse(os.path.exists(pages_path_for(txt_path)))
+        self.assertTrue(os.path.exists(extract.txt_path_for(kept)))
+
+class TestParallelExtraction(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_extract_parallel"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write_pdf(self, name, pages):
+        path = os.path.join(self.test_dir, name + ".pdf")
+        doc = fitz.open()
+        for text in pages:
+            page = doc.new_page()
+            if text:
+                page.insert_text((72, 72), text)
+        doc.save(path)
+        doc.close()
+        return path
+
+    def test_matches_serial(self):
+        paths = [
+            self.write_pdf("doc1", ["The petition is dismissed. " * 3, "Bail granted to the petitioner."]),
+            # The blank page fails the quality gate and goes to the fallback pool
+            self.write_pdf("doc2", ["Murder appeal allowed.", "", "Order accordingly."]),
+            self.write_pdf("doc3", ["Writ petition. " * 4]),
+            # No text layer at all
+            self.write_pdf("doc4", [""]),
+        ]
+        broken = os.path.join(self.test_dir, "doc5.pdf")
+        with open(broken, "wb") as f:
+            f.write(b"%PDF-1.4 truncated")
+        paths.append(broken)
+
+        serial = list(extract_serial(paths))
+        self.assertEqual([p for p, _, _ in serial], paths)
+        self.assertEqual(len(serial[1][1]), 3)
+        self.assertEqual(serial[1][1][1].strip(), "")
+        self.assertEqual("".join(serial[3][1]).strip(), "")
+        self.assertIsNone(serial[4][1])
+        self.assertTrue(serial[4][2])
+
+        parallel = list(extract_parallel(paths, workers=2))
+        self.assertEqual(sorted(p for p, _, _ in parallel), sorted(paths))
+        by_path = {p: (pages, error) for p, pages, error in parallel}
+        for path, pages, error in serial:
+            parallel_pages, parallel_error = by_path[path]
+            self.assertEqual(parallel_pages, pages, path)
+            self.assertEqual(bool(parallel_error), bool(error), path)
+
+class TestPageQuality(unittest.TestCase):
+    LETTER = 8.5 * 11 # square inches
+
+    def test_density(self):
+        needed = int(MIN_CHARS_PER_SQ_INCH * self.LETTER) + 1
+        self.assertTrue(page_quality_ok("The petition is dismissed.\n" * 20, self.LETTER))
+        self.assertTrue(page_quality_ok("x" * needed, self.LETTER))
+        self.assertFalse(page_quality_ok("x" * (needed - 1), self.LETTER))
+        # Whitespace does not count, and a scanned page with no text layer fails
+        self.assertFalse(page_quality_ok(" \n" * 100 + "Page 1", self.LETTER))
+        self.assertFalse(page_quality_ok("", self.LETTER))
+        # Without a page size only the character check applies
+        self.assertTrue(page_quality_ok("ok", 0))
+
+    def test_bad_characters(self):
+        limit = int(MAX_BAD_CHAR_RATIO * 100)
+        self.assertTrue(page_quality_ok("\ufffd" * limit + "a" * (100 - limit), self.LETTER))
+        self.assertFalse(page_quality_ok("\ufffd" * (limit + 1) + "a" * (99 - limit), self.LETTER))
+        # Broken font mappings: private-use glyphs and control characters
+        self.assertFalse(page_quality_ok("\ue001\ue002 \x07\x08 " * 10 + "a" * 50, self.LETTER))
+
+class TestTaskPool(unittest.TestCase):
+    def test_timeout_replaces_worker(self):
+        pool = TaskPool(_sleep_task, 1, timeout=0.5)
+        try:
+            start = time.monotonic()
+            self.assertEqual(pool.run(60), (60, None, "timed out after 0.5s"))
+            self.assertLess(time.monotonic() - start, 30)
+            # The stuck worker was killed and replaced, so the pool keeps serving
+            self.assertEqual(pool.run(0), (0, 0, None))
+            task, result, error = pool.run(-1)
+            self.assertIsNone(result)
+            self.assertTrue(error)
+            self.assertEqual(pool.run(0.1), (0.1, 0.1, None))
+        finally:
+            pool.close()
+
+    def test_timeout_spares_other_workers(self):
+        pool = TaskPool(_sleep_task, 2, timeout=1)
+        done = []
+        try:
+            for task in (60, 0, 0.2):
+                pool.submit(task)
+            while pool.busy:
+                ready = wait(pool.connections(), timeout=max(0, pool.next_deadline() - time.monotonic()))
+                done.extend(pool.collect(ready))
+        finally:
+            pool.close()
+        self.assertEqual(sorted(done, key=lambda d: d[0]), [(0, 0, None), (0.2, 0.2, None), (60, None, "timed out after 1s")])
+
+if __name__ == '__main__':
+    unittest.main()
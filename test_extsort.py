@@ -0,0 +1,55 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from extsort import RunWriter, merge_sorted_runs, reduce_runs, sort_run
+from postings import IndexReader, IndexWriter
+
+class TestExternalSort(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_extsort"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.run_dir = os.path.join(self.test_dir, "runs")
+        self.index_dir = os.path.join(self.test_dir, "index")
+        os.makedirs(self.run_dir)
+        os.makedirs(self.index_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_runs_match_in_memory_postings(self):
+        terms = ["murder", "bail", "appeal", "court"]
+        docs = [[1, 0, 1, 1, 3], [2, 2], [0, 3, 1, 0, 0, 2, 1], [1], [3, 0, 0]]
+
+        # Tiny runs and fan-in, so documents and terms straddle runs and merge levels
+        runs = RunWriter(self.run_dir, run_records=3)
+        for doc_num, term_ids in enumerate(docs):
+            runs.add_doc(doc_num, term_ids)
+        runs.flush()
+        self.assertEqual(len(runs.run_paths), 6)
+
+        sorted_terms = sorted(terms)
+        ranks = np.array([sorted_terms.index(t) for t in terms], dtype=np.uint32)
+        for path in runs.run_paths:
+            sort_run(path, ranks)
+        run_paths = reduce_runs(runs.run_paths, self.run_dir, block_records=2, fan_in=2)
+        self.assertEqual(len(run_paths), 2)
+
+        with IndexWriter(self.index_dir, [f"doc{i}" for i in range(len(docs))]) as writer:
+            for rank, records in merge_sorted_runs(run_paths, block_records=2):
+                writer.add_occurrences(sorted_terms[rank], records[:, 1], records[:, 2])
+
+        reader = IndexReader(self.index_dir)
+        self.assertEqual(reader.terms, sorted_terms)
+        for tid, term in enumerate(terms):
+            expected = {d: [p for p, t in enumerate(ids) if t == tid] for d, ids in enumerate(docs)}
+            expected = {d: positions for d, positions in expected.items() if positions}
+            self.assertEqual(reader.postings(term), (list(expected), [len(p) for p in expected.values()]))
+            for d, positions in expected.items():
+                self.assertEqual(reader.positions(term, d), positions)
+        reader.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import os
+import shutil
+from generations import (CURRENT, collect_garbage, current_generation, list_generations,
+                         new_generation, publish_generation, resolve_index_dir)
+from postings import IndexWriter
+from docstore import CorpusWriter
+from query import QueryProcessor
+
+class TestGenerations(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_generations"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def build(self, docs):
+        name, out_dir = new_generation(self.test_dir)
+        with CorpusWriter(out_dir) as corpus:
+            for doc_id, _ in docs:
+                corpus.add({"id": doc_id, "text": ""})
+        with IndexWriter(out_dir, [doc_id for doc_id, _ in docs]) as writer:
+            for term in sorted({t for _, tokens in docs for t in tokens}):
+                writer.add(term, [(i, [p for p, t in enumerate(tokens) if t == term])
+                                  for i, (_, tokens) in enumerate(docs) if term in tokens])
+        return name
+
+    def test_publish_and_resolve(self):
+        self.assertEqual(resolve_index_dir(self.test_dir), self.test_dir)
+        first = self.build([("doc1", ["bail", "granted"])])
+        # Unpublished builds are invisible to readers
+        self.assertIsNone(current_generation(self.test_dir))
+        publish_generation(self.test_dir, first)
+        self.assertEqual(current_generation(self.test_dir), first)
+
+        qp = QueryProcessor(index_dir=self.test_dir)
+        self.assertEqual(qp.get_postings("bail"), {"doc1"})
+
+        second = self.build([("doc2", ["bail"]), ("doc3", ["murder"])])
+        publish_generation(self.test_dir, second)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, CURRENT + ".tmp")))
+        # A loaded QueryProcessor keeps its generation; a new one sees the rebuild
+        self.assertEqual(qp.get_postings("bail"), {"doc1"})
+        self.assertEqual(QueryProcessor(index_dir=self.test_dir).get_postings("bail"), {"doc2"})
+        qp.docs.close()
+
+    def test_collect_garbage(self):
+        names = [self.build([("doc1", ["bail"])]) for _ in range(4)]
+        publish_generation(self.test_dir, names[2])
+        # The previous generation and the newer, unpublished one survive
+        self.assertEqual(collect_garbage(self.test_dir), names[:1])
+        self.assertEqual(list_generations(self.test_dir), names[1:])
+        self.assertEqual(collect_garbage(self.test_dir, keep_previous=0), names[1:2])
+
+if __name__ == '__main__':
+    unittest.main()
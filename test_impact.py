@@ -0,0 +1,76 @@
+import unittest
+import os
+import math
+import shutil
+import numpy as np
+from postings import IndexWriter
+from tfidf import TFIDFRanker
+from impact import IMPACTS_FILE, LEVELS, ImpactRanker, impact_path, build_impacts, impact_weights, load_impacts
+
+class TestImpactPostings(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_impact"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        with IndexWriter(self.test_dir, ["doc1", "doc2", "doc3", "doc4"]) as writer:
+            writer.add("bail", [(0, [0, 3, 7]), (2, [1])])
+            writer.add("murder", [(1, [0]), (2, [2, 5])])
+            writer.add("petition", [(0, [1]), (1, [1]), (2, [0]), (3, [0])])
+        build_impacts(self.test_dir)
+        self.ranker = TFIDFRanker(self.test_dir)
+
+    def tearDown(self):
+        self.ranker.index.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_quantized_codes(self):
+        for scheme in ("tfidf", "bm25"):
+            records, scale = load_impacts(self.test_dir, scheme)
+            term_starts, docs, weights = impact_weights(self.ranker.index, self.ranker.doc_lengths,
+                                                        list(self.ranker.idf.values()), scheme)
+            self.assertEqual(records["code"].max(), LEVELS)
+            for t in range(len(term_starts) - 1):
+                rows = records[term_starts[t]:term_starts[t + 1]]
+                # Impact order: highest code first
+                self.assertEqual(rows["code"].tolist(), sorted(rows["code"].tolist(), reverse=True))
+                exact = dict(zip(docs[term_starts[t]:term_starts[t + 1]].tolist(),
+                                 weights[term_starts[t]:term_starts[t + 1]].tolist()))
+                self.assertEqual(sorted(rows["doc"].tolist()), sorted(exact))
+                for doc, code in rows.tolist():
+                    self.assertLessEqual(abs(code * scale - exact[doc]), scale / 2 + 1e-12)
+
+    def test_bm25_weight(self):
+        _, docs, weights = impact_weights(self.ranker.index, self.ranker.doc_lengths, None, "bm25")
+        # "bail" in doc1: tf 3, df 2, |d| 4 of an average 11 / 4
+        idf = math.log(1 + (4 - 2 + 0.5) / (2 + 0.5))
+        self.assertAlmostEqual(weights[0], idf * 3 * 2.2 / (3 + 1.2 * (0.25 + 0.75 * 4 / 2.75)))
+
+    def test_rankings_agree_with_exact(self):
+        for query in (["bail"], ["bail", "murder"], ["murder", "petition", "murder"], ["unknown"]):
+            for use_cosine in (False, True):
+                exact = self.ranker.score(query, {0, 1, 2, 3}, use_cosine)
+                ranked = ImpactRanker(self.ranker, "tfidf").score(query, {0, 1, 2, 3}, use_cosine)
+                self.assertEqual([d for d, _ in ranked], [d for d, _ in exact])
+                for (_, score), (_, want) in zip(ranked, exact):
+                    self.assertAlmostEqual(score, want, delta=0.05 * max(want, 1e-9) + 1e-9)
+            exact = ImpactRanker(self.ranker, "bm25", quantized=False).score(query, {0, 1, 2, 3}, k=2)
+            ranked = ImpactRanker(self.ranker, "bm25").score(query, {0, 1, 2, 3}, k=2)
+            self.assertEqual([d for d, _ in ranked], [d for d, _ in exact])
+
+    def test_missing_impacts_not_written(self):
+        built = ImpactRanker(self.ranker, "tfidf")
+        values, scale = built.values.tolist(), built.scale
+        del built # releases the memory-mapped impact file
+        for scheme in ("tfidf", "bm25"):
+            os.remove(impact_path(self.test_dir, scheme))
+        os.remove(os.path.join(self.test_dir, IMPACTS_FILE))
+        files = sorted(os.listdir(self.test_dir))
+        computed = ImpactRanker(self.ranker, "tfidf")
+        self.assertEqual(computed.values.tolist(), values)
+        self.assertEqual(computed.scale, scale)
+        self.assertEqual(sorted(os.listdir(self.test_dir)), files)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import os
+import shutil
+from pages import page_for_offset, pages_path_for, read_page_offsets, split_pages, write_page_offsets
+
+class TestPageOffsets(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_pages"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_sidecar_roundtrip(self):
+        txt_path = os.path.join(self.test_dir, "doc1.txt")
+        self.assertEqual(pages_path_for(txt_path), os.path.join(self.test_dir, "doc1.pages"))
+        self.assertIsNone(read_page_offsets(pages_path_for(txt_path)))
+        write_page_offsets(pages_path_for(txt_path), [0, 12, 12, 70000])
+        self.assertEqual(read_page_offsets(pages_path_for(txt_path)), [0, 12, 12, 70000])
+
+    def test_page_for_offset(self):
+        offsets = [0, 10, 25]
+        self.assertEqual(page_for_offset(offsets, 0), 1)
+        self.assertEqual(page_for_offset(offsets, 9), 1)
+        # A page starts at its own offset
+        self.assertEqual(page_for_offset(offsets, 10), 2)
+        self.assertEqual(page_for_offset(offsets, 24), 2)
+        self.assertEqual(page_for_offset(offsets, 25), 3)
+        self.assertEqual(page_for_offset(offsets, 1000), 3)
+        # No sidecar, or the first page not starting at 0
+        self.assertEqual(page_for_offset([], 50), 1)
+        self.assertEqual(page_for_offset([5, 10], 0), 1)
+
+    def test_empty_pages(self):
+        # Pages 2 and 3 are empty, so pages 2, 3 and 4 all start at offset 6
+        pages = ["first\n", "", "", "fourth\n", ""]
+        offsets = [0, 6, 6, 6, 13]
+        text = "".join(pages)
+        self.assertEqual(list(split_pages(text, offsets)), pages)
+        # Text at offset 6 is on page 4, the first non-empty page starting there
+        self.assertEqual(page_for_offset(offsets, 5), 1)
+        self.assertEqual(page_for_offset(offsets, 6), 4)
+        self.assertEqual(page_for_offset(offsets, 12), 4)
+        self.assertEqual(page_for_offset(offsets, 13), 5)
+        self.assertEqual(list(split_pages(text, [])), [text])
+
+if __name__ == '__main__':
+    unittest.main()
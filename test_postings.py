@@ -0,0 +1,192 @@
+import unittest
+import os
+import math
+import shutil
+from stats import STATS_FILES, load_stats
+from tfidf import TFIDFRanker
+import numpy as np
+from postings import (SKIPS_FILE, SKIP_INTERVAL, SKIP_MIN, IndexReader, IndexWriter, MemoryIndex, compute_skips,
+                      decode_varint_stream, decode_varints, encode_varints, open_index)
+
+class TestBinaryIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_postings"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_varint_roundtrip(self):
+        values = [0, 1, 127, 128, 300, 16383, 16384, 2**32 - 1]
+        buf = bytearray()
+        encode_varints(values, buf)
+        self.assertEqual(decode_varints(buf), values)
+        self.assertEqual(decode_varint_stream(bytes(buf)).tolist(), values)
+
+    def test_roundtrip(self):
+        with IndexWriter(self.test_dir, ["doc1", "doc2", "doc3"]) as writer:
+            writer.add("apple", [(0, [0, 5]), (2, [1])])
+            writer.add("banana", [(1, [200, 70000])])
+            writer.add("orange", [(0, [2]), (1, [1]), (2, [0, 3, 4])])
+
+        reader = IndexReader(self.test_dir)
+        self.assertEqual(reader.terms, ["apple", "banana", "orange"])
+        self.assertEqual(list(reader.dfs), [2, 1, 3])
+        self.assertEqual(reader.postings("orange"), ([0, 1, 2], [1, 1, 3]))
+        self.assertEqual(reader.positions("banana", 1), [200, 70000])
+        self.assertEqual(reader.positions("apple", 0), [0, 5])
+        self.assertIsNone(reader.positions("apple", 1))
+        self.assertEqual(reader.doc_nums["doc3"], 2)
+        self.assertNotIn("grape", reader)
+        self.assertEqual(reader.postings("grape"), ([], []))
+        self.assertIsNone(reader.positions("grape", 0))
+        reader.close()
+
+    def test_memory_index(self):
+        with IndexWriter(self.test_dir, ["doc1", "doc2", "doc3"]) as writer:
+            writer.add("apple", [(0, [0, 5]), (2, [1])])
+            writer.add("banana", [(1, [200, 70000])])
+            writer.add("orange", [(0, [2]), (1, [1]), (2, [0, 3, 4])])
+
+        reader = IndexReader(self.test_dir)
+        memory = MemoryIndex(self.test_dir)
+        self.assertEqual(memory.terms, reader.terms)
+        self.assertEqual(memory.n_docs, 3)
+        for term in reader.terms + ["grape"]:
+            self.assertEqual(memory.postings(term), reader.postings(term))
+            for doc_num in range(3):
+                self.assertEqual(memory.positions(term, doc_num), reader.positions(term, doc_num))
+        reader.close()
+
+    def test_positions_read_on_demand(self):
+        with IndexWriter(self.test_dir, ["doc1", "doc2", "doc3"]) as writer:
+            writer.add("apple", [(0, [0, 5]), (2, [1])])
+            writer.add("orange", [(0, [2]), (1, [1]), (2, [0, 3, 4])])
+
+        # Ranking only reads doc numbers and term frequencies
+        ranker = TFIDFRanker(self.test_dir)
+        ranked = ranker.score(["apple", "orange"], {0, 1, 2})
+        self.assertEqual(ranked[0][0], 0)
+        self.assertEqual(len(ranker.index.cache), 0)
+        self.assertEqual(ranker.index.positions("orange", 2), [0, 3, 4])
+        self.assertEqual(list(ranker.index.cache), ["orange"])
+        ranker.index.close()
+
+        memory = MemoryIndex(self.test_dir)
+        self.assertEqual(memory.postings("apple"), ([0, 2], [2, 1]))
+        self.assertEqual(len(memory.reader.cache), 0)
+        memory.close()
+
+    def test_skip_pointers(self):
+        n_docs = 5000
+        # Uneven gaps, some needing two varint bytes
+        common = [d for d in range(n_docs) if d % 3 != 1 and d % 157 != 0 and not 2000 <= d < 2300]
+        with IndexWriter(self.test_dir, [f"doc{i}" for i in range(n_docs)]) as writer:
+            writer.add("appeal", [(d, [0]) for d in common])
+            writer.add("bail", [(3, [0]), (700, [1])])
+            # Streamed in pieces, as the external build writes it
+            for piece in np.array_split(np.array(common[::2], dtype=np.int64), 5):
+                writer.add_occurrences("court", piece, np.zeros(len(piece), dtype=np.int64))
+
+        reader = IndexReader(self.test_dir)
+        starts, docs, offsets = reader.skips
+        self.assertGreater(len(common[::2]), SKIP_MIN)
+        # One entry per block of SKIP_INTERVAL postings plus a closing one; none for bail
+        entries = [math.ceil(len(common) / SKIP_INTERVAL) + 1, 0, math.ceil(len(common[::2]) / SKIP_INTERVAL) + 1]
+        self.assertEqual(starts.tolist(), [0, entries[0], entries[0], sum(entries)])
+        # Written by the writer as they would be computed for an older build
+        expected = compute_skips(reader)
+        self.assertEqual(list(expected[0]), starts.tolist())
+        self.assertEqual(expected[1].tolist(), docs.tolist())
+        self.assertEqual(expected[2].tolist(), offsets.tolist())
+
+        for term in ("appeal", "bail", "court"):
+            full = reader.doc_array(term)
+            self.assertEqual(full.tolist(), reader.postings(term)[0])
+            for candidates in ([0], [2, 3, 999, 2100, 2301], [64, 65, 128, 640], list(range(0, n_docs, 97)), [common[-1], n_docs - 1]):
+                candidates = np.unique(np.array(candidates, dtype=np.int64))
+                self.assertEqual(reader.intersect(term, candidates).tolist(),
+                                 sorted(set(candidates.tolist()) & set(full.tolist())))
+        reader.close()
+
+    def test_stats(self):
+        with IndexWriter(self.test_dir, ["doc1", "doc2", "doc3"]) as writer:
+            writer.add("apple", [(0, [0, 5]), (2, [1])])
+            writer.add("banana", [(1, [200, 70000])])
+            writer.add("orange", [(0, [2]), (1, [1]), (2, [0, 3, 4])])
+
+        doc_lengths, doc_norms, idf, max_weights = load_stats(self.test_dir)
+        self.assertEqual(doc_lengths.tolist(), [3, 3, 4])
+        self.assertEqual(idf.tolist(), [math.log10(3 / 2), math.log10(3), 0.0])
+        self.assertEqual(max_weights.tolist(), [(1 + math.log10(2)) * math.log10(3 / 2), (1 + math.log10(2)) * math.log10(3), 0.0])
+        self.assertAlmostEqual(doc_norms[0], (1 + math.log10(2)) * math.log10(3 / 2))
+        self.assertAlmostEqual(doc_norms[1], (1 + math.log10(2)) * math.log10(3))
+
+    def test_norm_summation_order(self):
+        # doc0 and doc1 hold the same terms with the same tfs, in opposite token order;
+        # the filler docs set each term's df. Summed in token order, their norms differ
+        # in the last bit; summed in dictionary order they are identical.
+        dfs = [2, 3, 3, 12, 6, 10, 9, 7, 2, 19, 6, 14]
+        tfs = [4, 5, 3, 5, 4, 5, 3, 1, 1, 3, 4, 3]
+        terms = [f"t{i:02d}" for i in range(len(dfs))]
+        tokens = [[t for t, tf in zip(terms, tfs) for _ in range(tf)]]
+        tokens.append(tokens[0][::-1])
+        tokens += [[t for t, df in zip(terms, dfs) if d < df - 2] for d in range(18)]
+        with IndexWriter(self.test_dir, [f"doc{d}" for d in range(len(tokens))]) as writer:
+            for term in terms:
+                writer.add(term, [(d, [p for p, t in enumerate(doc) if t == term])
+                                  for d, doc in enumerate(tokens) if term in doc])
+
+        _, doc_norms, idf, _ = load_stats(self.test_dir)
+        self.assertEqual(idf.tolist(), [math.log10(20 / df) for df in dfs])
+        w2 = [((1 + math.log10(tf)) * math.log10(20 / df)) ** 2 for tf, df in zip(tfs, dfs)]
+        self.assertEqual(doc_norms[0], math.sqrt(sum(w2)))
+        self.assertEqual(doc_norms[1], doc_norms[0])
+        # The old token order sum for doc1, close to but not the same float
+        self.assertNotEqual(math.sqrt(sum(w2[::-1])), doc_norms[1])
+        self.assertAlmostEqual(math.sqrt(sum(w2[::-1])), doc_norms[1], places=12)
+
+        ranker = TFIDFRanker(self.test_dir)
+        (_, first), (_, second) = ranker.score(terms[:3], {0, 1}, use_cosine=True)
+        self.assertEqual(first, second)
+        ranker.index.close()
+
+    def test_missing_artifacts_computed_in_memory(self):
+        n_docs = 2000
+        with IndexWriter(self.test_dir, [f"doc{i}" for i in range(n_docs)]) as writer:
+            writer.add("appeal", [(d, [0]) for d in range(0, n_docs, 3)])
+            writer.add("court", [(d, [0, 1]) for d in range(n_docs)])
+        written = load_stats(self.test_dir)
+        reader = IndexReader(self.test_dir)
+        skips = reader.skips
+        reader.close()
+        # An older build: no statistics or skip pointers, and a directory that must stay as it is
+        for name in STATS_FILES + (SKIPS_FILE,):
+            os.remove(os.path.join(self.test_dir, name))
+        files = sorted(os.listdir(self.test_dir))
+
+        for in_memory in (False, True):
+            index, stats = open_index(self.test_dir, in_memory)
+            for got, want in zip(stats, written):
+                self.assertEqual(got.tolist(), want.tolist())
+            disk = index.reader if in_memory else index
+            for got, want in zip(disk.skips, skips):
+                self.assertEqual(got.tolist(), want.tolist())
+            self.assertEqual(index.intersect("court", np.array([5, 1999])).tolist(), [5, 1999])
+            index.close()
+            self.assertEqual(sorted(os.listdir(self.test_dir)), files)
+
+    def test_empty_index(self):
+        with IndexWriter(self.test_dir, []):
+            pass
+        reader = IndexReader(self.test_dir)
+        self.assertEqual(len(reader), 0)
+        self.assertNotIn("apple", reader)
+        reader.close()
+        self.assertEqual(MemoryIndex(self.test_dir).postings("apple"), ([], []))
+
+if __name__ == '__main__':
+    unittest.main()
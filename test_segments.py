@@ -0,0 +1,165 @@
+import unittest
+import os
+import sys
+import shutil
+import subprocess
+import segments
+from segments import (DirLock, LIVE_DIR, LOCK, SegmentSet, load_manifest, merge_segments, save_manifest,
+                      update_index)
+from stats import compute_stats
+from tfidf import weight_matrix
+from query import QueryProcessor
+
+class TestSegments(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_segments"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.extracted_dir = os.path.join(self.test_dir, "extracted")
+        self.index_dir = os.path.join(self.test_dir, "index")
+        os.makedirs(self.extracted_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write_doc(self, doc_id, text):
+        path = os.path.join(self.extracted_dir, doc_id + ".txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        # Make sure a rewrite within the same clock tick still looks changed
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    def search(self, query):
+        qp = QueryProcessor(index_dir=self.index_dir)
+        results, _ = qp.process_query(query)
+        hits = {r["id"]: r["score"] for r in results}
+        qp.docs.close()
+        return hits
+
+    def test_add_change_delete(self):
+        self.write_doc("doc1", "bail granted to the petitioner")
+        self.write_doc("doc2", "murder appeal dismissed")
+        update_index(self.extracted_dir, self.index_dir, merge="off")
+        self.assertEqual(set(self.search("bail OR murder")), {"doc1", "doc2"})
+
+        self.write_doc("doc3", "bail refused in murder case")
+        self.write_doc("doc1", "land revenue dispute")
+        os.remove(os.path.join(self.extracted_dir, "doc2.txt"))
+        update_index(self.extracted_dir, self.index_dir, merge="off")
+
+        self.assertEqual(set(self.search("bail")), {"doc3"})
+        self.assertEqual(set(self.search("murder")), {"doc3"})
+        self.assertEqual(set(self.search("revenue")), {"doc1"})
+        manifest = load_manifest(self.index_dir)
+        self.assertEqual(len(manifest["segments"]), 2)
+        self.assertEqual(sorted(manifest["segments"][0]["deleted"]), ["doc1", "doc2"])
+
+    def test_global_idf_matches_single_segment(self):
+        docs = {
+            "doc1": "bail bail petition",
+            "doc2": "bail murder",
+            "doc3": "petition dismissed",
+            "doc4": "murder murder appeal",
+        }
+        for doc_id, text in docs.items():
+            self.write_doc(doc_id, text)
+        update_index(self.extracted_dir, self.index_dir, merge="off")
+        single = self.search("bail petition murder")
+
+        shutil.rmtree(self.index_dir)
+        for doc_id in docs:
+            os.remove(os.path.join(self.extracted_dir, doc_id + ".txt"))
+        for doc_id, text in docs.items():
+            self.write_doc(doc_id, text)
+            update_index(self.extracted_dir, self.index_dir, merge="off")
+        self.assertEqual(len(load_manifest(self.index_dir)["segments"]), 4)
+        self.assertEqual(self.search("bail petition murder"), single)
+
+    def test_merge_compacts_segments(self):
+        old_factor = segments.MERGE_FACTOR
+        segments.MERGE_FACTOR = 3
+        try:
+            for i in range(3):
+                self.write_doc(f"doc{i}", f"petition number{i}")
+                update_index(self.extracted_dir, self.index_dir, merge="off")
+            self.write_doc("doc0", "appeal")
+            update_index(self.extracted_dir, self.index_dir, merge="off")
+            before = self.search("petition OR appeal")
+
+            merge_segments(self.index_dir)
+            manifest = load_manifest(self.index_dir)
+            self.assertEqual([s["docs"] for s in manifest["segments"]], [3])
+            self.assertEqual(self.search("petition OR appeal"), before)
+            self.assertEqual(set(os.listdir(os.path.join(self.index_dir, "segments"))),
+                             {s["name"] for s in manifest["segments"]})
+        finally:
+            segments.MERGE_FACTOR = old_factor
+
+    def test_stale_lock_is_broken(self):
+        os.makedirs(self.index_dir)
+        lock_path = os.path.join(self.index_dir, LOCK)
+        # A lock left by a process that has exited
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        with open(lock_path, "w") as f:
+            f.write(str(dead.pid))
+        self.write_doc("doc1", "bail granted")
+        update_index(self.extracted_dir, self.index_dir, merge="off")
+        self.assertFalse(os.path.exists(lock_path))
+
+        # Held by a running process: waits, then gives up
+        with DirLock(lock_path):
+            with self.assertRaises(TimeoutError):
+                DirLock(lock_path, timeout=0.2).acquire()
+
+    def test_search_does_not_lock(self):
+        self.write_doc("doc1", "bail granted")
+        update_index(self.extracted_dir, self.index_dir, merge="off")
+        files = sorted(os.listdir(self.index_dir))
+        # Opening for search neither waits for an ingest nor writes to the index dir
+        with DirLock(os.path.join(self.index_dir, LOCK), timeout=0):
+            self.assertEqual(set(self.search("bail")), {"doc1"})
+        self.assertEqual(sorted(os.listdir(self.index_dir)), files)
+
+    def test_live_stats_persisted(self):
+        old_factor = segments.MERGE_FACTOR
+        segments.MERGE_FACTOR = 3
+        try:
+            for i, text in enumerate(["bail bail petition", "bail murder", "petition dismissed"]):
+                self.write_doc(f"doc{i}", text)
+                update_index(self.extracted_dir, self.index_dir, merge="off")
+            self.write_doc("doc1", "murder murder appeal")
+            os.remove(os.path.join(self.extracted_dir, "doc2.txt"))
+            update_index(self.extracted_dir, self.index_dir, merge="off")
+            before = self.search("bail OR murder OR appeal")
+            for merge in (False, True):
+                if merge:
+                    merge_segments(self.index_dir)
+                manifest = load_manifest(self.index_dir)
+                # Only the live dir of the saved manifest is kept
+                self.assertEqual(os.listdir(os.path.join(self.index_dir, LIVE_DIR)), [manifest["stats"]])
+
+                # Loaded as written, equal to the statistics computed from the postings
+                loaded = SegmentSet(self.index_dir)
+                self.assertIsNotNone(loaded.weights)
+                manifest.pop("stats")
+                save_manifest(self.index_dir, manifest)
+                computed = SegmentSet(self.index_dir)
+                self.assertIsNone(computed.weights)
+                self.assertEqual(loaded.index.terms, computed.index.terms)
+                self.assertEqual(loaded.index.dfs, computed.index.dfs)
+                for got, want in zip(loaded.stats, compute_stats(computed.index)):
+                    self.assertEqual(got.tolist(), want.tolist())
+                self.assertEqual((loaded.weights[0] != weight_matrix(computed.index, computed.stats[2])).nnz, 0)
+                for segment_set in (loaded, computed):
+                    segment_set.index.close()
+                    segment_set.docs.close()
+                self.assertEqual(self.search("bail OR murder OR appeal"), before)
+                update_index(self.extracted_dir, self.index_dir, merge="off")
+        finally:
+            segments.MERGE_FACTOR = old_factor
+
+if __name__ == '__main__':
+    unittest.main()
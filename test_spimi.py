@@ -0,0 +1,87 @@
+import unittest
+import os
+import json
+import shutil
+import build
+from analyzer import analyze
+from generations import resolve_index_dir
+from pages import pages_path_for, write_page_offsets
+from spimi import merge_runs, run_workers
+from textstore import pack_texts
+
+DOCS = {
+    "doc1": ["Bail granted to the petitioner.\n", "Petition for bail allowed.\n"],
+    "doc2": ["Murder appeal dismissed; bail refused.\n"],
+    "doc3": ["Writ petition in the High Court.\n", "", "Court order on the writ.\n"],
+    "doc4": ["Appeal against conviction for murder.\n"],
+    "doc5": ["Bail, bail and bail again.\n", "Order.\n"],
+}
+
+class TestSpimiBuild(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_spimi"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.extracted_dir = os.path.join(self.test_dir, "extracted")
+        os.makedirs(self.extracted_dir)
+        for doc_id, pages in DOCS.items():
+            txt_path = os.path.join(self.extracted_dir, doc_id + ".txt")
+            with open(txt_path, "w", encoding="utf-8") as f:
+                f.write("".join(pages))
+            offsets = [sum(len(p) for p in pages[:i]) for i in range(len(pages))]
+            write_page_offsets(pages_path_for(txt_path), offsets)
+        self.old_dirs = build.EXTRACTED_DIR, build.INDEX_DIR
+        build.EXTRACTED_DIR = self.extracted_dir
+
+    def tearDown(self):
+        build.EXTRACTED_DIR, build.INDEX_DIR = self.old_dirs
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_runs_match_in_memory_postings(self):
+        texts_path = os.path.join(self.test_dir, "texts.pack")
+        pack_texts(self.extracted_dir, texts_path)
+        run_dir = os.path.join(self.test_dir, "runs")
+        os.makedirs(run_dir)
+        docs = [(i, doc_id, [sum(len(p) for p in pages[:j]) for j in range(len(pages))])
+                for i, (doc_id, pages) in enumerate(DOCS.items())]
+
+        # A zero budget flushes a run after every document, over two workers
+        results = run_workers(texts_path, docs, run_dir, workers=2, memory_mb=0)
+        run_paths = [path for runs, _, _ in results for path in runs]
+        self.assertEqual(len(run_paths), len(DOCS))
+
+        expected = {}
+        for doc_index, (_, pages) in enumerate(DOCS.items()):
+            tokens = [t for page in pages for t in analyze(page)]
+            for term in dict.fromkeys(tokens):
+                expected.setdefault(term, []).append([doc_index, [p for p, t in enumerate(tokens) if t == term]])
+        merged = list(merge_runs(run_paths))
+        self.assertEqual([term for term, _ in merged], sorted(expected))
+        self.assertEqual(dict(merged), expected)
+
+    def test_build_matches_in_memory_build(self):
+        index_dirs = {}
+        for mode in ("memory", "spimi"):
+            build.INDEX_DIR = os.path.join(self.test_dir, "index-" + mode)
+            if mode == "memory":
+                build.build_index()
+            else:
+                build.build_index_spimi(workers=2, memory_mb=0)
+            index_dirs[mode] = resolve_index_dir(build.INDEX_DIR)
+            # Publishing keeps the top-level vocab.txt, refreshed from the new generation
+            with open(os.path.join(build.INDEX_DIR, "vocab.txt"), "rb") as f_top, \
+                 open(os.path.join(index_dirs[mode], "vocab.txt"), "rb") as f_gen:
+                self.assertEqual(f_top.read(), f_gen.read())
+
+        for name in ("index.dict", "index.post", "index.pos", "vocab.txt", "texts.pack", "corpus.jsonl"):
+            with open(os.path.join(index_dirs["memory"], name), "rb") as f_memory, \
+                 open(os.path.join(index_dirs["spimi"], name), "rb") as f_spimi:
+                self.assertEqual(f_spimi.read(), f_memory.read(), name)
+        for name in ("preprocess.json", "pages.json"):
+            with open(os.path.join(index_dirs["memory"], name), "r", encoding="utf-8") as f_memory, \
+                 open(os.path.join(index_dirs["spimi"], name), "r", encoding="utf-8") as f_spimi:
+                self.assertEqual(json.load(f_spimi), json.load(f_memory), name)
+
+if __name__ == '__main__':
+    unittest.main()
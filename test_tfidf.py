@@ -0,0 +1,123 @@
+import unittest
+import os
+import math
+import random
+import shutil
+import numpy as np
+from postings import IndexWriter
+from tfidf import TFIDFRanker, build_weights
+
+class TestTFIDFRanker(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_tfidf"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        with IndexWriter(self.test_dir, ["doc1", "doc2", "doc3", "doc4"]) as writer:
+            writer.add("bail", [(0, [0, 3, 7]), (2, [1])])
+            writer.add("murder", [(1, [0]), (2, [2, 5])])
+            writer.add("petition", [(0, [1]), (1, [1]), (2, [0]), (3, [0])])
+        self.ranker = TFIDFRanker(self.test_dir)
+
+    def tearDown(self):
+        self.ranker.index.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def reference(self, query_terms, candidate_docs, use_cosine):
+        # The per-document loop the vectorized scorer replaces
+        tfs = {"bail": {0: 3, 2: 1}, "murder": {1: 1, 2: 2}, "petition": {0: 1, 1: 1, 2: 1, 3: 1}}
+        idf = {t: math.log10(4 / len(docs)) for t, docs in tfs.items()}
+        counts = {t: query_terms.count(t) for t in query_terms}
+        q_len = math.sqrt(sum(((1 + math.log10(c)) * idf[t]) ** 2 for t, c in counts.items() if t in idf))
+        scores = {}
+        for d in candidate_docs:
+            dot = 0
+            for t in query_terms:
+                if d in tfs.get(t, {}):
+                    dot += (1 + math.log10(tfs[t][d])) * idf[t] * ((1 + math.log10(counts[t])) * idf[t])
+            norm = self.ranker.doc_norms[d]
+            scores[d] = (dot / (norm * q_len) if norm > 0 and q_len > 0 else 0) if use_cosine else dot
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+    def test_matches_reference(self):
+        for query in (["bail"], ["bail", "murder"], ["murder", "bail", "murder"], ["petition", "unknown"], ["unknown"]):
+            for use_cosine in (False, True):
+                expected = self.reference(query, {0, 1, 2, 3}, use_cosine)
+                ranked = self.ranker.score(query, {0, 1, 2, 3}, use_cosine)
+                self.assertEqual([d for d, _ in ranked], [d for d, _ in expected])
+                for (_, score), (_, want) in zip(ranked, expected):
+                    self.assertAlmostEqual(score, want, places=12)
+
+    def test_top_k_matches_full_ranking(self):
+        for query in (["bail"], ["petition"], ["bail", "murder"], ["murder", "petition", "murder"], ["unknown"]):
+            for use_cosine in (False, True):
+                ranked = self.ranker.score(query, {0, 1, 2, 3}, use_cosine)
+                for k in (0, 1, 2, 3):
+                    self.assertEqual(self.ranker.score(query, {0, 1, 2, 3}, use_cosine, k=k), ranked[:k])
+
+    def test_built_weights_memory_mapped(self):
+        computed = self.ranker
+        build_weights(self.test_dir)
+        self.ranker = TFIDFRanker(self.test_dir)
+        computed.index.close()
+        # Read-only views of the mapped files, not copies
+        for part in ("data", "indices", "indptr"):
+            self.assertFalse(getattr(self.ranker.weights, part).flags.writeable)
+            self.assertTrue(getattr(computed.weights, part).flags.writeable)
+        self.assertIsInstance(self.ranker.max_cosine, np.memmap)
+        self.assertEqual((self.ranker.weights != computed.weights).nnz, 0)
+        self.assertEqual(self.ranker.max_cosine.tolist(), computed.max_cosine.tolist())
+        for query in (["bail"], ["bail", "murder"], ["murder", "petition", "murder"]):
+            for use_cosine in (False, True):
+                ranked = computed.score(query, {0, 1, 2, 3}, use_cosine)
+                self.assertEqual(self.ranker.score(query, {0, 1, 2, 3}, use_cosine), ranked)
+                self.assertEqual(self.ranker.score(query, {0, 1, 2, 3}, use_cosine, k=2), ranked[:2])
+
+    def test_empty_candidates(self):
+        self.assertEqual(self.ranker.score(["bail"], set()), [])
+
+class TestMaxScore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_data_maxscore"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        rng = random.Random(7)
+        n_docs = 400
+        # Skewed frequencies: "court" is in every document once (a low bound), "bail"
+        # in many with small tfs, "murder" in a few with large tfs (a high bound)
+        tfs = {
+            "court": {d: 1 for d in range(n_docs)},
+            "bail": {d: rng.randint(1, 3) for d in range(n_docs) if rng.random() < 0.5},
+            "murder": {d: rng.randint(5, 40) for d in range(n_docs) if rng.random() < 0.05},
+            "appeal": {d: rng.randint(1, 10) for d in range(n_docs) if rng.random() < 0.2},
+        }
+        with IndexWriter(self.test_dir, [f"doc{d}" for d in range(n_docs)]) as writer:
+            for term in sorted(tfs):
+                writer.add(term, [(d, list(range(tf))) for d, tf in sorted(tfs[term].items())])
+        self.ranker = TFIDFRanker(self.test_dir)
+        self.candidates = set(range(n_docs))
+
+    def tearDown(self):
+        self.ranker.index.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_top_k_matches_exhaustive(self):
+        queries = (["murder", "bail", "court"], ["murder", "appeal", "bail"], ["appeal", "court", "appeal"], ["bail", "court"])
+        for query in queries:
+            for use_cosine in (False, True):
+                ranked = self.ranker.score(query, self.candidates, use_cosine)
+                for k in (1, 5, 10, 50, 399):
+                    self.assertEqual(self.ranker.score(query, self.candidates, use_cosine, k=k), ranked[:k])
+
+    def test_low_bound_terms_skipped(self):
+        # "court" (and "bail") cannot lift a document into the top 5 once "murder" is scored
+        ranked = self.ranker.score(["murder", "bail", "court"], self.candidates)
+        before = self.ranker.nonessential_terms
+        self.assertEqual(self.ranker.score(["murder", "bail", "court"], self.candidates, k=5), ranked[:5])
+        self.assertEqual(self.ranker.nonessential_terms - before, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import glob
+import mmap
+import zlib
+import struct
+from array import array
+import sys
+
+# Packfile layout:
+#   MAGIC
+#   one zlib block per document
+#   offset table: count + 1 little-endian uint64 (block i is offsets[i]:offsets[i+1])
+#   doc ids, utf-8, newline separated
+#   footer: table offset, ids offset, count, MAGIC
+MAGIC = b"LHCPACK1"
+FOOTER = struct.Struct("<QQQ8s")
+
+class PackWriter:
+    """
+    Writes documents into a packfile, each compressed on its own so it can be
+    read back without touching its neighbours.
+    """
+    def __init__(self, path, level=6):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.level = level
+        self.f = open(self.tmp_path, "wb")
+        self.f.write(MAGIC)
+        self.offsets = array("Q", [len(MAGIC)])
+        self.ids = []
+
+    def add(self, doc_id, text):
+        block = zlib.compress(text.encode("utf-8"), self.level)
+        self.f.write(block)
+        self.offsets.append(self.offsets[-1] + len(block))
+        self.ids.append(doc_id)
+
+    def close(self):
+        table_offset = self.offsets[-1]
+        offsets = array("Q", self.offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        self.f.write(offsets.tobytes())
+        ids_offset = self.f.tell()
+        self.f.write("\n".join(self.ids).encode("utf-8"))
+        self.f.write(FOOTER.pack(table_offset, ids_offset, len(self.ids), MAGIC))
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+            os.remove(self.tmp_path)
+
+class PackReader:
+    """
+    Random access to a packfile through mmap: fetching a document is one
+    slice of the map plus one decompress.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        table_offset, ids_offset, count, magic = FOOTER.unpack(self.mm[-FOOTER.size:])
+        if magic != MAGIC or self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a text packfile")
+        self.offsets = array("Q")
+        self.offsets.frombytes(self.mm[table_offset:ids_offset])
+        if sys.byteorder != "little":
+            self.offsets.byteswap()
+        ids_blob = self.mm[ids_offset:len(self.mm) - FOOTER.size].decode("utf-8")
+        self.ids = ids_blob.split("\n") if count else []
+        self.slots = {doc_id: i for i, doc_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.slots
+
+    def _block(self, doc_id):
+        i = self.slots.get(doc_id)
+        if i is None:
+            return None
+        return self.mm[self.offsets[i]:self.offsets[i + 1]]
+
+    def get(self, doc_id):
+        """
+        Returns the full text of a document, or None if it is not in the pack.
+        """
+        block = self._block(doc_id)
+        if block is None:
+            return None
+        return zlib.decompress(block).decode("utf-8")
+
+    def get_prefix(self, doc_id, n_chars):
+        """
+        Returns roughly the first n_chars characters, decompressing only as much as needed.
+        """
+        block = self._block(doc_id)
+        if block is None:
+            return None
+        # A character is at most 4 bytes in utf-8
+        data = zlib.decompressobj().decompress(block, n_chars * 4)
+        return data.decode("utf-8", errors="ignore")[:n_chars]
+
+    def items(self):
+        """
+        Yields (doc_id, text) in pack order.
+        """
+        for doc_id in self.ids:
+            yield doc_id, self.get(doc_id)
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def pack_texts(extracted_dir, pack_path):
+    """
+    Packs every <doc_id>.txt in extracted_dir into one packfile.
+    Returns {doc_id: txt_path} for the packed documents.
+    """
+    paths = {}
+    with PackWriter(pack_path) as writer:
+        for txt_file in sorted(glob.glob(os.path.join(extracted_dir, "*.txt"))):
+            doc_id = os.path.splitext(os.path.basename(txt_file))[0]
+            with open(txt_file, "r", encoding="utf-8") as f:
+                writer.add(doc_id, f.read())
+            paths[doc_id] = txt_file
+    return paths
@@ -1,58 +1,133 @@
-import json
-import gzip
-import math
 import os
-from collections import defaultdict, Counter
+import math
+from collections import defaultdict
+import numpy as np
+from scipy.sparse import csr_matrix
+from segments import SegmentSet, is_segmented
+from postings import open_index
+from generations import resolve_index_dir
+
+# The weight matrix as written by a full build, memory-mapped at load:
+#   weights_<part>.npy  the CSR arrays (data, indices, indptr) of weight_matrix()
+#   cosine_max.npy      cosine_bounds() of it, the per-term cosine score bound
+WEIGHT_PARTS = ("data", "indices", "indptr")
+COSINE_MAX_FILE = "cosine_max.npy"
+
+def weights_path(index_dir, part):
+    return os.path.join(index_dir, f"weights_{part}.npy")
+
+def log10_tfs(tfs):
+    """
+    log10 of each tf, with math.log10 over the few distinct values: np.log10 can
+    differ in the last bit, and scores must match the per-document formula.
+    """
+    distinct, inverse = np.unique(tfs, return_inverse=True)
+    return np.array([math.log10(tf) for tf in distinct.tolist()], dtype=np.float64)[inverse]
+
+def weight_matrix(index, idf):
+    """
+    Sparse matrix of document weights w_td = (1 + log10 tf) * idf, one CSR row per
+    term (i.e. the doc-term matrix stored by column), built from the postings.
+    """
+    term_starts, docs, tfs = index.arrays()
+    idf_per_posting = np.repeat(np.asarray(idf, dtype=np.float64), np.diff(term_starts))
+    data = (1 + log10_tfs(tfs)) * idf_per_posting
+    return csr_matrix((data, docs, term_starts), shape=(len(index.terms), len(index.doc_ids)))
+
+def cosine_bounds(weights, doc_norms):
+    """
+    Largest w_td / |d| per term row, the most a term can add to a cosine score
+    before dividing by the query length.
+    """
+    bounds = np.zeros(weights.shape[0])
+    if weights.nnz == 0:
+        return bounds
+    norms = doc_norms[weights.indices]
+    ratios = np.divide(weights.data, norms, out=np.zeros(len(norms)), where=norms > 0)
+    nonempty = np.flatnonzero(np.diff(weights.indptr))
+    bounds[nonempty] = np.maximum.reduceat(ratios, weights.indptr[nonempty])
+    return bounds
+
+def save_weights(index_dir, weights, max_cosine):
+    for part in WEIGHT_PARTS:
+        np.save(weights_path(index_dir, part), getattr(weights, part))
+    np.save(os.path.join(index_dir, COSINE_MAX_FILE), max_cosine)
+
+def load_weights(index_dir, shape):
+    """
+    Memory-maps (weights, max_cosine), or returns None if they were never written.
+    """
+    paths = [weights_path(index_dir, part) for part in WEIGHT_PARTS] + [os.path.join(index_dir, COSINE_MAX_FILE)]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    data, indices, indptr, max_cosine = (np.load(path, mmap_mode="r") for path in paths)
+    return csr_matrix((data, indices, indptr), shape=shape, copy=False), max_cosine
+
+def build_weights(index_dir):
+    """
+    Writes the weight matrix and its cosine bounds for the binary index in index_dir.
+    """
+    index, (_, doc_norms, idf, _) = open_index(index_dir)
+    try:
+        weights = weight_matrix(index, idf)
+        save_weights(index_dir, weights, cosine_bounds(weights, np.asarray(doc_norms)))
+    finally:
+        index.close()
 
 class TFIDFRanker:
-    def __init__(self, index_dir="data/index"):
+    def __init__(self, index_dir="data/index", in_memory=False):
         self.index_dir = index_dir
-        self.index_path = os.path.join(index_dir, "positional_index.json.gz")
-        self.preprocess_path = os.path.join(index_dir, "preprocess.json")
+        self.in_memory = in_memory # decode all postings into RAM at load (MemoryIndex)
         
-        self.index = {}
-        self.doc_lengths = {} # Number of tokens per doc
-        self.doc_norms = {} # L2 norm of document vectors
+        self.index = None # postings reader (see postings.BaseIndex)
+        self.doc_lengths = [] # Number of tokens per doc, by doc number
+        self.doc_norms = [] # L2 norm of document vectors, by doc number
+        self.weights = None # term x doc matrix of w_td = (1 + log10 tf) * idf (CSR)
+        self.max_weights = None # largest w_td per term, by slot (score bound for top-k)
+        self.max_cosine = None # largest w_td / doc norm per term, by slot (cosine bound)
         self.N = 0
         self.idf = {}
+        self.segments = None # SegmentSet when the index was built incrementally
+        self.nonessential_terms = 0 # terms top_k only looked up for documents in the running
+        self.data_dir = index_dir # directory of the loaded build (its generation, if published as one)
         
         self.load_data()
 
     def load_data(self):
         print("Loading index for ranking...")
-        with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
-            self.index = json.load(f)
-            
-        with open(self.preprocess_path, "r", encoding="utf-8") as f:
-            preprocess_data = json.load(f)
-            self.N = len(preprocess_data)
-        
-        # Compute IDF
-        print("Computing IDF...")
-        for term, doc_dict in self.index.items():
-            df = len(doc_dict)
-            self.idf[term] = math.log10(self.N / df) if df > 0 else 0
-
-        # Compute Document Norms
-        print("Computing Document Norms...")
-        for doc_id, tokens in preprocess_data.items():
-            self.doc_lengths[doc_id] = len(tokens)
-            
-            # Compute term frequencies
-            tf_counts = Counter(tokens)
-            norm_sq = 0
-            for term, count in tf_counts.items():
-                if term in self.idf:
-                    w_td = (1 + math.log10(count)) * self.idf[term]
-                    norm_sq += w_td ** 2
-            self.doc_norms[doc_id] = math.sqrt(norm_sq)
-
-    def score(self, query_terms, candidate_docs, use_cosine=False):
-        # query_terms: list of terms in query
-        # candidate_docs: set of doc_ids to score
-        
-        scores = defaultdict(float)
-        
+        if is_segmented(self.index_dir):
+            # Live documents of all segments, so N and df are collection-wide
+            self.segments = SegmentSet(self.index_dir, self.in_memory)
+            self.index = self.segments.index
+            doc_lengths, doc_norms, idf, max_weights = self.segments.stats
+        else:
+            # Resolved once, so every artifact comes from the same build
+            self.data_dir = resolve_index_dir(self.index_dir)
+            self.index, (doc_lengths, doc_norms, idf, max_weights) = open_index(self.data_dir, self.in_memory)
+        self.N = self.index.n_docs
+
+        # IDF, document lengths and norms are precomputed at build time
+        self.idf = dict(zip(self.index.terms, idf.tolist()))
+        self.doc_lengths = doc_lengths
+        self.doc_norms = np.asarray(doc_norms)
+        self.max_weights = np.asarray(max_weights)
+        # The weight matrix is written by full builds and with each segment manifest;
+        # older builds (and manifests) have it computed from the postings
+        if self.segments is None:
+            loaded = load_weights(self.data_dir, (len(self.index.terms), len(self.index.doc_ids)))
+        else:
+            loaded = self.segments.weights
+        if loaded is None:
+            self.weights = weight_matrix(self.index, idf)
+            self.max_cosine = cosine_bounds(self.weights, self.doc_norms)
+        else:
+            self.weights, self.max_cosine = loaded
+
+    def query_weights(self, query_terms):
+        """
+        Returns (rows, w_q, query_vec_len): one weight matrix row and query weight
+        w_tq = (1 + log10 count) * idf per query term occurrence, in query order.
+        """
         # Query TF-IDF
         query_counts = defaultdict(int)
         for t in query_terms:
@@ -68,31 +143,147 @@ class TFIDFRanker:
                 
         query_vec_len = math.sqrt(query_vec_len)
 
-        for doc_id in candidate_docs:
-            dot_product = 0
-            
-            for t in query_terms:
-                if t in self.index and doc_id in self.index[t]:
-                    # TF in doc
-                    tf_d = len(self.index[t][doc_id])
-                    # Log normalization
-                    w_td = (1 + math.log10(tf_d)) * self.idf[t]
-                    
-                    # Weight in query
-                    q_tf = query_counts[t]
-                    w_tq = (1 + math.log10(q_tf)) * self.idf[t]
-                    
-                    dot_product += w_td * w_tq
-            
-            if use_cosine:
-                doc_norm = self.doc_norms.get(doc_id, 0)
-                if doc_norm > 0 and query_vec_len > 0:
-                    scores[doc_id] = dot_product / (doc_norm * query_vec_len)
+        # One weight matrix row per query term occurrence, in query order: the sparse
+        # product then adds up each doc's w_td * w_tq in the same order as a term loop
+        rows = []
+        w_q = []
+        for t in query_terms:
+            i = self.index.slot(t)
+            if i is not None:
+                rows.append(i)
+                w_q.append((1 + math.log10(query_counts[t])) * self.idf[t])
+        return rows, w_q, query_vec_len
+
+    def score(self, query_terms, candidate_docs, use_cosine=False, k=None):
+        # query_terms: list of terms in query
+        # candidate_docs: set of doc numbers to score
+        # k: only the k best are needed (see top_k)
+        if k is not None and k < len(candidate_docs):
+            return self.top_k(query_terms, candidate_docs, k, use_cosine)
+
+        rows, w_q, query_vec_len = self.query_weights(query_terms)
+        docs = np.fromiter(candidate_docs, dtype=np.int64, count=len(candidate_docs))
+        if rows:
+            scores = (self.weights[rows].T @ np.array(w_q))[docs]
+        else:
+            scores = np.zeros(len(docs))
+
+        if use_cosine:
+            denom = self.doc_norms[docs] * query_vec_len
+            scores = np.divide(scores, denom, out=np.zeros(len(docs)), where=denom > 0)
+
+        # Sort by score (stable, so ties keep candidate order)
+        order = np.argsort(-scores, kind="stable")
+        return list(zip(docs[order].tolist(), scores[order].tolist()))
+
+    def top_k(self, query_terms, candidate_docs, k, use_cosine=False):
+        """
+        The first k entries of score(), found with MaxScore pruning. Query terms are
+        taken in order of their score bound (their largest possible contribution);
+        once the bounds of the terms left cannot lift a new document above the k-th
+        best partial score, the rest are only looked up for the documents still in
+        the running, which are dropped as soon as they cannot reach it either. The
+        survivors are then scored exactly as score() would.
+        """
+        if k <= 0:
+            return []
+        rows, w_q, query_vec_len = self.query_weights(query_terms)
+        docs = np.fromiter(candidate_docs, dtype=np.int64, count=len(candidate_docs))
+        if not rows or (use_cosine and query_vec_len == 0):
+            return self.score(query_terms, candidate_docs, use_cosine)[:k]
+
+        # Candidates sorted by doc number (the order postings are stored in);
+        # cand_order maps back to candidate order, which breaks ties
+        cand_order = np.argsort(docs, kind="stable")
+        sorted_docs = docs[cand_order]
+
+        # Query weight per distinct term (occurrences add up) and its score bound
+        coef = defaultdict(float)
+        for i, w in zip(rows, w_q):
+            coef[i] += w
+        if use_cosine:
+            bounds = {i: c * self.max_cosine[i] / query_vec_len for i, c in coef.items()}
+        else:
+            bounds = {i: c * self.max_weights[i] for i, c in coef.items()}
+        terms = sorted(coef, key=bounds.get, reverse=True)
+        # rest[j]: the most the terms from j on can still add to a document
+        rest = np.cumsum([bounds[i] for i in terms][::-1])[::-1].tolist() + [0.0]
+
+        acc = np.zeros(len(sorted_docs))
+        touched = np.zeros(len(sorted_docs), dtype=bool)
+        live = None # candidate positions still in the running, once pruning starts
+        theta = 0.0
+        for j, i in enumerate(terms):
+            cols, data = self.row(i)
+            if live is None:
+                if touched.sum() >= k and rest[j] < theta * (1 - 1e-9):
+                    live = np.flatnonzero(touched)
                 else:
-                    scores[doc_id] = 0
-            else:
-                scores[doc_id] = dot_product
+                    # Still admitting documents: the whole posting list
+                    pos = np.searchsorted(sorted_docs, cols)
+                    hit = pos < len(sorted_docs)
+                    hit[hit] = sorted_docs[pos[hit]] == cols[hit]
+                    pos = pos[hit]
+                    acc[pos] += self.contributions(data[hit], cols[hit], coef[i], use_cosine, query_vec_len)
+                    touched[pos] = True
+                    if touched.sum() >= k:
+                        theta = self.kth_largest(acc[touched], k)
+                    continue
+            # Only the live documents are looked up in this term's postings
+            self.nonessential_terms += 1
+            live = live[acc[live] + rest[j] >= theta * (1 - 1e-9)]
+            found, at = self.lookup(cols, sorted_docs[live])
+            hit_docs = live[found]
+            acc[hit_docs] += self.contributions(data[at], cols[at], coef[i], use_cosine, query_vec_len)
+            theta = self.kth_largest(acc[live], k)
+
+        if touched.sum() < k:
+            # Fewer matches than k: the rest of the list is zero scores in candidate order
+            return self.score(query_terms, candidate_docs, use_cosine)[:k]
+        if live is None:
+            live = np.flatnonzero(touched)
+        live = live[acc[live] >= theta * (1 - 1e-9)]
+
+        # Exact scores for the survivors, summed in query order like score()
+        live_docs = sorted_docs[live]
+        scores = np.zeros(len(live))
+        for i, w in zip(rows, w_q):
+            cols, data = self.row(i)
+            found, at = self.lookup(cols, live_docs)
+            scores[found] += data[at] * w
+        if use_cosine:
+            denom = self.doc_norms[live_docs] * query_vec_len
+            scores = np.divide(scores, denom, out=np.zeros(len(live)), where=denom > 0)
+
+        order = np.lexsort((cand_order[live], -scores))[:k]
+        return list(zip(live_docs[order].tolist(), scores[order].tolist()))
+
+    def row(self, i):
+        """
+        (doc numbers, weights) of weight matrix row i.
+        """
+        start, end = self.weights.indptr[i], self.weights.indptr[i + 1]
+        return self.weights.indices[start:end], self.weights.data[start:end]
+
+    def contributions(self, data, cols, coef, use_cosine, query_vec_len):
+        if not use_cosine:
+            return data * coef
+        norms = self.doc_norms[cols] * query_vec_len
+        return np.divide(data * coef, norms, out=np.zeros(len(data)), where=norms > 0)
+
+    @staticmethod
+    def lookup(cols, doc_nums):
+        """
+        Finds sorted doc_nums in a sorted posting row. Returns (found mask over
+        doc_nums, index into the row of each found doc).
+        """
+        pos = np.searchsorted(cols, doc_nums)
+        found = pos < len(cols)
+        found[found] = cols[pos[found]] == doc_nums[found]
+        return found, pos[found]
 
-        # Sort by score
-        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        return ranked
+    @staticmethod
+    def kth_largest(values, k):
+        if len(values) < k:
+            return 0.0
+        return float(np.partition(values, len(values) - k)[len(values) - k])
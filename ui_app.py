@@ -1,15 +1,30 @@
 import re
-from flask import Flask, render_template_string, request, send_from_directory
+import time
+import threading
+from flask import Flask, render_template_string, request, send_from_directory, redirect, url_for, Response
 from query import QueryProcessor
+from generations import CURRENT, collect_garbage
+from segments import MANIFEST
 import os
 
 app = Flask(__name__)
 qp = None
+# Keyword arguments for the QueryProcessor, e.g. {"in_memory": True} (set by app.py)
+INDEX_OPTIONS = {}
+INDEX_DIR = r"data/index"
+
+# Hot reload: requests check (at most once per interval) whether a new index was
+# published; if so it is loaded in a background thread and swapped in. Requests
+# already running keep the QueryProcessor they started with.
+RELOAD_CHECK_INTERVAL = 1.0 # seconds
+qp_version = None
+reload_lock = threading.Lock()
+reloading = False
+last_check = 0.0
 
 # Configuration for file paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PDF_DIR = os.path.join(BASE_DIR, 'data', 'pdfs')
-TXT_DIR = os.path.join(BASE_DIR, 'data', 'extracted')
 
 def highlight_text(text, terms):
     if not terms or not text:
@@ -699,7 +714,7 @@ HTML_TEMPLATE = """
                             <a href="/view/txt/{{ res.id }}" target="_blank" class="action-link">
                                 📝 Raw Text
                             </a>
-                            <a href="/view/pdf/{{ res.id }}" target="_blank" class="action-link">
+                            <a href="/view/pdf/{{ res.id }}?q={{ (corrected_query if corrected_query else query)|urlencode }}&wildcard={{ 'on' if wildcard else '' }}" target="_blank" class="action-link">
                                 📑 Original PDF
                             </a>
                         </div>
@@ -729,14 +744,64 @@ HTML_TEMPLATE = """
 </html>
 """
 
+def index_version():
+    """
+    Changes whenever a full build publishes a generation (CURRENT) or an incremental
+    update replaces the segment manifest; both are swapped in with os.replace.
+    """
+    version = []
+    for name in (CURRENT, MANIFEST):
+        try:
+            st = os.stat(os.path.join(INDEX_DIR, name))
+        except FileNotFoundError:
+            continue
+        version.append((name, st.st_ino, st.st_mtime_ns))
+    return tuple(version)
+
+def reload_index(version):
+    global qp, qp_version, reloading
+    try:
+        new_qp = QueryProcessor(INDEX_DIR, **INDEX_OPTIONS)
+        qp, qp_version = new_qp, version
+        print(f"Reloaded index from {new_qp.ranker.data_dir}")
+        # The old QueryProcessor's files are released once its last request finishes
+        collect_garbage(INDEX_DIR)
+    except Exception as e:
+        # Keep serving the loaded index; the next check retries
+        print(f"Error reloading index: {e}")
+    finally:
+        reloading = False
+
+def get_qp():
+    """
+    The QueryProcessor for this request, loading it on first use and starting a
+    background reload when a new index has been published.
+    """
+    global qp, qp_version, reloading, last_check
+    if qp is None:
+        with reload_lock:
+            if qp is None:
+                version = index_version()
+                qp = QueryProcessor(INDEX_DIR, **INDEX_OPTIONS)
+                qp_version = version
+        return qp
+
+    now = time.monotonic()
+    if now - last_check >= RELOAD_CHECK_INTERVAL:
+        last_check = now
+        version = index_version()
+        with reload_lock:
+            if version != qp_version and not reloading:
+                reloading = True
+                threading.Thread(target=reload_index, args=(version,), daemon=True).start()
+    return qp
+
 @app.route("/")
 def index():
-    global qp
-    if qp is None:
-        try:
-            qp = QueryProcessor()
-        except Exception as e:
-            return f"Error initializing index: {e}. Please run build.py first."
+    try:
+        qp = get_qp()
+    except Exception as e:
+        return f"Error initializing index: {e}. Please run build.py first."
 
     query = request.args.get("q", "")
     
@@ -773,18 +838,20 @@ def index():
                 # Actually, analyze_query_spelling gives suggestions for the *original* terms.
                 pass
 
-        results, ranking_terms = qp.process_query(
-            search_query, 
-            enable_ranking=True, 
-            use_cosine=use_cosine, 
-            enable_wildcards=wildcard
-        )
         try:
             page = int(request.args.get("page", "1"))
         except:
             page = 1
         if page < 1:
             page = 1
+        # Only the results up to the end of the requested page are ranked
+        results, ranking_terms = qp.process_query(
+            search_query, 
+            enable_ranking=True, 
+            use_cosine=use_cosine, 
+            enable_wildcards=wildcard,
+            k=page * per_page
+        )
         total_results = len(results)
         total_pages = (total_results + per_page - 1) // per_page if total_results > 0 else 1
         if page > total_pages:
@@ -823,35 +890,20 @@ def index():
 
 @app.route("/view/doc/<doc_id>")
 def view_doc(doc_id):
-    # Get params to reconstruct query processing (to get terms)
-    # Or simply pass terms in query params (but process_query does cleaning/expansion)
-    # Re-running process_query is safer to get exact same terms.
-    
-    global qp
-    if qp is None:
-        qp = QueryProcessor()
+    qp = get_qp()
         
     query = request.args.get("q", "")
     wildcard = request.args.get("wildcard") == "on"
     
     ranking_terms = []
     if query:
-        # We don't care about ranking, just parsing to get terms
-        # We assume spelling correction was already applied if it's in the query string
-        # But wait, the link from UI passes the original query. 
-        # Ideally we should pass the corrected query if it was corrected.
-        # But for now let's just re-process.
-        _, ranking_terms = qp.process_query(query, enable_ranking=False, enable_wildcards=wildcard)
-    
-    filename = f"{doc_id}.txt"
-    filepath = os.path.join(TXT_DIR, filename)
+        # The query's terms as the search analyzed them; the query is not evaluated again
+        ranking_terms = qp.query_terms(query, enable_wildcards=wildcard)
     
-    if not os.path.exists(filepath):
+    content = qp.get_text(doc_id)
+    if content is None:
         return "File not found", 404
         
-    with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-        
     # Highlight
     highlighted_content = highlight_text(content, ranking_terms)
     # Replace newlines with <br> for display
@@ -865,14 +917,26 @@ def view_doc(doc_id):
 
 @app.route("/view/pdf/<doc_id>")
 def view_pdf(doc_id):
+    query = request.args.get("q", "")
+    if query:
+        # Open the PDF at the page of the first hit (browsers keep the #page fragment on redirect)
+        qp = get_qp()
+        wildcard = request.args.get("wildcard") == "on"
+        page = qp.first_hit_page(doc_id, qp.query_terms(query, enable_wildcards=wildcard))
+        if page:
+            return redirect(url_for("view_pdf", doc_id=doc_id) + f"#page={page}")
+
     filename = f"{doc_id}.pdf"
     return send_from_directory(PDF_DIR, filename)
 
 @app.route("/view/txt/<doc_id>")
 def view_txt(doc_id):
-    filename = f"{doc_id}.txt"
+    qp = get_qp()
+    content = qp.get_text(doc_id)
+    if content is None:
+        return "File not found", 404
     # We serve it as plain text in browser
-    return send_from_directory(TXT_DIR, filename, mimetype='text/plain')
+    return Response(content, mimetype='text/plain')
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000)